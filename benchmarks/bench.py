@@ -0,0 +1,322 @@
+"""
+Benchmarks for imageio-ffmpeg.
+
+The videos that are used are generated locally with ffmpeg's lavfi sources,
+so this runs fully offline, and the corpus is the same on every machine
+(for a given ffmpeg version). Results are written as JSON, so that runs
+can be compared across commits:
+
+    python benchmarks/bench.py --output before.json
+    ... make changes ...
+    python benchmarks/bench.py --output after.json
+    python benchmarks/bench.py --compare before.json after.json
+
+Use --quick for a small corpus that runs in under a minute.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(this_dir))
+
+import imageio_ffmpeg  # noqa: E402
+from imageio_ffmpeg._io import ffmpeg_test_encoder  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+SOURCES = ["testsrc2", "mandelbrot"]
+SIZES = [(320, 240), (1280, 720), (1920, 1080)]
+CODECS = ["libx264", "mpeg4", "libvpx-vp9"]
+GOP_SIZES = [12, 250]
+FPS = 25
+DURATION = 4
+
+QUICK_SIZES = [(320, 240), (640, 480)]
+QUICK_CODECS = ["libx264", "mpeg4"]
+QUICK_GOP_SIZES = [25]
+QUICK_DURATION = 2
+
+EXTENSIONS = {"libvpx-vp9": ".webm"}
+
+
+# %% Corpus
+
+
+def get_corpus_specs(quick=False):
+    """Get a list of dicts describing the videos in the corpus."""
+    sizes = QUICK_SIZES if quick else SIZES
+    codecs = QUICK_CODECS if quick else CODECS
+    gop_sizes = QUICK_GOP_SIZES if quick else GOP_SIZES
+    duration = QUICK_DURATION if quick else DURATION
+    codecs = [codec for codec in codecs if ffmpeg_test_encoder(codec)]
+    specs = []
+    for source in SOURCES:
+        for size in sizes:
+            for codec in codecs:
+                for gop in gop_sizes:
+                    name = "{}_{}x{}_{}_g{}_{}s".format(
+                        source, size[0], size[1], codec, gop, duration
+                    )
+                    name += EXTENSIONS.get(codec, ".mp4")
+                    spec = dict(name=name, source=source, size=size, codec=codec)
+                    spec.update(gop=gop, fps=FPS, duration=duration)
+                    specs.append(spec)
+    return specs
+
+
+def generate_video(spec, filename):
+    """Generate a deterministic video using a lavfi source."""
+    w, h = spec["size"]
+    src = "{}=size={}x{}:rate={}".format(spec["source"], w, h, spec["fps"])
+    cmd = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-v", "error"]
+    cmd += ["-f", "lavfi", "-i", src, "-t", str(spec["duration"])]
+    cmd += ["-c:v", spec["codec"], "-g", str(spec["gop"]), "-pix_fmt", "yuv420p"]
+    # Single-threaded bitexact encoding produces the same file on each run
+    cmd += ["-threads", "1", "-fflags", "+bitexact", "-flags:v", "+bitexact"]
+    cmd += [filename]
+    subprocess.run(cmd, check=True)
+
+
+def ensure_corpus(corpus_dir, specs):
+    """Generate the videos that are not yet in the corpus dir."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    for spec in specs:
+        filename = os.path.join(corpus_dir, spec["name"])
+        if not os.path.isfile(filename):
+            print("Generating", spec["name"])
+            generate_video(spec, filename)
+        spec["filename"] = filename
+
+
+# %% Measurements
+
+
+class ChildStats:
+    """Collect the stats of the ffmpeg processes, to get their peak memory."""
+
+    def __init__(self):
+        self.stats = []
+
+    def __enter__(self):
+        imageio_ffmpeg.add_stats_callback(self.stats.append)
+        return self
+
+    def __exit__(self, *args):
+        imageio_ffmpeg.remove_stats_callback(self.stats.append)
+
+    @property
+    def max_rss(self):
+        values = [s.max_rss for s in self.stats if s.max_rss is not None]
+        return max(values) if values else None
+
+
+def bench_read(filename, repeat):
+    best = None
+    for _ in range(repeat):
+        with ChildStats() as child:
+            t0 = time.perf_counter()
+            gen = imageio_ffmpeg.read_frames(filename)
+            meta = gen.__next__()
+            t1 = time.perf_counter()
+            nframes = nbytes = 0
+            for frame in gen:
+                nframes += 1
+                nbytes += len(frame)
+            t2 = time.perf_counter()
+        result = {
+            "open_latency": t1 - t0,
+            "read_time": t2 - t1,
+            "read_fps": nframes / (t2 - t1),
+            "read_mbps": nbytes / (t2 - t1) / 2**20,
+            "nframes": nframes,
+            "size": list(meta["size"]),
+            "read_ffmpeg_max_rss": child.max_rss,
+        }
+        if best is None or result["read_time"] < best["read_time"]:
+            best = result
+    return best
+
+
+def bench_close(filename, repeat):
+    best = None
+    for _ in range(repeat):
+        gen = imageio_ffmpeg.read_frames(filename)
+        gen.__next__()  # meta
+        gen.__next__()  # first frame
+        t0 = time.perf_counter()
+        gen.close()
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return {"close_latency": best}
+
+
+def bench_count(filename, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        imageio_ffmpeg.count_frames_and_secs(filename)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return {"count_time": best}
+
+
+def bench_write(spec, nframes, repeat, tempdir):
+    w, h = spec["size"]
+    # Use frames with some content, so that the encoder has work to do
+    frames = [bytes([(i * 7 + j) % 256 for j in range(256)]) for i in range(8)]
+    frames = [(f * (w * h * 3 // 256 + 1))[: w * h * 3] for f in frames]
+    filename = os.path.join(tempdir, "out" + os.path.splitext(spec["name"])[1])
+    best = None
+    for _ in range(repeat):
+        with ChildStats() as child:
+            t0 = time.perf_counter()
+            gen = imageio_ffmpeg.write_frames(
+                filename, (w, h), fps=spec["fps"], codec=spec["codec"]
+            )
+            gen.send(None)  # seed
+            for i in range(nframes):
+                gen.send(frames[i % len(frames)])
+            gen.close()
+            t = time.perf_counter() - t0
+        result = {
+            "write_time": t,
+            "write_fps": nframes / t,
+            "write_ffmpeg_max_rss": child.max_rss,
+        }
+        if best is None or result["write_time"] < best["write_time"]:
+            best = result
+    return best
+
+
+def get_python_max_rss():
+    if resource is None:  # pragma: no cover
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform.startswith("darwin") else rss * 1024
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=this_dir,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(corpus_dir, quick=False, repeat=3):
+    specs = get_corpus_specs(quick)
+    ensure_corpus(corpus_dir, specs)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tempdir:
+        for spec in specs:
+            print("Benchmarking", spec["name"], "...", end=" ", flush=True)
+            filename = spec["filename"]
+            result = {k: v for k, v in spec.items() if k != "filename"}
+            result["size"] = list(spec["size"])
+            result.update(bench_read(filename, repeat))
+            result.update(bench_close(filename, repeat))
+            result.update(bench_count(filename, repeat))
+            result.update(bench_write(spec, result["nframes"], repeat, tempdir))
+            results.append(result)
+            print(
+                "read {read_fps:0.1f} fps, write {write_fps:0.1f} fps".format(**result)
+            )
+
+    return {
+        "info": {
+            "imageio_ffmpeg_version": imageio_ffmpeg.__version__,
+            "ffmpeg_version": imageio_ffmpeg.get_ffmpeg_version(),
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "git_commit": get_git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "quick": quick,
+            "repeat": repeat,
+            "python_max_rss": get_python_max_rss(),
+        },
+        "results": results,
+    }
+
+
+# %% Comparing
+
+
+COMPARE_KEYS = [
+    ("read_fps", True),
+    ("read_mbps", True),
+    ("write_fps", True),
+    ("open_latency", False),
+    ("close_latency", False),
+    ("count_time", False),
+]
+
+
+def compare(filename1, filename2):
+    """Print the relative change of each metric between two result files."""
+    with open(filename1, "rb") as f:
+        results1 = {r["name"]: r for r in json.load(f)["results"]}
+    with open(filename2, "rb") as f:
+        results2 = {r["name"]: r for r in json.load(f)["results"]}
+
+    print(
+        "{:<44}".format("video") + "".join("{:>15}".format(k) for k, _ in COMPARE_KEYS)
+    )
+    for name, r1 in results1.items():
+        r2 = results2.get(name)
+        if r2 is None:
+            continue
+        line = "{:<44}".format(name)
+        for key, higher_is_better in COMPARE_KEYS:
+            v1, v2 = r1.get(key), r2.get(key)
+            if not v1 or v2 is None:
+                line += "{:>15}".format("-")
+                continue
+            change = (v2 - v1) / v1 * 100
+            if not higher_is_better:
+                change = -change
+            line += "{:>+14.1f}%".format(change)
+        print(line)
+    print("(positive is better)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument(
+        "--corpus-dir",
+        default=os.path.join(tempfile.gettempdir(), "imageio_ffmpeg_bench_corpus"),
+    )
+    parser.add_argument("--quick", action="store_true", help="use a small corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="take best of N")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    data = run(args.corpus_dir, args.quick, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(data, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
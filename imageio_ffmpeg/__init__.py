@@ -1,8 +1,27 @@
-""" imageio_ffmpeg, FFMPEG wrapper for Python.
-"""
+"""imageio_ffmpeg, FFMPEG wrapper for Python."""
 
 # flake8: noqa
 
+from ._autotune import autotune_encoder
+from ._cache import FrameCache, LRUFrameCache, cache_frames
 from ._definitions import __version__
-from ._io import count_frames_and_secs, read_frames, write_frames
+from ._edit import concat, remux, trim
+from ._hooks import add_hook, remove_hook
+from ._io import (
+    copy_frames,
+    count_frames_and_secs,
+    read_audio,
+    read_clips,
+    read_frames,
+    read_frames_with_audio,
+    read_windows,
+    write_frames,
+)
+from ._rawvideo import RawVideo, read_rawvideo, write_rawvideo
+from ._sampler import ClipSampler
+from ._shm import SharedFrame, SharedFrameReader
+from ._scheduler import set_process_limit
+from ._stats import add_stats_callback, remove_stats_callback
+from ._tracing import get_trace_events, save_trace, start_tracing, stop_tracing
+from ._transcode import transcode, transcode_batch
 from ._utils import get_ffmpeg_exe, get_ffmpeg_version
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from ._cache import _get_cache_dir
+from ._hooks import emit
+from ._scheduler import acquire_process_slot
+from ._stats import ProcessStats
+from ._utils import _popen_kwargs, get_ffmpeg_exe, logger
+
+_X264_PRESETS = ["veryslow", "slower", "slow", "medium", "fast", "faster"]
+_X264_PRESETS += ["veryfast", "superfast", "ultrafast"]
+_QSV_PRESETS = ["veryslow", "slower", "slow", "medium", "fast", "faster", "veryfast"]
+_NVENC_PRESETS = ["p7", "p6", "p5", "p4", "p3", "p2", "p1"]
+
+_VP9_SETTINGS = [
+    ["-row-mt", "1", "-deadline", deadline, "-cpu-used", str(cpu_used)]
+    for deadline, cpu_used in [("good", i) for i in range(1, 6)]
+    + [("realtime", i) for i in range(5, 9)]
+]
+_AOM_SETTINGS = [
+    ["-row-mt", "1", "-usage", usage, "-cpu-used", str(cpu_used)]
+    for usage, cpu_used in [("good", i) for i in range(3, 7)]
+    + [("realtime", i) for i in range(7, 9)]
+]
+
+# The encoders that are tried, per family: (encoder, settings). The
+# settings are ordered from the best quality (and slowest) to the fastest.
+_CANDIDATES = {
+    "h264": [
+        ("h264_nvenc", [["-preset", preset] for preset in _NVENC_PRESETS]),
+        ("h264_qsv", [["-preset", preset] for preset in _QSV_PRESETS]),
+        ("libx264", [["-preset", preset] for preset in _X264_PRESETS]),
+    ],
+    "hevc": [
+        ("hevc_nvenc", [["-preset", preset] for preset in _NVENC_PRESETS]),
+        ("hevc_qsv", [["-preset", preset] for preset in _QSV_PRESETS]),
+        ("libx265", [["-preset", preset] for preset in _X264_PRESETS]),
+    ],
+    "vp9": [
+        ("libvpx-vp9", _VP9_SETTINGS),
+    ],
+    "av1": [
+        ("av1_nvenc", [["-preset", preset] for preset in _NVENC_PRESETS]),
+        ("av1_qsv", [["-preset", preset] for preset in _QSV_PRESETS]),
+        ("libsvtav1", [["-preset", str(i)] for i in range(4, 13)]),
+        ("libaom-av1", _AOM_SETTINGS),
+    ],
+}
+
+_RTIME = re.compile(rb"bench: .*rtime=([\d.]+)s")
+_PSNR = re.compile(rb"PSNR .* average:([\d.]+|inf)")
+
+# Results of autotune_encoder() by cache dir and key, loaded from the cache
+# file on first use
+_results = {}
+_lock = threading.Lock()
+
+
+def _get_compiled_encoders():
+    """Get the set of names of the video encoders of the ffmpeg executable."""
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-encoders"]
+    out = subprocess.run(cmd, capture_output=True, **_popen_kwargs()).stdout
+    encoders = set()
+    for line in out.decode(errors="ignore").split("------")[-1].splitlines():
+        parts = line.split()
+        if len(parts) > 1 and parts[0].startswith("V"):
+            encoders.add(parts[1])
+    return encoders
+
+
+def _run(cmd, timeout):
+    """Run an ffmpeg command, and return (returncode, output), or (None,
+    output) if it was killed because it took longer than the timeout.
+    """
+    slot = acquire_process_slot()
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            **_popen_kwargs()
+        )
+        slot.apply_affinity(process.pid)
+        stats = ProcessStats("autotune", cmd, process)
+        emit("spawn", stats)
+
+        def kill():
+            stats.set_stop_policy("kill")
+            process.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            out = process.stdout.read()
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            stats.finish()
+    finally:
+        slot.release()
+    if stats.stop_policy == "kill":
+        return None, out
+    return stats.returncode, out
+
+
+class _Benchmark:
+    """Encodes a synthetic clip with a given encoder and settings, to
+    measure the speed, and the quality (PSNR) of the result.
+    """
+
+    def __init__(self, size, fps, nframes, pix_fmt_out, bitrate, threads, tempdir):
+        self.source = "testsrc2=size={}x{}:rate={}".format(size[0], size[1], fps)
+        self.nframes = nframes
+        self.pix_fmt_out = pix_fmt_out
+        self.bitrate = bitrate
+        self.threads = threads
+        self.filename = os.path.join(tempdir, "clip.mkv")
+
+    def speed(self, codec, settings, timeout):
+        """Get the encoding speed in frames per second. Returns None if
+        the encoder failed, and 0 if it took longer than the timeout.
+        """
+        cmd = [get_ffmpeg_exe(), "-y", "-hide_banner", "-nostats", "-benchmark"]
+        cmd += ["-f", "lavfi", "-i", self.source, "-frames:v", str(self.nframes)]
+        cmd += ["-c:v", codec, "-pix_fmt", self.pix_fmt_out] + settings
+        cmd += ["-b:v", str(self.bitrate)]
+        if self.threads:
+            cmd += ["-threads", str(self.threads)]
+        cmd += [self.filename]
+        returncode, out = _run(cmd, timeout)
+        if returncode is None:
+            return 0
+        m = _RTIME.search(out)
+        if returncode or m is None:
+            return None
+        return self.nframes / max(float(m.group(1)), 1e-6)
+
+    def psnr(self):
+        """Get the PSNR of the clip that was encoded last, in dB."""
+        fmt = "format={}".format(self.pix_fmt_out)
+        graph = "[0:v]{}[a];[1:v]{}[b];[a][b]psnr".format(fmt, fmt)
+        cmd = [get_ffmpeg_exe(), "-hide_banner", "-nostats"]
+        cmd += ["-i", self.filename, "-f", "lavfi", "-i", self.source]
+        cmd += ["-lavfi", graph, "-frames:v", str(self.nframes), "-f", "null", "-"]
+        returncode, out = _run(cmd, 60)
+        m = _PSNR.search(out)
+        if returncode or m is None:
+            raise RuntimeError(
+                "Could not measure the PSNR:\n" + out.decode(errors="ignore")
+            )
+        return float(m.group(1))
+
+
+def _get_key(size, fps, pix_fmt_out, families, bitrate, headroom, threads):
+    # The executable can also be a command on the PATH
+    exe = shutil.which(get_ffmpeg_exe()) or get_ffmpeg_exe()
+    st = os.stat(exe)
+    key = [os.path.abspath(exe), st.st_size, st.st_mtime_ns]
+    key += [list(size), fps, pix_fmt_out, list(families), bitrate, headroom, threads]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def _load_results(cache_dir):
+    if cache_dir not in _results:
+        _results[cache_dir] = {}
+        try:
+            with open(os.path.join(cache_dir, "autotune.json"), "rb") as f:
+                _results[cache_dir] = json.loads(f.read().decode())
+        except (OSError, ValueError):
+            pass
+    return _results[cache_dir]
+
+
+def _save_results(cache_dir):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(_results[cache_dir], indent=1).encode())
+        os.replace(tmp, os.path.join(cache_dir, "autotune.json"))
+    except OSError as err:  # pragma: no cover
+        logger.warning("Could not save the autotune results: " + str(err))
+
+
+def autotune_encoder(
+    size,
+    fps,
+    pix_fmt_out="yuv420p",
+    families=("h264", "hevc", "vp9", "av1"),
+    bitrate=None,
+    headroom=1.25,
+    duration=2,
+    threads=None,
+    cache=True,
+    cache_dir=None,
+):
+    """
+    Find the encoder and settings with the best quality that can still
+    encode video of the given size at the given frame rate on this machine,
+    e.g. to record video in realtime without dropping frames.
+
+    The encoders of the given families (H.264, HEVC, VP9 and AV1) that the
+    ffmpeg executable supports are benchmarked, including hardware encoders
+    (NVENC and Quick Sync) if they work. Per encoder, a bisection over its
+    presets (ordered from slow to fast) finds the slowest preset that is
+    fast enough. Each benchmark encodes a short synthetic clip of the given
+    size, at the given bitrate, and is stopped as soon as it is clearly too
+    slow. Of the configurations that are fast enough, the one with the
+    highest PSNR wins.
+
+    The result is a dict with the keys "codec", "output_params" and
+    "bitrate", which can be passed to write_frames(), and "family", "fps"
+    (the measured speed) and "psnr":
+
+        config = autotune_encoder((1920, 1080), 30)
+        gen = write_frames(
+            "recording.mkv",
+            (1920, 1080),
+            fps=30,
+            codec=config["codec"],
+            bitrate=config["bitrate"],
+            output_params=config["output_params"],
+        )
+
+    Results are cached per ffmpeg executable and per set of arguments,
+    also on disk, so this takes a while only the first time. Note that the
+    synthetic clip is easier to encode than most real video, and that
+    other work on the machine slows down encoding; the headroom accounts
+    for that. Raises a RuntimeError if no configuration is fast enough.
+
+    Parameters:
+        size (tuple): the width and height of the frames.
+        fps (float): the frame rate that the encoder must keep up with.
+        pix_fmt_out (str): the pixel format to store frames. Default "yuv420p".
+        families (tuple): the codec families to consider: "h264", "hevc",
+            "vp9" and/or "av1". Default all of them.
+        bitrate (int): the bitrate in bits per second. Default 0.1 bits
+            per pixel, e.g. 6.2 Mbit/s for 1080p at 30 fps.
+        headroom (float): how much faster than fps the encoder must be.
+            Default 1.25.
+        duration (float): the duration of the synthetic clip in seconds.
+            Default 2.
+        threads (int): the number of encoder threads. Default None (chosen by
+            the encoder).
+        cache (bool): whether to use cached results. Default True.
+        cache_dir (str): the directory for the cache file. Default a
+            subdirectory of the temp dir.
+    """
+    assert len(size) == 2, "size must be a 2-tuple"
+    size = int(size[0]), int(size[1])
+    fps = float(fps)
+    assert fps > 0, "fps must be positive"
+    families = tuple(families)
+    invalid = set(families).difference(_CANDIDATES)
+    assert not invalid, "Invalid families: {}".format(invalid)
+    assert headroom > 0, "headroom must be positive"
+    bitrate = int(bitrate or 0.1 * size[0] * size[1] * fps)
+
+    key = _get_key(size, fps, pix_fmt_out, families, bitrate, headroom, threads)
+    cache_dir = os.path.abspath(str(cache_dir or _get_cache_dir()))
+    with _lock:
+        results = _load_results(cache_dir)
+        if cache and key in results:
+            return results[key].copy()
+
+    target = fps * headroom
+    nframes = max(10, int(round(duration * fps)))
+    # An encode that takes longer than this is too slow (with some
+    # allowance for starting ffmpeg and the encoder)
+    timeout = 2 * nframes / target + 2
+    compiled = _get_compiled_encoders()
+
+    best = None
+    with tempfile.TemporaryDirectory(prefix="imageio_ffmpeg_autotune_") as tempdir:
+        bench = _Benchmark(size, fps, nframes, pix_fmt_out, bitrate, threads, tempdir)
+        for family in families:
+            for codec, settings in _CANDIDATES[family]:
+                if codec not in compiled:
+                    continue
+                # First try the fastest setting, then bisect to find the
+                # slowest setting that is fast enough
+                lo, hi = 0, len(settings) - 1
+                speed = bench.speed(codec, settings[hi], timeout)
+                if not speed or speed < target:
+                    logger.info(
+                        "Autotune: {} is not available or too slow.".format(codec)
+                    )
+                    continue
+                last = hi  # the setting that the clip was encoded with last
+                while lo < hi:
+                    mid = last = (lo + hi) // 2
+                    mid_speed = bench.speed(codec, settings[mid], timeout)
+                    if mid_speed and mid_speed >= target:
+                        hi, speed = mid, mid_speed
+                    else:
+                        lo = mid + 1
+                if last != hi:
+                    # Encode with the chosen setting again, to measure its quality
+                    if not bench.speed(codec, settings[hi], timeout):
+                        continue
+                config = {
+                    "family": family,
+                    "codec": codec,
+                    "output_params": list(settings[hi]),
+                    "bitrate": bitrate,
+                    "fps": round(speed, 1),
+                    "psnr": round(bench.psnr(), 2),
+                }
+                logger.info("Autotune: {}".format(config))
+                if best is None or config["psnr"] > best["psnr"]:
+                    best = config
+
+    if best is None:
+        raise RuntimeError(
+            "No encoder can encode {}x{} at {} fps on this machine.".format(
+                size[0], size[1], fps
+            )
+        )
+    with _lock:
+        _load_results(cache_dir)[key] = best
+        _save_results(cache_dir)
+    return best.copy()
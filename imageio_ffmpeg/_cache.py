@@ -0,0 +1,410 @@
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from ._io import _probe_files, read_frames
+from ._utils import logger
+
+# A cache file starts with this line, followed by a line of json with the
+# meta data, padded to a multiple of _PAGE_SIZE. Then the raw frames follow.
+_MAGIC = b"imageio-ffmpeg frame cache 1\n"
+_PAGE_SIZE = 4096
+_SUFFIX = ".frames"
+
+
+def _get_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "imageio_ffmpeg_cache")
+
+
+def _get_key(path, pix_fmt, bits_per_pixel, input_params, output_params):
+    st = os.stat(path)
+    key = [os.path.abspath(path), st.st_mtime_ns, st.st_size]
+    key += [pix_fmt, bits_per_pixel, input_params, output_params]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def _read_header(file):
+    """Read the header of a cache file, or return None if it is invalid."""
+    if file.readline() != _MAGIC:
+        return None
+    try:
+        header = json.loads(file.readline())
+    except ValueError:
+        return None
+    nbytes = header["offset"] + header["nframes"] * header["framesize"]
+    if os.fstat(file.fileno()).st_size != nbytes:
+        return None  # e.g. truncated
+    return header
+
+
+def _evict(cache_dir, max_bytes, keep):
+    """Remove the least recently used cache files until the total size is
+    within max_bytes. The file named keep is never removed.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(_SUFFIX):
+            try:
+                st = entry.stat()
+            except OSError:  # pragma: no cover - removed by another process
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, filename in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.basename(filename) == keep:
+            continue
+        try:
+            os.remove(filename)
+        except OSError:  # pragma: no cover - e.g. in use on Windows
+            continue
+        total -= size
+
+
+class FrameCache:
+    """
+    A decoded video, stored as raw frames in a cache file. Returned by
+    cache_frames(). Frames can be accessed randomly, with cache[i] giving
+    a memoryview of frame i (negative indices are supported). The file is
+    memory-mapped, so this costs no copying, and no ffmpeg is involved.
+
+    The cache file can also be mapped with numpy:
+
+        frames = np.memmap(cache.filename, np.uint8, "r", cache.offset, cache.shape)
+
+    Attributes:
+        filename (str): the filename of the cache file.
+        meta (dict): the meta data of the video (see read_frames()), with an
+            extra field "nframes".
+        offset (int): the offset of the first frame in the file.
+        shape (tuple): (nframes, height, width, bytes_per_pixel), or
+            (nframes, framesize) if bits_per_pixel is not a multiple of 8.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            header = _read_header(f)
+            if header is None:
+                raise IOError("Invalid frame cache file: {}".format(filename))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.meta = header["meta"]
+        self.meta["size"] = tuple(self.meta["size"])
+        self.meta["nframes"] = header["nframes"]
+        self.offset = header["offset"]
+        self._framesize = header["framesize"]
+        bits_per_pixel = header["bits_per_pixel"]
+        w, h = self.meta["size"]
+        if bits_per_pixel % 8 == 0:
+            self.shape = (header["nframes"], h, w, bits_per_pixel // 8)
+        else:
+            self.shape = (header["nframes"], self._framesize)
+        self._view = memoryview(self._mmap)
+
+    def __repr__(self):
+        return "<FrameCache {} frames in {}>".format(len(self), self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Frame index out of range.")
+        start = self.offset + index * self._framesize
+        return self._view[start : start + self._framesize]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """Unmap the file. Views obtained from the cache must be released
+        before this is called.
+        """
+        if self._mmap is not None:
+            self._view.release()
+            self._mmap.close()
+            self._mmap = None
+
+
+def cache_frames(
+    path,
+    pix_fmt="rgb24",
+    bits_per_pixel=None,
+    input_params=None,
+    output_params=None,
+    cache_dir=None,
+    max_bytes=2**32,
+):
+    """
+    Decode a video once into a cache file of raw frames, and return a
+    FrameCache object to access the frames randomly. Subsequent calls with
+    the same arguments (for an unmodified file) use the cache file, so
+    repeated passes over a video cost no decoding at all.
+
+    Cache files are keyed by the absolute path, the modification time and
+    size of the file, the pix_fmt, and the input and output params (e.g.
+    the size and filters). When the total size of the cache files exceeds
+    max_bytes, the least recently used files are removed. Note that the
+    raw frames of a video are large: a minute of 1080p at 30 fps is more
+    than 10 GB in rgb24.
+
+    Example:
+
+        cache = cache_frames(path)
+        frame = cache[42]  # memoryview of frame 42
+        frames = np.memmap(cache.filename, np.uint8, "r", cache.offset, cache.shape)
+
+    Parameters:
+        path (str): the filename of the file to read from.
+        pix_fmt (str): the pixel format of the frames to be read.
+            The default is "rgb24" (frames are uint8 RGB images).
+        bits_per_pixel (int): The number of bits per pixel in the output frames.
+            This depends on the given pix_fmt. Default is 24 (RGB)
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters.
+        cache_dir (str): the directory for the cache files. Default a
+            subdirectory of the temp dir. Use a tmpfs (e.g. /dev/shm) to keep
+            the frames in memory.
+        max_bytes (int): the total size of the cache files. Default 4 GB.
+    """
+
+    # ----- Input args
+
+    if isinstance(path, pathlib.PurePath):
+        path = str(path)
+    pix_fmt = pix_fmt or "rgb24"
+    bits_per_pixel = bits_per_pixel or 24
+    input_params = input_params or []
+    output_params = output_params or []
+    cache_dir = str(cache_dir or _get_cache_dir())
+
+    assert isinstance(path, str), "path must be a filename"
+    assert isinstance(input_params, list), "input_params must be a list"
+    assert isinstance(output_params, list), "output_params must be a list"
+
+    key = _get_key(path, pix_fmt, bits_per_pixel, input_params, output_params)
+    basename = key + _SUFFIX
+    filename = os.path.join(cache_dir, basename)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # ----- Use existing cache file
+
+    try:
+        cache = FrameCache(filename)
+    except (OSError, ValueError, KeyError):
+        pass  # no (valid) cache file
+    else:
+        os.utime(filename)  # mark as recently used
+        return cache
+
+    # ----- Decode into a new cache file
+
+    gen = read_frames(
+        path,
+        pix_fmt=pix_fmt,
+        input_params=input_params,
+        output_params=output_params,
+        bits_per_pixel=bits_per_pixel,
+    )
+    fd, tempname = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            meta = gen.__next__()
+            w, h = meta["size"]
+            header = {
+                "meta": meta,
+                "bits_per_pixel": bits_per_pixel,
+                "framesize": w * h * bits_per_pixel // 8,
+                "nframes": 0,
+            }
+            # Reserve room for the header, the frame count is known at the end
+            text = _MAGIC + json.dumps(dict(header, offset=0)).encode()
+            header["offset"] = -(-(len(text) + 64) // _PAGE_SIZE) * _PAGE_SIZE
+            f.seek(header["offset"])
+            for frame in gen:
+                f.write(frame)
+                header["nframes"] += 1
+            f.seek(0)
+            f.write(_MAGIC + json.dumps(header).encode() + b"\n")
+        os.replace(tempname, filename)
+    except BaseException:
+        os.remove(tempname)
+        raise
+    finally:
+        gen.close()
+
+    try:
+        _evict(cache_dir, max_bytes, basename)
+    except OSError as err:  # pragma: no cover
+        logger.warning("Could not clean up the frame cache: " + str(err))
+
+    return FrameCache(filename)
+
+
+class LRUFrameCache:
+    """
+    An in-memory cache of decoded frames, for (interactive) random access
+    to frames, e.g. when scrubbing back and forth through a video.
+
+    Frames are obtained with get_frame(). On a miss, a single ffmpeg process
+    seeks to the frame, and decodes it along with its neighbours (prefetch
+    frames around it), so that subsequent accesses nearby are hits. Frames
+    are keyed by the absolute path, the modification time and size of the
+    file, the pix_fmt, the output size and the frame index. When the total
+    size of the frames exceeds max_bytes, the least recently used frames are
+    removed. The frame index is based on the frame rate, so it is only
+    exact for videos with a constant frame rate.
+
+    The attributes hits, misses and evictions count the frames that were
+    found, not found, and removed; nbytes is the current total size.
+
+    Example:
+
+        cache = LRUFrameCache(max_bytes=2**30)
+        frame = cache.get_frame(path, 100)  # decodes frames 92 - 124
+        frame = cache.get_frame(path, 101)  # from memory
+
+    Parameters:
+        max_bytes (int): the total size of the cached frames. Default 256 MB.
+        prefetch (int): the number of frames to decode around a missed frame.
+            A quarter of these precede it, the rest follow it. Default 32.
+        input_params (list): Additional ffmpeg input command line parameters.
+    """
+
+    def __init__(self, max_bytes=2**28, prefetch=32, input_params=None):
+        self.max_bytes = int(max_bytes)
+        self.prefetch = int(prefetch)
+        self._input_params = input_params or []
+        assert self.max_bytes >= 0, "max_bytes must not be negative"
+        assert self.prefetch >= 0, "prefetch must not be negative"
+        assert isinstance(self._input_params, list), "input_params must be a list"
+
+        self._frames = OrderedDict()
+        self._metas = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+
+    def __repr__(self):
+        return "<LRUFrameCache {} frames, {} bytes, {} hits, {} misses>".format(
+            len(self._frames), self.nbytes, self.hits, self.misses
+        )
+
+    def __len__(self):
+        return len(self._frames)
+
+    def clear(self):
+        """Remove all frames, and reset the counters."""
+        with self._lock:
+            self._frames.clear()
+            self._metas.clear()
+            self.hits = self.misses = self.evictions = self.nbytes = 0
+
+    def get_frame(self, path, index, pix_fmt="rgb24", bits_per_pixel=None, size=None):
+        """Get frame index of the given video file as a bytes object. Raises
+        IndexError if the video has no such frame.
+
+        Parameters:
+            path (str): the filename of the file to read from.
+            index (int): the index of the frame.
+            pix_fmt (str): the pixel format of the frame.
+                The default is "rgb24" (frames are uint8 RGB images).
+            bits_per_pixel (int): The number of bits per pixel in the frame.
+                This depends on the given pix_fmt. Default is 24 (RGB)
+            size (tuple): the width and height to scale the frame to.
+                Default None (the size of the video).
+        """
+        if isinstance(path, pathlib.PurePath):
+            path = str(path)
+        index = int(index)
+        size = None if size is None else (int(size[0]), int(size[1]))
+        assert isinstance(path, str), "path must be a filename"
+        if index < 0:
+            raise IndexError("Frame index must not be negative.")
+
+        st = os.stat(path)
+        base = os.path.abspath(path), st.st_mtime_ns, st.st_size, pix_fmt, size
+        key = base + (index,)
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        # Decode the frame with its neighbours
+        start = max(0, index - self.prefetch // 4)
+        nframes = self.prefetch + 1
+        frames = self._decode(path, base, start, nframes, bits_per_pixel)
+        with self._lock:
+            # Add the requested frame last, so it is the most recently used
+            for i, frame in enumerate(frames):
+                if start + i != index:
+                    self._add(base + (start + i,), frame)
+            if index - start < len(frames):
+                self._add(key, frames[index - start])
+        if index - start >= len(frames):
+            raise IndexError("Frame {} is beyond the end of {}.".format(index, path))
+        return frames[index - start]
+
+    def _add(self, key, frame):
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        self._frames[key] = frame
+        self.nbytes += len(frame)
+        while self.nbytes > self.max_bytes and self._frames:
+            _, old = self._frames.popitem(last=False)
+            self.nbytes -= len(old)
+            self.evictions += 1
+
+    def _decode(self, path, base, start, nframes, bits_per_pixel):
+        meta = self._metas.get(base[:3])
+        if meta is None:
+            meta = _probe_files([path])[0]
+            if meta is None:
+                raise IOError("Could not read video from {}.".format(path))
+            self._metas[base[:3]] = meta
+
+        pix_fmt, size = base[3:]
+        input_params = self._input_params
+        if start > 0:
+            if not meta["fps"]:
+                raise IOError("Cannot seek in {}: unknown frame rate.".format(path))
+            # Seek to halfway the previous frame, to be robust to rounding
+            input_params = ["-ss", str((start - 0.5) / meta["fps"])] + input_params
+        output_params = ["-frames:v", str(nframes), "-fps_mode", "passthrough"]
+        if size is not None:
+            output_params += ["-vf", "scale={}:{}".format(*size)]
+
+        gen = read_frames(
+            path,
+            pix_fmt=pix_fmt,
+            input_params=input_params,
+            output_params=output_params,
+            bits_per_pixel=bits_per_pixel,
+        )
+        try:
+            gen.__next__()  # == meta
+            return list(gen)
+        finally:
+            gen.close()
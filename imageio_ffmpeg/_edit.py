@@ -0,0 +1,340 @@
+import math
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+
+from ._hooks import emit
+from ._io import _probe_files
+from ._pipes import StdinFeeder
+from ._scheduler import acquire_process_slot
+from ._stats import ProcessStats
+from ._utils import _popen_kwargs, get_ffmpeg_exe
+
+# Encoders to re-encode the edges of a smart cut, by codec
+_SMART_CUT_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+
+# Input params to read an ffconcat list from stdin
+_CONCAT_PARAMS = ["-f", "concat", "-safe", "0", "-protocol_whitelist", "file,pipe,fd"]
+
+# Tolerance for comparing times
+_EPS = 1e-4
+
+
+def _seek_params(t):
+    """Get the input params to seek to exactly the keyframe at time t. The
+    time is rounded up to microseconds, because ffmpeg seeks to the keyframe
+    at or before it.
+    """
+    return ["-ss", "{:.6f}".format(math.ceil(round(t * 1e6, 3)) / 1e6)]
+
+
+def _run(cmd, data=None):
+    """Run an ffmpeg command that writes to a file, optionally feeding it
+    the given data via stdin, and return its output (stdout and stderr).
+    """
+    slot = acquire_process_slot()
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL if data is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            **_popen_kwargs()
+        )
+        slot.apply_affinity(process.pid)
+        stats = ProcessStats("edit", cmd, process)
+        emit("spawn", stats)
+        feeder = None if data is None else StdinFeeder(process.stdin, data)
+        try:
+            out = process.stdout.read()
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            returncode = stats.wait()
+            if feeder is not None:
+                feeder.join()
+    finally:
+        slot.release()
+
+    try:
+        if returncode:
+            raise RuntimeError(
+                "FFMPEG call failed with {}:\n{}".format(
+                    returncode, out.decode(errors="ignore")
+                )
+            )
+        return out
+    except Exception as err:
+        emit("error", stats, err)
+        raise
+    finally:
+        stats.finish()
+
+
+def _get_packets(path):
+    """Get the (pts, duration, is_keyframe) of each packet of the first video
+    stream, in decoding order, and the time base of the stream. Times are in
+    seconds, from the first frame.
+    """
+    cmd = [get_ffmpeg_exe(), "-hide_banner", "-v", "error", "-i", "file:" + path]
+    cmd += ["-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+    out = _run(cmd).decode(errors="ignore")
+
+    tb = None
+    packets = []
+    for line in out.splitlines():
+        if line.startswith("#tb 0:"):
+            tb = Fraction(line.split(":")[1].strip())
+        parts = [part.strip() for part in line.split(",")]
+        if tb is None or len(parts) < 6 or parts[0] != "0":
+            continue
+        # Flags are omitted if the packet is just a keyframe
+        flags = int(parts[6].split("=")[1], 16) if len(parts) > 6 else 1
+        packets.append((int(parts[2]) * tb, int(parts[3]) * tb, bool(flags & 1)))
+    if not packets:
+        raise IOError("Could not read video packets from {}.".format(path))
+    t0 = min(pts for pts, _, _ in packets)
+    return [(float(pts - t0), float(dur), key) for pts, dur, key in packets], tb
+
+
+def _copy_span(packets, start, end):
+    """Get the packets that can be copied to get the frames from the keyframe
+    at or before start, up to end: the packets from that keyframe in decoding
+    order, up to the first packet at or after end. Returns (index, count,
+    start, end), with the actual start and end times.
+    """
+    first = 0
+    for i, (pts, _, key) in enumerate(packets):
+        if key and pts <= start + _EPS and pts >= packets[first][0]:
+            first = i
+    count = 0
+    for pts, _, _ in packets[first:]:
+        if pts >= end - _EPS:
+            break
+        count += 1
+    span = packets[first : first + count]
+    t1 = max((pts + dur for pts, dur, _ in span), default=packets[first][0])
+    return first, count, packets[first][0], t1
+
+
+def _get_output_params(output_params):
+    output_params = output_params or []
+    assert isinstance(output_params, list), "output_params must be a list"
+    if "-map" not in output_params:
+        output_params = ["-map", "0"] + output_params
+    return output_params
+
+
+def trim(path, start, end, out, smart=False, output_params=None):
+    """
+    Cut the segment between the given start and end time (in seconds) out
+    of a video file, without re-encoding it (using ffmpeg's stream copy).
+    This is as fast as the disk, and lossless.
+
+    Since a video can only be cut at a keyframe, the start is moved back
+    to the keyframe at or before it, and the end to where the frames can
+    be decoded without the frames after it. The actual start and end time
+    are returned.
+
+    With smart set to True, the partial groups of pictures at the edges
+    are re-encoded (with high quality), and the rest is copied, so that
+    the cut is at the given times. The audio is copied for the given times.
+    This is only supported for h264 and hevc video.
+
+    Example:
+
+        start, end = trim("recording.mp4", 60, 90, "clip.mp4")
+
+    Parameters:
+        path (str): the filename of the file to read from.
+        start (float): the start time in seconds.
+        end (float): the end time in seconds, or None for the end of the video.
+        out (str): the filename of the file to write to.
+        smart (bool): whether to re-encode the edges for an exact cut.
+            Default False.
+        output_params (list): Additional ffmpeg output command line parameters.
+            By default all streams are copied (-map 0).
+    """
+
+    # ----- Input args
+
+    if isinstance(path, pathlib.PurePath):
+        path = str(path)
+    if isinstance(out, pathlib.PurePath):
+        out = str(out)
+    assert isinstance(path, str), "path must be a filename"
+    assert isinstance(out, str), "out must be a filename"
+    output_params = _get_output_params(output_params)
+
+    packets, tb = _get_packets(path)
+    duration = max(pts + dur for pts, dur, _ in packets)
+    start = max(0.0, float(start))
+    end = duration if end is None else min(float(end), duration)
+    if not start < end:
+        raise ValueError("The start must be before the end (and the duration).")
+
+    ffmpeg = [get_ffmpeg_exe(), "-y", "-hide_banner", "-v", "error"]
+    if not smart:
+        _, count, start, end = _copy_span(packets, start, end)
+        cmd = ffmpeg + _seek_params(start) + ["-i", "file:" + path]
+        cmd += ["-frames:v", str(count), "-t", str(end - start)]
+        _run(cmd + ["-c", "copy"] + output_params + [out])
+        return round(start, 6), round(end, 6)
+
+    # ----- Smart cut
+
+    meta = _probe_files([path])[0]
+    if meta is None or meta["codec"] not in _SMART_CUT_ENCODERS:
+        raise ValueError("Smart cut is only supported for h264 and hevc video.")
+    # The segments are joined with the concat demuxer, which uses the codec
+    # parameters of the first one. So they all repeat their parameters in
+    # the stream, at each keyframe.
+    codec = meta["codec"]
+    encoder = _SMART_CUT_ENCODERS[codec]
+    encode_params = ["-c:v", encoder, "-crf", "16", "-fps_mode", "passthrough"]
+    encode_params += ["-pix_fmt", meta["pix_fmt"].split("(")[0]]
+    encode_params += ["-{}-params".format(encoder[3:]), "repeat-headers=1"]
+    copy_params = ["-c", "copy", "-bsf:v", codec + "_mp4toannexb"]
+    # Keep the time base, so that the result can be joined with other cuts
+    timescale_params = []
+    if tb.numerator == 1:
+        timescale_params = ["-video_track_timescale", str(tb.denominator)]
+
+    # Align the cut with the frames
+    times = sorted(pts for pts, _, _ in packets) + [duration]
+    start = next(t for t in times if t >= start - _EPS)
+    end = next(t for t in times if t >= end - _EPS)
+
+    # Divide into segments: re-encode the edges, copy the whole GOPs between
+    keyframes = [pts for pts, _, key in packets if key]
+    inner = [k for k in keyframes if start - _EPS <= k < end - _EPS]
+    segments = []
+    t = start
+    if inner:
+        if inner[0] > start + _EPS:
+            segments.append(("encode", start, inner[0]))
+        # Copy up to the last keyframe, or to the end if that's the end of the video
+        t = end if end > duration - _EPS else inner[-1]
+        if t > inner[0] + _EPS:
+            t = _copy_span(packets, inner[0], t)[3]
+            segments.append(("copy", inner[0], t))
+        else:
+            t = inner[0]
+    if t < end - _EPS:
+        segments.append(("encode", t, end))
+
+    tempdir = tempfile.mkdtemp(prefix="imageio_ffmpeg_")
+    try:
+        text = "ffconcat version 1.0\n"
+        for i, (mode, t0, t1) in enumerate(segments):
+            filename = os.path.join(tempdir, "{}.mp4".format(i))
+            if mode == "copy":
+                count = _copy_span(packets, t0, t1)[1]
+                cmd = ffmpeg + _seek_params(t0) + ["-i", "file:" + path]
+                cmd += ["-map", "0:v:0", "-frames:v", str(count)] + copy_params
+            else:
+                cmd = ffmpeg + ["-ss", str(t0), "-i", "file:" + path]
+                cmd += ["-map", "0:v:0", "-t", str(t1 - t0)] + encode_params
+            _run(cmd + timescale_params + [filename])
+            text += "file 'file:{}'\nduration {}\n".format(filename, t1 - t0)
+
+        # Concatenate the video segments, and copy the audio etc. from the source
+        cmd = ffmpeg + _CONCAT_PARAMS + ["-i", "-"]
+        cmd += ["-ss", str(start), "-t", str(end - start), "-i", "file:" + path]
+        if output_params[:2] == ["-map", "0"]:
+            output_params = ["-map", "0:v:0", "-map", "1", "-map", "-1:v"] + (
+                output_params[2:]
+            )
+        if out.lower().endswith((".mp4", ".mov", ".m4v")):
+            output_params = timescale_params + output_params
+        _run(cmd + ["-c", "copy"] + output_params + [out], text.encode())
+    finally:
+        shutil.rmtree(tempdir, ignore_errors=True)
+    return round(start, 6), round(end, 6)
+
+
+def concat(paths, out, output_params=None):
+    """
+    Join video files into one, without re-encoding them (using ffmpeg's
+    concat demuxer and stream copy). The files must have the same streams,
+    with the same codecs and parameters, e.g. segments of the same recording,
+    or clips cut from it with trim().
+
+    Example:
+
+        concat(["part1.mp4", "part2.mp4"], "joined.mp4")
+
+    Parameters:
+        paths (list): the filenames of the files to join.
+        out (str): the filename of the file to write to.
+        output_params (list): Additional ffmpeg output command line parameters.
+            By default all streams are copied (-map 0).
+    """
+    paths = [str(p) if isinstance(p, pathlib.PurePath) else p for p in paths]
+    if isinstance(out, pathlib.PurePath):
+        out = str(out)
+    assert all(isinstance(p, str) for p in paths), "paths must be strings"
+    assert isinstance(out, str), "out must be a filename"
+    output_params = _get_output_params(output_params)
+
+    metas = _probe_files(paths)
+    for path, meta in zip(paths, metas):
+        if meta is None:
+            raise IOError("Could not read video from {}.".format(path))
+        if (meta["codec"], meta["size"]) != (metas[0]["codec"], metas[0]["size"]):
+            raise ValueError(
+                "Cannot concatenate {} ({} {}x{}) to {} ({} {}x{}).".format(
+                    path,
+                    meta["codec"],
+                    *meta["size"],
+                    paths[0],
+                    metas[0]["codec"],
+                    *metas[0]["size"]
+                )
+            )
+
+    text = "ffconcat version 1.0\n"
+    for path in paths:
+        path = "file:" + os.path.abspath(path)
+        text += "file '{}'\n".format(path.replace("'", "'\\''"))
+    cmd = [get_ffmpeg_exe(), "-y", "-hide_banner", "-v", "error"]
+    cmd += _CONCAT_PARAMS + ["-i", "-", "-c", "copy"] + output_params + [out]
+    _run(cmd, text.encode())
+
+
+def remux(path, out, container=None, output_params=None):
+    """
+    Write the streams of a video file to another container format (e.g.
+    from mkv to mp4) without re-encoding them (using ffmpeg's stream copy).
+    The container must support the codecs of the streams.
+
+    Example:
+
+        remux("recording.mkv", "recording.mp4")
+
+    Parameters:
+        path (str): the filename of the file to read from.
+        out (str): the filename of the file to write to.
+        container (str): the format to write, e.g. "mp4". Default None
+            (derived from the extension of out).
+        output_params (list): Additional ffmpeg output command line parameters.
+            By default all streams are copied (-map 0).
+    """
+    if isinstance(path, pathlib.PurePath):
+        path = str(path)
+    if isinstance(out, pathlib.PurePath):
+        out = str(out)
+    assert isinstance(path, str), "path must be a filename"
+    assert isinstance(out, str), "out must be a filename"
+    output_params = _get_output_params(output_params)
+    if container is not None:
+        output_params = ["-f", container] + output_params
+
+    cmd = [get_ffmpeg_exe(), "-y", "-hide_banner", "-v", "error"]
+    cmd += ["-i", "file:" + path, "-c", "copy"] + output_params + [out]
+    _run(cmd)
@@ -0,0 +1,70 @@
+from ._utils import logger
+
+# Event name -> list of callbacks. The lists are never replaced, so that
+# code that emits events can hold on to a list and check it cheaply.
+_hooks = {
+    "spawn": [],
+    "header": [],
+    "frame": [],
+    "error": [],
+    "terminate": [],
+}
+
+
+def add_hook(event, callback):
+    """
+    Register a function to be called at a specific moment in the lifetime
+    of the ffmpeg processes started by imageio-ffmpeg. This can e.g. be
+    used for profiling and logging. The first argument of each callback
+    is a ProcessStats object (see add_stats_callback()), which
+    identifies the process. The supported events are:
+
+    * "spawn": ffmpeg has been started. Called with (stats). The command
+      is available as stats.cmd.
+    * "header": read_frames() has parsed the header. Called with (stats, meta).
+    * "frame": a frame has been read or written. Called with
+      (stats, nbytes, blocked), where blocked is the time in seconds spent
+      waiting on the pipe.
+    * "error": an exception occurred while reading or writing. Called with
+      (stats, error).
+    * "terminate": the process has been reaped. Called with (stats).
+      Here stats.stop_policy indicates how ffmpeg was stopped ("timeout",
+      "wait", "kill", or None if it quit by itself), and the returncode and
+      wall_time attributes are set.
+
+    When no hooks are registered, the overhead is negligible.
+    """
+    if event not in _hooks:
+        raise ValueError(
+            "Invalid hook event {!r}, must be one of {}.".format(
+                event, ", ".join(_hooks)
+            )
+        )
+    if not callable(callback):
+        raise TypeError("The hook callback must be callable.")
+    if callback not in _hooks[event]:
+        _hooks[event].append(callback)
+
+
+def remove_hook(event, callback):
+    """
+    Unregister a function that was registered with add_hook().
+    """
+    try:
+        _hooks[event].remove(callback)
+    except (KeyError, ValueError):
+        pass
+
+
+def get_hooks(event):
+    """Get the (live) list of callbacks for the given event."""
+    return _hooks[event]
+
+
+def emit(event, *args):
+    """Call the hooks for the given event. Errors are logged, not raised."""
+    for callback in list(_hooks[event]):
+        try:
+            callback(*args)
+        except Exception as err:
+            logger.warning("Error in {} hook: {}".format(event, err))
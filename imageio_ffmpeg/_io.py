@@ -1,11 +1,36 @@
+import errno
+import os
 import pathlib
+import selectors
 import subprocess
 import sys
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from functools import lru_cache
 
-from ._parsing import LogCatcher, cvsecs, parse_ffmpeg_header
+from ._hooks import emit, get_hooks
+from ._mkv import get_mkv_frame_header, get_mkv_header
+from ._parsing import (
+    LogCatcher,
+    cvsecs,
+    parse_ffmpeg_audio_header,
+    parse_ffmpeg_header,
+    parse_ffmpeg_inputs,
+    parse_output_fps,
+)
+from ._pipes import (
+    ChunkReader,
+    QueueFeeder,
+    StdinFeeder,
+    StdoutDrain,
+    create_input_pipe,
+    create_output_pipe,
+    is_source_data,
+    requires_seeking,
+    spool_to_tempfile,
+)
+from ._scheduler import acquire_process_slot, acquire_process_slots
+from ._stats import ProcessStats
 from ._utils import _popen_kwargs, get_ffmpeg_exe, logger
 
 ISWIN = sys.platform.startswith("win")
@@ -131,60 +156,121 @@ def get_first_available_h264_encoder():
         )
 
 
+def _get_input(path):
+    """Check the path given to a reader. Returns (path, source), where source
+    is video data to feed to ffmpeg via stdin, or None.
+    """
+    if is_source_data(path):
+        return "pipe:0", path
+    if isinstance(path, pathlib.PurePath):
+        path = str(path)
+    if not isinstance(path, str):
+        raise TypeError(
+            "Video path must be a string, pathlib.Path, bytes, "
+            "or a readable file object."
+        )
+    return path, None
+
+
+def _spool_if_required(path, source):
+    """If the video data cannot be read from a stream (e.g. an mp4 with the
+    moov atom at the end), write it to a temp file. Returns (path, source,
+    tempname), where tempname must be removed when done (if not None).
+    """
+    if source is not None and requires_seeking(source):
+        logger.info("Video data requires seeking; reading via a temporary file.")
+        tempname = spool_to_tempfile(source)
+        return tempname, None, tempname
+    return path, source, None
+
+
+def _remove_file(filename):
+    if filename is not None:
+        try:
+            os.remove(filename)
+        except OSError:  # pragma: no cover
+            logger.warning("Could not remove temporary file " + filename)
+
+
 def count_frames_and_secs(path):
     """
     Get the number of frames and number of seconds for the given video
     file. Note that this operation can be quite slow for large files.
 
+    The path can also be video data as bytes, or a readable file object,
+    which are fed to ffmpeg via a pipe (see read_frames()).
+
     Disclaimer: I've seen this produce different results from actually reading
     the frames with older versions of ffmpeg (2.x). Therefore I cannot say
     with 100% certainty that the returned values are always exact.
     """
     # https://stackoverflow.com/questions/2017843/fetch-frame-count-with-ffmpeg
 
-    if isinstance(path, pathlib.PurePath):
-        path = str(path)
-    if not isinstance(path, str):
-        raise TypeError("Video path must be a string or pathlib.Path.")
+    path, source = _get_input(path)
 
-    cmd = [
-        get_ffmpeg_exe(),
-        "-i",
-        path,
-        "-map",
-        "0:v:0",
-        "-vf",
-        "null",
-        "-f",
-        "null",
-        "-",
-    ]
+    slot = acquire_process_slot()
+    tempname = None
     try:
-        out = subprocess.check_output(cmd, stderr=subprocess.STDOUT, **_popen_kwargs())
-    except subprocess.CalledProcessError as err:
-        out = err.output.decode(errors="ignore")
-        raise RuntimeError(
-            "FFMPEG call failed with {}:\n{}".format(err.returncode, out)
+        path, source, tempname = _spool_if_required(path, source)
+        cmd = [get_ffmpeg_exe()] + slot.thread_params([])
+        cmd += ["-i", path, "-map", "0:v:0", "-vf", "null", "-f", "null", "-"]
+        process = subprocess.Popen(
+            cmd,
+            stdin=None if source is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            **_popen_kwargs()
         )
+        slot.apply_affinity(process.pid)
+        stats = ProcessStats("count", cmd, process)
+        emit("spawn", stats)
+        feeder = None if source is None else StdinFeeder(process.stdin, source)
+        try:
+            out = process.stdout.read()
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            returncode = stats.wait()
+            if feeder is not None:
+                feeder.join()
+                stats.bytes_piped = feeder.nbytes
+    finally:
+        slot.release()
+        _remove_file(tempname)
 
-    # Note that other than with the subprocess calls below, ffmpeg wont hang here.
-    # Worst case Python will stop/crash and ffmpeg will continue running until done.
-
-    nframes = nsecs = None
-    for line in reversed(out.splitlines()):
-        if line.startswith(b"frame="):
-            line = line.decode(errors="ignore")
-            i = line.find("frame=")
-            if i >= 0:
-                s = line[i:].split("=", 1)[-1].lstrip().split(" ", 1)[0].strip()
-                nframes = int(s)
-            i = line.find("time=")
-            if i >= 0:
-                s = line[i:].split("=", 1)[-1].lstrip().split(" ", 1)[0].strip()
-                nsecs = cvsecs(*s.split(":"))
-            return nframes, nsecs
+    try:
+        if returncode:
+            out = out.decode(errors="ignore")
+            raise RuntimeError(
+                "FFMPEG call failed with {}:\n{}".format(returncode, out)
+            )
 
-    raise RuntimeError("Could not get number of frames")  # pragma: no cover
+        # Note that other than with the subprocess calls below, ffmpeg wont hang here.
+        # Worst case Python will stop/crash and ffmpeg will continue running until done.
+
+        for line in reversed(out.splitlines()):
+            if line.startswith(b"frame="):
+                nframes = nsecs = None
+                line = line.decode(errors="ignore")
+                i = line.find("frame=")
+                if i >= 0:
+                    s = line[i:].split("=", 1)[-1].lstrip().split(" ", 1)[0].strip()
+                    nframes = int(s)
+                i = line.find("time=")
+                if i >= 0:
+                    s = line[i:].split("=", 1)[-1].lstrip().split(" ", 1)[0].strip()
+                    nsecs = cvsecs(*s.split(":"))
+                stats.nframes = nframes or 0
+                return nframes, nsecs
+
+        raise RuntimeError("Could not get number of frames")  # pragma: no cover
+    except Exception as err:
+        emit("error", stats, err)
+        raise
+    finally:
+        stats.finish()
 
 
 def read_frames(
@@ -194,6 +280,8 @@ def read_frames(
     input_params=None,
     output_params=None,
     bits_per_pixel=None,
+    scales=None,
+    timestamps=False,
 ):
     """
     Create a generator to iterate over the frames in a video file.
@@ -225,8 +313,39 @@ def read_frames(
         for frame in gen:
             print(len(frame))
 
+    The path can also be video data as bytes (or memoryview), or a readable
+    file object. The data is then fed to ffmpeg via stdin by a background
+    thread, so there is no need to write it to a file first. Formats that
+    require seeking (like mp4 files with the moov atom at the end) cannot
+    be read from a pipe. If this is detected, the data is written to a
+    temporary file instead. This detection is not possible for file objects
+    that are not seekable.
+
+    To get each frame at multiple resolutions (e.g. for multi-scale models),
+    use the scales argument. The video is then decoded once, and ffmpeg
+    scales the frames for each level. Each level is sent over a separate
+    pipe. The generator yields a tuple of bytes objects per frame, and
+    the meta dict has an extra "sizes" field with the size of each level.
+    Not supported on Windows.
+
+        gen = read_frames(path, scales=[1, 0.5, 0.25])
+        meta = gen.__next__()  # meta["sizes"] -> [(w, h), (w/2, h/2), ...]
+        for full, half, quarter in gen:
+            ...
+
+    For variable frame rate videos (e.g. from phones and screen recorders),
+    the frame index divided by the fps is not an accurate time. Set
+    timestamps to True to get the presentation time of each frame: the
+    generator then yields (frame, pts, duration) tuples, with pts and
+    duration in seconds. Frames are then also passed as they are in the
+    source, instead of being dropped or duplicated to get a constant
+    frame rate (unless output_params specifies e.g. "-r"). The timestamps
+    are written by ffmpeg to an extra pipe, which costs very little.
+    This needs ffmpeg 6.1 or later, and is not supported on Windows.
+
     Parameters:
-        path (str): the filename of the file to read from.
+        path (str): the filename of the file to read from. Can also be
+            bytes, memoryview, or a readable file object.
         pix_fmt (str): the pixel format of the frames to be read.
             The default is "rgb24" (frames are uint8 RGB images).
         input_params (list): Additional ffmpeg input command line parameters.
@@ -236,155 +355,1398 @@ def read_frames(
         bpp (int): DEPRECATED, USE bits_per_pixel INSTEAD. The number of bytes per pixel in the output frames.
             This depends on the given pix_fmt. Some pixel formats like yuv420p have 12 bits per pixel
             and cannot be set in bytes as integer. For this reason the bpp argument is deprecated.
+        scales (list): Optional list of scale factors (float) or sizes (w, h)
+            to read each frame at multiple resolutions.
+        timestamps (bool): Whether to also yield the pts and duration of each
+            frame. Default False.
+    """
+    return _read_frames(
+        path,
+        pix_fmt,
+        bpp,
+        input_params,
+        output_params,
+        bits_per_pixel,
+        scales,
+        timestamps,
+    )
+
+
+def _read_frames(
+    path,
+    pix_fmt="rgb24",
+    bpp=None,
+    input_params=None,
+    output_params=None,
+    bits_per_pixel=None,
+    scales=None,
+    timestamps=False,
+    get_buffer=None,
+    raw=False,
+    slot=None,
+):
+    """Generator for read_frames(). If get_buffer is given, it is called
+    to get a writable memoryview for each frame, into which the frame is
+    read directly from the pipe, and that memoryview is yielded. If raw is
+    True, the stdout of ffmpeg and the ProcessStats object are yielded
+    after the meta data, so that the caller can read the raw frames from
+    it directly (see copy_frames()). A process slot that was already
+    obtained can be given, which is then released by the generator.
+    """
+
+    # ----- Input args
+
+    path, source = _get_input(path)
+    # Note: Dont check whether it exists. The source could be e.g. a camera.
+
+    pix_fmt = pix_fmt or "rgb24"
+    bpp = bpp or 3
+    bits_per_pixel = bits_per_pixel or bpp * 8
+    input_params = input_params or []
+    output_params = output_params or []
+
+    assert isinstance(pix_fmt, str), "pix_fmt must be a string"
+    assert isinstance(bits_per_pixel, int), "bpp and bits_per_pixel must be an int"
+    assert isinstance(input_params, list), "input_params must be a list"
+    assert isinstance(output_params, list), "output_params must be a list"
+    if scales is not None:
+        scales = _check_scales(scales)
+    if timestamps and ISWIN:
+        raise NotImplementedError("Reading timestamps is not supported on Windows.")
+
+    # ----- Prepare
+
+    pre_output_params = ["-pix_fmt", pix_fmt, "-vcodec", "rawvideo", "-f", "image2pipe"]
+
+    # Wait until we're allowed to start a process (see set_process_limit)
+    slot = slot or acquire_process_slot()
+    tempname = None
+    extra_pipes = []  # (file, fd) for each level but the first
+    ts_pipe = None  # (file, fd) for the timestamps
+
+    try:
+        path, source, tempname = _spool_if_required(path, source)
+
+        first_output_params = output_params
+        if timestamps:
+            # Pass frames as they are, and let ffmpeg write the timestamps
+            # of the frames that it encodes (i.e. sends to us) to a pipe.
+            if not any(arg in output_params for arg in ("-r", "-vsync", "-fps_mode")):
+                output_params = ["-fps_mode", "passthrough"] + output_params
+            ts_pipe = create_output_pipe()
+            first_output_params = output_params + [
+                "-enc_time_base",
+                "filter",  # don't round the pts to 1/fps
+                "-stats_enc_pre",
+                "pipe:{}".format(ts_pipe[1]),
+                "-stats_enc_pre_fmt",
+                "{tb} {pts}",
+            ]
+
+        cmd = [get_ffmpeg_exe()]
+        cmd += slot.thread_params(input_params) + input_params + ["-i", path]
+        if scales is None:
+            cmd += pre_output_params + first_output_params + ["-"]
+        else:
+            # Decode once, and split and scale in a single filtergraph
+            cmd += ["-filter_complex", _get_scales_graph(scales)]
+            cmd += ["-map", "[v0]"] + pre_output_params + first_output_params + ["-"]
+            for i in range(1, len(scales)):
+                extra_pipes.append(create_output_pipe())
+                cmd += ["-map", "[v{}]".format(i)] + pre_output_params
+                cmd += output_params + ["pipe:{}".format(extra_pipes[-1][1])]
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=[fd for _, fd in extra_pipes + ([ts_pipe] if ts_pipe else [])],
+            **_popen_kwargs(prevent_sigint=True)
+        )
+    except BaseException:
+        for file, fd in extra_pipes + ([ts_pipe] if ts_pipe else []):
+            file.close()
+            os.close(fd)
+        slot.release()
+        _remove_file(tempname)
+        raise
+    for _, fd in extra_pipes + ([ts_pipe] if ts_pipe else []):
+        os.close(fd)  # the write ends are now owned by ffmpeg
+    slot.apply_affinity(process.pid)
+    stats = ProcessStats("read", cmd, process)
+    emit("spawn", stats)
+    frame_hooks = get_hooks("frame")
+
+    log_catcher = LogCatcher(process.stderr, len(scales or [None]))
+    feeder = None if source is None else StdinFeeder(process.stdin, source)
+    readers = []  # ChunkReader for each level but the first
+
+    # Init policy by which to terminate ffmpeg. May be set to "kill" later.
+    stop_policy = "timeout"  # not wait; ffmpeg should be able to quit quickly
+
+    # Enter try block directly after opening the process.
+    # We terminate ffmpeg in the finally clause.
+    # Generators are automatically closed when they get deleted,
+    # so the finally block is guaranteed to run.
+    try:
+        # ----- Load meta data
+
+        # Wait for the log catcher to get the meta information
+        etime = time.time() + 10.0
+        while log_catcher.is_alive() and not log_catcher.header and time.time() < etime:
+            time.sleep(0.01)
+
+        # Check whether we have the information
+        if not log_catcher.header:
+            err2 = log_catcher.get_text(0.2)
+            fmt = "Could not load meta information\n=== stderr ===\n{}"
+            if source is not None:
+                fmt += (
+                    "\nNote that formats that require seeking (e.g. mp4 with "
+                    "the moov atom at the end) cannot be read from a stream."
+                )
+            raise IOError(fmt.format(err2))
+        elif "No such file or directory" in log_catcher.header:
+            raise IOError("{} not found! Wrong path?".format(path))
+
+        meta = parse_ffmpeg_header(log_catcher.header)
+        _check_size(meta, output_params, scales)
+        emit("header", stats, meta)
+        yield meta
+        if raw:
+            yield process.stdout, stats
+            return
+
+        # ----- Read frames
+
+        width, height = meta["size"]
+        framesize_bits = width * height * bits_per_pixel
+        framesize_bytes = framesize_bits / 8
+        assert (
+            framesize_bytes.is_integer()
+        ), "incorrect bits_per_pixel, framesize in bytes must be an int"
+        framesize_bytes = int(framesize_bytes)
+        framenr = 0
+        if ts_pipe is not None:
+            # Until we know better, a frame lasts as long as the fps says
+            duration = 1 / meta["fps"] if meta["fps"] else None
+            next_pts = _read_timestamp(ts_pipe[0])
+
+        for (file, _), (w, h) in zip(extra_pipes, meta.get("sizes", [])[1:]):
+            readers.append(ChunkReader(file, w * h * bits_per_pixel // 8))
+
+        while True:
+            framenr += 1
+            try:
+                t0 = time.perf_counter() if frame_hooks else None
+                if get_buffer is not None:
+                    bb = get_buffer()
+                    n = _read_into(process.stdout, bb)
+                else:
+                    bb = _read_exactly(process.stdout, framesize_bytes)
+                    n = len(bb)
+                if n < framesize_bytes:
+                    if feeder is not None and feeder.error is not None:
+                        raise feeder.error
+                    elif n == 0:
+                        return
+                    else:
+                        raise RuntimeError(
+                            "End of file reached before full frame could be read."
+                        )
+                nbytes = framesize_bytes
+                if readers:
+                    levels = [bb]
+                    for reader in readers:
+                        level = reader.get_chunk()
+                        if level is None:
+                            raise RuntimeError(
+                                "End of file reached before all scales could be read."
+                            )
+                        levels.append(level)
+                        nbytes += len(level)
+                    bb = tuple(levels)
+                if ts_pipe is not None:
+                    # Look ahead one frame to get the duration of this frame
+                    pts, next_pts = next_pts, _read_timestamp(ts_pipe[0])
+                    if pts is None:
+                        raise RuntimeError("Could not read the frame timestamp.")
+                    if next_pts is not None:
+                        duration = next_pts - pts
+                    bb = (bb, pts, duration)
+                stats.nframes += 1
+                stats.bytes_piped += nbytes
+                if t0 is not None:
+                    emit("frame", stats, nbytes, time.perf_counter() - t0)
+                yield bb
+            except Exception as err:
+                err1 = str(err)
+                err2 = log_catcher.get_text(0.4)
+                fmt = "Could not read frame {}:\n{}\n=== stderr ===\n{}"
+                raise RuntimeError(fmt.format(framenr, err1, err2))
+
+    except GeneratorExit:
+        # Note that GeneratorExit does not inherit from Exception but BaseException
+        pass
+
+    except Exception as err:
+        # Normal exceptions fall through
+        emit("error", stats, err)
+        raise
+
+    except BaseException:
+        # Detect KeyboardInterrupt / SystemExit: don't wait for ffmpeg to quit
+        stop_policy = "kill"
+        raise
+
+    finally:
+        try:
+            # Stop the LogCatcher thread, which reads from stderr.
+            log_catcher.stop_me()
+            # Readers of extra pipes keep draining until ffmpeg has quit
+            for reader in readers:
+                reader.stop_me()
+            if ts_pipe is not None:
+                ts_pipe[0].close()
+
+            # Make sure that ffmpeg is terminated.
+            _stop_reader(process, stats, stop_policy, feeder)
+        finally:
+            # Collect resource usage, and allow the next process to start
+            try:
+                stats.finish()
+                if feeder is not None:
+                    feeder.join(1.0)
+                for reader in readers:
+                    reader.join(1.0)
+                for file, _ in extra_pipes[len(readers) :]:
+                    file.close()  # no reader was started for these
+            finally:
+                slot.release()
+                _remove_file(tempname)
+
+
+def _check_size(meta, output_params, scales=None):
+    """Warn if the frames are resized, while the user did not ask for it
+    (e.g. because of rotation metadata).
+    """
+    resize_args = ("-s", "-vf", "-filter:v", "-filter_complex")
+    if scales is None and not any(arg in output_params for arg in resize_args):
+        if meta["source_size"] != meta["size"]:
+            logger.warning(
+                "The frame size for reading {} is "
+                "different from the source frame size {}.".format(
+                    meta["size"], meta["source_size"]
+                )
+            )
+
+
+def _read_exactly(file, n):
+    """Read n bytes from the file, or less at the end of the stream."""
+    bb = bytes()
+    while len(bb) < n:
+        extra_bytes = file.read(n - len(bb))
+        if not extra_bytes:
+            break
+        bb += extra_bytes
+    return bb
+
+
+def _read_into(file, buffer):
+    """Read into the given writable memoryview until it is full, or the end
+    of the stream is reached. Returns the number of bytes read.
+    """
+    n = 0
+    while n < len(buffer):
+        extra = file.readinto(buffer[n:])
+        if not extra:
+            break
+        n += extra
+    return n
+
+
+def _read_timestamp(file):
+    """Read a line written by ffmpeg's -stats_enc_pre with format "{tb} {pts}",
+    and return the pts in seconds, or None at the end of the stream.
+    """
+    line = file.readline()
+    if not line.strip():
+        return None
+    tb, pts = line.split()
+    num, den = tb.split(b"/")
+    return int(pts) * int(num) / int(den)
+
+
+# ffmpeg sample format -> (raw format, bytes per sample, numpy dtype)
+_sample_formats = {
+    "u8": ("u8", 1, "u1"),
+    "s16": ("s16le", 2, "<i2"),
+    "s32": ("s32le", 4, "<i4"),
+    "f32": ("f32le", 4, "<f4"),
+    "f64": ("f64le", 8, "<f8"),
+}
+
+
+def read_audio(
+    path,
+    sample_rate=None,
+    channels=None,
+    sample_fmt="s16",
+    chunk_size=4096,
+    start=None,
+    end=None,
+    input_params=None,
+    output_params=None,
+):
+    """
+    Create a generator to iterate over the audio samples in a media file,
+    as raw PCM data.
+
+    It first yields a small metadata dictionary that contains:
+
+    * ffmpeg_version: the ffmpeg version in use (as a string).
+    * codec: a hint about the codec used to encode the audio, e.g. "aac".
+    * sample_rate: the number of samples per second that will be produced.
+    * channels: the number of channels that will be produced.
+    * sample_fmt: the sample format, e.g. "s16".
+    * dtype: the corresponding numpy dtype, e.g. "<i2".
+    * duration: duration of the file in seconds. Can be zero if it could
+      not be detected.
+
+    After that, it yields chunks until the end of the audio is reached. Each
+    chunk is a bytes object with chunk_size samples (per channel), except
+    for the last chunk, which may be shorter. The channels are interleaved,
+    so a chunk can be converted to a numpy array using:
+
+        np.frombuffer(chunk, meta["dtype"]).reshape(-1, meta["channels"])
+
+    Example:
+
+        gen = read_audio(path, sample_rate=16000, channels=1)
+        meta = gen.__next__()
+        for chunk in gen:
+            print(len(chunk))
+
+    Like read_frames(), the path can also be bytes or a readable file object.
+
+    Parameters:
+        path (str): the filename of the file to read from. Can also be
+            bytes, memoryview, or a readable file object.
+        sample_rate (int): the sample rate to resample to. Default None
+            (the sample rate of the source).
+        channels (int): the number of channels to mix to. Default None
+            (the number of channels of the source).
+        sample_fmt (str): the sample format: "u8", "s16" (default), "s32",
+            "f32" or "f64". Data is little-endian.
+        chunk_size (int): the number of samples (per channel) in each chunk.
+        start (float): the time (in seconds) to start reading from. Default None.
+        end (float): the time (in seconds) to stop reading at. Default None.
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters.
+    """
+
+    # ----- Input args
+
+    path, source = _get_input(path)
+
+    input_params = input_params or []
+    output_params = output_params or []
+
+    assert sample_fmt in _sample_formats, "sample_fmt must be one of {}".format(
+        ", ".join(_sample_formats)
+    )
+    assert isinstance(chunk_size, int) and chunk_size > 0, "invalid chunk_size"
+    assert isinstance(input_params, list), "input_params must be a list"
+    assert isinstance(output_params, list), "output_params must be a list"
+
+    # ----- Prepare
+
+    raw_fmt, itemsize, dtype = _sample_formats[sample_fmt]
+
+    pre_input_params = []
+    if start:
+        # Seeking before the input is fast, and accurate for audio
+        pre_input_params += ["-ss", str(float(start))]
+
+    pre_output_params = ["-vn"]
+    if end is not None:
+        pre_output_params += ["-t", str(float(end) - float(start or 0))]
+    if sample_rate:
+        pre_output_params += ["-ar", str(int(sample_rate))]
+    if channels:
+        pre_output_params += ["-ac", str(int(channels))]
+    pre_output_params += ["-acodec", "pcm_" + raw_fmt, "-f", raw_fmt]
+
+    # Wait until we're allowed to start a process (see set_process_limit)
+    slot = acquire_process_slot()
+    tempname = None
+
+    try:
+        path, source, tempname = _spool_if_required(path, source)
+
+        cmd = [get_ffmpeg_exe()]
+        cmd += slot.thread_params(input_params) + pre_input_params + input_params
+        cmd += ["-i", path] + pre_output_params + output_params + ["-"]
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **_popen_kwargs(prevent_sigint=True)
+        )
+    except BaseException:
+        slot.release()
+        _remove_file(tempname)
+        raise
+    slot.apply_affinity(process.pid)
+    stats = ProcessStats("audio", cmd, process)
+    emit("spawn", stats)
+    frame_hooks = get_hooks("frame")
+
+    log_catcher = LogCatcher(process.stderr)
+    feeder = None if source is None else StdinFeeder(process.stdin, source)
+
+    # Init policy by which to terminate ffmpeg. May be set to "kill" later.
+    stop_policy = "timeout"  # not wait; ffmpeg should be able to quit quickly
+
+    try:
+        # ----- Load meta data
+
+        # Wait for the log catcher to get the meta information
+        etime = time.time() + 10.0
+        while log_catcher.is_alive() and not log_catcher.header and time.time() < etime:
+            time.sleep(0.01)
+
+        # Check whether we have the information
+        if not log_catcher.header:
+            err2 = log_catcher.get_text(0.2)
+            fmt = "Could not load audio meta information\n=== stderr ===\n{}"
+            raise IOError(fmt.format(err2))
+        elif "No such file or directory" in log_catcher.header:
+            raise IOError("{} not found! Wrong path?".format(path))
+
+        meta = parse_ffmpeg_audio_header(log_catcher.header)
+        meta["channels"] = meta["channels"] or channels
+        if not meta["channels"]:
+            raise IOError(
+                "Could not determine the number of audio channels, "
+                "please specify the channels argument."
+            )
+        meta.update(sample_fmt=sample_fmt, dtype=dtype)
+        emit("header", stats, meta)
+        yield meta
+
+        # ----- Read chunks
+
+        chunksize_bytes = chunk_size * meta["channels"] * itemsize
+        chunknr = 0
+
+        while True:
+            chunknr += 1
+            try:
+                t0 = time.perf_counter() if frame_hooks else None
+                bb = bytes()
+                while len(bb) < chunksize_bytes:
+                    extra_bytes = process.stdout.read(chunksize_bytes - len(bb))
+                    if not extra_bytes:
+                        break
+                    bb += extra_bytes
+                if feeder is not None and feeder.error is not None:
+                    raise feeder.error
+                elif len(bb) == 0:
+                    return
+                stats.nframes += 1
+                stats.bytes_piped += len(bb)
+                if t0 is not None:
+                    emit("frame", stats, len(bb), time.perf_counter() - t0)
+                yield bb
+                if len(bb) < chunksize_bytes:
+                    return  # that was the last (partial) chunk
+            except Exception as err:
+                err1 = str(err)
+                err2 = log_catcher.get_text(0.4)
+                fmt = "Could not read audio chunk {}:\n{}\n=== stderr ===\n{}"
+                raise RuntimeError(fmt.format(chunknr, err1, err2))
+
+    except GeneratorExit:
+        pass
+
+    except Exception as err:
+        emit("error", stats, err)
+        raise
+
+    except BaseException:
+        # Detect KeyboardInterrupt / SystemExit: don't wait for ffmpeg to quit
+        stop_policy = "kill"
+        raise
+
+    finally:
+        try:
+            log_catcher.stop_me()
+            _stop_reader(process, stats, stop_policy, feeder)
+        finally:
+            try:
+                stats.finish()
+                if feeder is not None:
+                    feeder.join(1.0)
+            finally:
+                slot.release()
+                _remove_file(tempname)
+
+
+def read_frames_with_audio(
+    path,
+    pix_fmt="rgb24",
+    bits_per_pixel=None,
+    sample_rate=None,
+    channels=None,
+    sample_fmt="s16",
+    input_params=None,
+    output_params=None,
+):
+    """
+    Create a generator to iterate over the frames in a video file, together
+    with the audio samples that belong to each frame. A single ffmpeg process
+    demuxes and decodes the file: the frames are sent over stdout, and the
+    audio over an extra pipe. Both pipes are drained as data arrives, so
+    ffmpeg does not block if one stream runs ahead of the other.
+
+    It first yields the metadata dictionary of read_frames(), with the
+    extra fields of read_audio() (sample_rate, channels, sample_fmt, dtype).
+    Note that the "codec" field refers to the video and "audio_codec" to
+    the audio. After that, it yields (frame, samples) tuples of bytes objects,
+    where samples contains the interleaved PCM samples from the start of the
+    frame to the start of the next frame (based on the frame rate). If the
+    audio ends before the video, the remaining frames get no samples.
+
+    Example:
+
+        gen = read_frames_with_audio(path, sample_rate=16000, channels=1)
+        meta = gen.__next__()
+        for frame, samples in gen:
+            print(len(frame), len(samples))
+
+    Not supported on Windows.
+
+    Parameters:
+        path (str): the filename of the file to read from. Can also be
+            bytes, memoryview, or a readable file object.
+        pix_fmt (str): the pixel format of the frames to be read.
+            The default is "rgb24" (frames are uint8 RGB images).
+        bits_per_pixel (int): The number of bits per pixel in the output frames.
+            This depends on the given pix_fmt. Default is 24 (RGB)
+        sample_rate (int): the sample rate to resample to. Default None
+            (the sample rate of the source).
+        channels (int): the number of channels to mix to. Default None
+            (the number of channels of the source).
+        sample_fmt (str): the sample format: "u8", "s16" (default), "s32",
+            "f32" or "f64". Data is little-endian.
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters
+            for the video output.
+    """
+
+    # ----- Input args
+
+    path, source = _get_input(path)
+
+    pix_fmt = pix_fmt or "rgb24"
+    bits_per_pixel = bits_per_pixel or 24
+    input_params = input_params or []
+    output_params = output_params or []
+
+    assert isinstance(pix_fmt, str), "pix_fmt must be a string"
+    assert isinstance(bits_per_pixel, int), "bits_per_pixel must be an int"
+    assert sample_fmt in _sample_formats, "sample_fmt must be one of {}".format(
+        ", ".join(_sample_formats)
+    )
+    assert isinstance(input_params, list), "input_params must be a list"
+    assert isinstance(output_params, list), "output_params must be a list"
+    if ISWIN:
+        raise NotImplementedError(
+            "Reading audio with video is not supported on Windows."
+        )
+
+    # ----- Prepare
+
+    raw_fmt, itemsize, dtype = _sample_formats[sample_fmt]
+
+    video_output_params = ["-map", "0:v:0", "-pix_fmt", pix_fmt]
+    video_output_params += ["-vcodec", "rawvideo", "-f", "image2pipe"]
+    audio_output_params = ["-map", "0:a:0"]
+    if sample_rate:
+        audio_output_params += ["-ar", str(int(sample_rate))]
+    if channels:
+        audio_output_params += ["-ac", str(int(channels))]
+    audio_output_params += ["-acodec", "pcm_" + raw_fmt, "-f", raw_fmt]
+
+    # Wait until we're allowed to start a process (see set_process_limit)
+    slot = acquire_process_slot()
+    tempname = None
+    audio_file = audio_fd = None
+
+    try:
+        path, source, tempname = _spool_if_required(path, source)
+        audio_file, audio_fd = create_output_pipe()
+
+        cmd = [get_ffmpeg_exe()]
+        cmd += slot.thread_params(input_params) + input_params + ["-i", path]
+        cmd += video_output_params + output_params + ["-"]
+        cmd += audio_output_params + ["pipe:{}".format(audio_fd)]
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=[audio_fd],
+            **_popen_kwargs(prevent_sigint=True)
+        )
+    except BaseException:
+        if audio_file is not None:
+            audio_file.close()
+            os.close(audio_fd)
+        slot.release()
+        _remove_file(tempname)
+        raise
+    os.close(audio_fd)  # the write end is now owned by ffmpeg
+    slot.apply_affinity(process.pid)
+    stats = ProcessStats("read", cmd, process)
+    emit("spawn", stats)
+    frame_hooks = get_hooks("frame")
+
+    log_catcher = LogCatcher(process.stderr, 2)
+    feeder = None if source is None else StdinFeeder(process.stdin, source)
+    selector = None
+
+    # Init policy by which to terminate ffmpeg. May be set to "kill" later.
+    stop_policy = "timeout"  # not wait; ffmpeg should be able to quit quickly
+
+    try:
+        # ----- Load meta data
+
+        # Wait for the log catcher to get the meta information
+        etime = time.time() + 10.0
+        while log_catcher.is_alive() and not log_catcher.header and time.time() < etime:
+            time.sleep(0.01)
+
+        # Check whether we have the information
+        if not log_catcher.header:
+            err2 = log_catcher.get_text(0.2)
+            fmt = "Could not load meta information\n=== stderr ===\n{}"
+            raise IOError(fmt.format(err2))
+        elif "No such file or directory" in log_catcher.header:
+            raise IOError("{} not found! Wrong path?".format(path))
+
+        meta = parse_ffmpeg_header(log_catcher.header)
+        _check_size(meta, output_params)
+        audio_meta = parse_ffmpeg_audio_header(log_catcher.header)
+        meta["audio_codec"] = audio_meta["codec"]
+        meta["sample_rate"] = audio_meta["sample_rate"]
+        meta["channels"] = audio_meta["channels"] or channels
+        meta.update(sample_fmt=sample_fmt, dtype=dtype)
+        if not meta["channels"]:
+            raise IOError(
+                "Could not determine the number of audio channels, "
+                "please specify the channels argument."
+            )
+        fps = parse_output_fps(log_catcher.header) or meta["fps"]
+        if not fps or not meta["sample_rate"]:
+            raise IOError(
+                "Could not determine the frame rate and sample rate, "
+                "which are needed to match audio samples to frames."
+            )
+        emit("header", stats, meta)
+        yield meta
+
+        # ----- Read frames and samples
+
+        width, height = meta["size"]
+        framesize_bytes = width * height * bits_per_pixel / 8
+        assert (
+            framesize_bytes.is_integer()
+        ), "incorrect bits_per_pixel, framesize in bytes must be an int"
+        framesize_bytes = int(framesize_bytes)
+        samplesize_bytes = meta["channels"] * itemsize
+
+        # Read from whichever pipe has data, so ffmpeg never blocks on a
+        # full pipe while we wait for data from the other one.
+        video_fd, audio_fd = process.stdout.fileno(), audio_file.fileno()
+        buffers = {video_fd: bytearray(), audio_fd: bytearray()}
+        selector = selectors.DefaultSelector()
+        for fd in buffers:
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_READ)
+        frames = deque()
+        framenr = nsamples = 0
+        t0 = time.perf_counter()
+
+        while True:
+            try:
+                # Yield the frames for which all samples are available
+                while frames:
+                    n = round((framenr + 1) * meta["sample_rate"] / fps) - nsamples
+                    nbytes = n * samplesize_bytes
+                    audio_buffer = buffers[audio_fd]
+                    if len(audio_buffer) < nbytes and selector.get_map().get(audio_fd):
+                        break
+                    samples = bytes(audio_buffer[:nbytes])
+                    del audio_buffer[:nbytes]
+                    frame = frames.popleft()
+                    framenr += 1
+                    nsamples += n
+                    stats.nframes += 1
+                    stats.bytes_piped += len(frame) + len(samples)
+                    if frame_hooks:
+                        nbytes = len(frame) + len(samples)
+                        emit("frame", stats, nbytes, time.perf_counter() - t0)
+                    yield frame, samples
+                    t0 = time.perf_counter()
+
+                # Done?
+                if not selector.get_map().get(video_fd):
+                    if feeder is not None and feeder.error is not None:
+                        raise feeder.error
+                    elif buffers[video_fd]:
+                        raise RuntimeError(
+                            "End of file reached before full frame could be read."
+                        )
+                    return
+
+                # Read what is available
+                for key, _ in selector.select():
+                    data = os.read(key.fd, 2**20)
+                    if data:
+                        buffers[key.fd] += data
+                    else:
+                        selector.unregister(key.fd)
+                video_buffer = buffers[video_fd]
+                while len(video_buffer) >= framesize_bytes:
+                    frames.append(bytes(video_buffer[:framesize_bytes]))
+                    del video_buffer[:framesize_bytes]
+            except Exception as err:
+                err1 = str(err)
+                err2 = log_catcher.get_text(0.4)
+                fmt = "Could not read frame {}:\n{}\n=== stderr ===\n{}"
+                raise RuntimeError(fmt.format(framenr + 1, err1, err2))
+
+    except GeneratorExit:
+        pass
+
+    except Exception as err:
+        emit("error", stats, err)
+        raise
+
+    except BaseException:
+        # Detect KeyboardInterrupt / SystemExit: don't wait for ffmpeg to quit
+        stop_policy = "kill"
+        raise
+
+    finally:
+        try:
+            log_catcher.stop_me()
+            if selector is not None:
+                selector.close()
+            audio_file.close()  # ffmpeg gets a broken pipe if it's still writing
+            _stop_reader(process, stats, stop_policy, feeder)
+        finally:
+            try:
+                stats.finish()
+                if feeder is not None:
+                    feeder.join(1.0)
+            finally:
+                slot.release()
+                _remove_file(tempname)
+
+
+# Clips are concatenated with this many seconds between their starts, so
+# that the file that a frame belongs to follows from its timestamp.
+_CLIP_SPACING = 3600
+
+
+def _probe_files(paths, batch_size=64):
+    """Get the meta data of the video stream of each given file (see
+    parse_ffmpeg_inputs()), using one ffmpeg process for many files.
+    Files that cannot be opened (or are not local files) get None.
+    """
+    metas = [None] * len(paths)
+    todo = [i for i, path in enumerate(paths) if os.path.isfile(path)]
+    while todo:
+        batch, todo = todo[:batch_size], todo[batch_size:]
+        cmd = [get_ffmpeg_exe(), "-hide_banner"]
+        for i in batch:
+            cmd += ["-i", "file:" + paths[i]]
+
+        slot = acquire_process_slot()
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **_popen_kwargs()
+            )
+            slot.apply_affinity(process.pid)
+            stats = ProcessStats("probe", cmd, process)
+            emit("spawn", stats)
+            try:
+                out = process.stdout.read()
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                process.stdout.close()
+                stats.finish()  # ffmpeg exits with an error, because there's no output
+        finally:
+            slot.release()
+
+        results = parse_ffmpeg_inputs(out.decode(errors="ignore"))
+        for i, meta in zip(batch, results):
+            metas[i] = meta
+        # ffmpeg stops at the first file that it cannot open
+        todo = batch[len(results) + 1 :] + todo
+    return metas
+
+
+def _group_clips(metas):
+    """Get groups of consecutive files that can be concatenated, because
+    they have the same codec and size. Other files get their own group.
+    """
+    groups = []
+    prev_key = None
+    for i, meta in enumerate(metas):
+        key = None
+        if meta is not None and 0 < meta["duration"] < _CLIP_SPACING / 2:
+            key = meta["codec"], meta["size"]
+        if key is not None and key == prev_key:
+            groups[-1].append(i)
+        else:
+            groups.append([i])
+        prev_key = key
+    return groups
+
+
+def read_clips(
+    paths,
+    pix_fmt="rgb24",
+    bits_per_pixel=None,
+    input_params=None,
+    output_params=None,
+):
+    """
+    Create a generator to iterate over the frames of many (short) video files.
+
+    Starting an ffmpeg process and waiting for its header takes time, which
+    dominates when reading short clips with read_frames(). This function
+    first gets the codec and size of the files, using one ffmpeg process
+    for up to 64 files. Consecutive files with the same codec and size are
+    then read with a single ffmpeg process (using the concat demuxer). Other
+    files (and all files on Windows) are read with read_frames().
+
+    It first yields a list with a metadata dict for each file, with the
+    codec, pix_fmt, fps, size and duration of its video stream (None for
+    files that could not be probed). After that, it yields (file_index,
+    frame_index, frame) tuples, where frame_index is the index of the frame
+    within its file.
+
+    Example:
+
+        gen = read_clips(filenames)
+        metas = gen.__next__()
+        for file_index, frame_index, frame in gen:
+            w, h = metas[file_index]["size"]
+            ...
+
+    Parameters:
+        paths (list): the filenames of the files to read from.
+        pix_fmt (str): the pixel format of the frames to be read.
+            The default is "rgb24" (frames are uint8 RGB images).
+        bits_per_pixel (int): The number of bits per pixel in the output frames.
+            This depends on the given pix_fmt. Default is 24 (RGB)
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters.
+            These must not change the frame rate.
+    """
+
+    # ----- Input args
+
+    paths = [str(p) if isinstance(p, pathlib.PurePath) else p for p in paths]
+    input_params = input_params or []
+    output_params = output_params or []
+
+    assert all(isinstance(p, str) for p in paths), "paths must be strings"
+    assert isinstance(input_params, list), "input_params must be a list"
+    assert isinstance(output_params, list), "output_params must be a list"
+    assert not any(
+        arg in output_params for arg in ("-r", "-vsync", "-fps_mode")
+    ), "output_params must not change the frame rate"
+
+    # ----- Prepare
+
+    metas = _probe_files(paths)
+    yield metas
+
+    # ----- Read frames
+
+    concat_params = ["-f", "concat", "-safe", "0"]
+    concat_params += ["-protocol_whitelist", "file,pipe,fd"]
+
+    for group in _group_clips(metas):
+        if len(group) == 1 or ISWIN:
+            # Read each file with its own process
+            for i in group:
+                gen = read_frames(
+                    paths[i],
+                    pix_fmt=pix_fmt,
+                    input_params=input_params,
+                    output_params=output_params,
+                    bits_per_pixel=bits_per_pixel,
+                )
+                try:
+                    gen.__next__()  # == meta
+                    for frame_index, frame in enumerate(gen):
+                        yield i, frame_index, frame
+                finally:
+                    gen.close()
+            continue
+
+        # Read the files in one process. Each file starts _CLIP_SPACING
+        # seconds after the previous one, so the timestamps tell them apart.
+        text = "ffconcat version 1.0\n"
+        for i in group:
+            path = "file:" + os.path.abspath(paths[i])
+            text += "file '{}'\n".format(path.replace("'", "'\\''"))
+            text += "duration {}\n".format(_CLIP_SPACING)
+        gen = read_frames(
+            text.encode(),
+            pix_fmt=pix_fmt,
+            input_params=concat_params + input_params,
+            output_params=output_params,
+            bits_per_pixel=bits_per_pixel,
+            timestamps=True,
+        )
+        try:
+            gen.__next__()  # == meta
+            counts = [0] * len(group)
+            for frame, pts, _ in gen:
+                j = int((pts + _CLIP_SPACING / 2) // _CLIP_SPACING)
+                yield group[j], counts[j], frame
+                counts[j] += 1
+        finally:
+            gen.close()
+
+
+def read_windows(
+    path,
+    window_size,
+    step=1,
+    pix_fmt="rgb24",
+    bits_per_pixel=None,
+    input_params=None,
+    output_params=None,
+):
+    """
+    Create a generator to iterate over sliding windows of consecutive frames,
+    e.g. for models that take a temporal context of a number of frames.
+
+    It first yields the metadata dict (see read_frames()). After that, it
+    yields a memoryview of the window_size most recent frames each step
+    frames, with shape (window_size, height, width, bytes_per_pixel), or a
+    flat memoryview if bits_per_pixel is not a multiple of 8.
+
+    The frames are kept in a circular buffer that is allocated once. Each
+    frame is read from the pipe directly into the buffer, so a step costs
+    reading step frames, regardless of the window size. The buffer holds
+    every frame twice (at i and i + window_size), so that each window is
+    a contiguous slice of it.
+
+    The yielded memoryview is only valid until the generator is advanced,
+    because the buffer is then overwritten. Copy it (e.g. with bytes() or
+    np.array()) if it must be kept. Frames at the end of the video that
+    do not fill a complete step are not yielded.
+
+    Example:
+
+        gen = read_windows(path, 8, step=4)
+        meta = gen.__next__()
+        for window in gen:
+            frames = np.asarray(window)  # (8, h, w, 3), no copy
+
+    Parameters:
+        path (str): the filename of the file to read from. Can also be
+            bytes, memoryview, or a readable file object.
+        window_size (int): the number of frames per window.
+        step (int): the number of frames between the starts of consecutive
+            windows. Default 1.
+        pix_fmt (str): the pixel format of the frames to be read.
+            The default is "rgb24" (frames are uint8 RGB images).
+        bits_per_pixel (int): The number of bits per pixel in the output frames.
+            This depends on the given pix_fmt. Default is 24 (RGB)
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters.
     """
 
     # ----- Input args
 
-    if isinstance(path, pathlib.PurePath):
-        path = str(path)
-    if not isinstance(path, str):
-        raise TypeError("Video path must be a string or pathlib.Path.")
-    # Note: Dont check whether it exists. The source could be e.g. a camera.
-
-    pix_fmt = pix_fmt or "rgb24"
-    bpp = bpp or 3
-    bits_per_pixel = bits_per_pixel or bpp * 8
-    input_params = input_params or []
-    output_params = output_params or []
+    window_size = int(window_size)
+    step = int(step)
+    bits_per_pixel = bits_per_pixel or 24
 
-    assert isinstance(pix_fmt, str), "pix_fmt must be a string"
-    assert isinstance(bits_per_pixel, int), "bpp and bits_per_pixel must be an int"
-    assert isinstance(input_params, list), "input_params must be a list"
-    assert isinstance(output_params, list), "output_params must be a list"
+    assert window_size > 0, "window_size must be positive"
+    assert step > 0, "step must be positive"
 
     # ----- Prepare
 
-    pre_output_params = ["-pix_fmt", pix_fmt, "-vcodec", "rawvideo", "-f", "image2pipe"]
+    slots = []  # the views of the frames in the buffer, set when we know the size
+    framenr = -1
 
-    cmd = [get_ffmpeg_exe()]
-    cmd += input_params + ["-i", path]
-    cmd += pre_output_params + output_params + ["-"]
+    def get_buffer():
+        return slots[framenr % window_size]
 
-    process = subprocess.Popen(
-        cmd,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        **_popen_kwargs(prevent_sigint=True)
+    gen = _read_frames(
+        path,
+        pix_fmt=pix_fmt,
+        input_params=input_params,
+        output_params=output_params,
+        bits_per_pixel=bits_per_pixel,
+        get_buffer=get_buffer,
     )
+    try:
+        meta = gen.__next__()
+        w, h = meta["size"]
+        framesize = w * h * bits_per_pixel // 8
+        ring = memoryview(bytearray(2 * window_size * framesize))
+        for i in range(2 * window_size):
+            slots.append(ring[i * framesize : (i + 1) * framesize])
+        if bits_per_pixel % 8 == 0:
+            shape = [window_size, h, w, bits_per_pixel // 8]
+        else:
+            shape = [window_size * framesize]
+        windows = [
+            ring[i * framesize : (i + window_size) * framesize].cast("B", shape)
+            for i in range(window_size)
+        ]
+        yield meta
 
-    log_catcher = LogCatcher(process.stderr)
-
-    # Init policy by which to terminate ffmpeg. May be set to "kill" later.
-    stop_policy = "timeout"  # not wait; ffmpeg should be able to quit quickly
+        # ----- Read frames
 
-    # Enter try block directly after opening the process.
-    # We terminate ffmpeg in the finally clause.
-    # Generators are automatically closed when they get deleted,
-    # so the finally block is guaranteed to run.
-    try:
-        # ----- Load meta data
+        framenr += 1
+        for frame in gen:
+            # Mirror the frame, so the window that ends here is contiguous
+            i = framenr % window_size
+            slots[i + window_size][:] = frame
+            start = framenr - window_size + 1
+            if start >= 0 and start % step == 0:
+                yield windows[(i + 1) % window_size]
+            framenr += 1
+    finally:
+        gen.close()
 
-        # Wait for the log catcher to get the meta information
-        etime = time.time() + 10.0
-        while log_catcher.is_alive() and not log_catcher.header and time.time() < etime:
-            time.sleep(0.01)
 
-        # Check whether we have the information
-        if not log_catcher.header:
-            err2 = log_catcher.get_text(0.2)
-            fmt = "Could not load meta information\n=== stderr ===\n{}"
-            raise IOError(fmt.format(err2))
-        elif "No such file or directory" in log_catcher.header:
-            raise IOError("{} not found! Wrong path?".format(path))
+def copy_frames(src, dst, reader=None, writer=None, progress=None):
+    """
+    Decode the frames of a video, and encode them into another video, like
+    read_frames() followed by write_frames() for each frame, but without
+    passing the frames through Python. The raw frames are moved from the
+    stdout of the decoding ffmpeg to the stdin of the encoding ffmpeg by
+    the kernel (using os.splice() on Linux). On other platforms they are
+    copied via a fixed buffer.
+
+    Returns the meta data dict of the source (see read_frames()), with an
+    extra field "nframes": the number of frames that were copied. This
+    runs two ffmpeg processes, which take two slots when a process limit
+    is set (see set_process_limit()). Both slots are obtained at once, and
+    a ValueError is raised if the limit is lower than two.
 
-        meta = parse_ffmpeg_header(log_catcher.header)
-        yield meta
+    Example:
 
-        # ----- Read frames
+        copy_frames(
+            "in.mov",
+            "out.mp4",
+            reader={"pix_fmt": "yuv420p", "bits_per_pixel": 12},
+            writer={"pix_fmt_out": "yuv420p", "quality": 8},
+            progress=print,
+        )
 
-        width, height = meta["size"]
-        framesize_bits = width * height * bits_per_pixel
-        framesize_bytes = framesize_bits / 8
-        assert (
-            framesize_bytes.is_integer()
-        ), "incorrect bits_per_pixel, framesize in bytes must be an int"
-        framesize_bytes = int(framesize_bytes)
-        framenr = 0
+    Parameters:
+        src (str): the filename of the file to read from. Can also be
+            bytes, memoryview, or a readable file object.
+        dst (str): the filename of the file to write to (see write_frames()).
+        reader (dict): keyword arguments for read_frames(), e.g. pix_fmt,
+            bits_per_pixel, input_params and output_params.
+        writer (dict): keyword arguments for write_frames(). The size,
+            pix_fmt_in and fps are taken from the reader by default.
+        progress (callable): called with the number of frames copied so far,
+            each time more frames have been copied.
+    """
 
-        while True:
-            framenr += 1
-            try:
-                bb = bytes()
-                while len(bb) < framesize_bytes:
-                    extra_bytes = process.stdout.read(framesize_bytes - len(bb))
-                    if not extra_bytes:
-                        if len(bb) == 0:
-                            return
-                        else:
-                            raise RuntimeError(
-                                "End of file reached before full frame could be read."
-                            )
-                    bb += extra_bytes
-                yield bb
-            except Exception as err:
-                err1 = str(err)
-                err2 = log_catcher.get_text(0.4)
-                fmt = "Could not read frame {}:\n{}\n=== stderr ===\n{}"
-                raise RuntimeError(fmt.format(framenr, err1, err2))
+    # ----- Input args
 
-    except GeneratorExit:
-        # Note that GeneratorExit does not inherit from Exception but BaseException
-        pass
+    reader = dict(reader or {})
+    writer = dict(writer or {})
+    pix_fmt = reader.get("pix_fmt") or "rgb24"
+    bits_per_pixel = reader.get("bits_per_pixel") or 24
 
-    except Exception:
-        # Normal exceptions fall through
-        raise
+    assert not reader.get("scales"), "scales are not supported"
+    assert not reader.get("timestamps"), "timestamps are not supported"
+    for key in ("timestamps", "skip_duplicates", "audio_sample_rate"):
+        assert not writer.get(key), "{} is not supported".format(key)
+    assert progress is None or callable(progress), "progress must be callable"
 
-    except BaseException:
-        # Detect KeyboardInterrupt / SystemExit: don't wait for ffmpeg to quit
-        stop_policy = "kill"
-        raise
+    # ----- Copy
 
+    # Get the slots for both processes at once. If we'd get them one by one,
+    # the decoder could hold a slot while we wait for one for the encoder,
+    # which never comes if other processes do the same (or the limit is 1).
+    rslot, wslot = acquire_process_slots(2)
+    try:
+        rgen = _read_frames(src, **reader, raw=True, slot=rslot)
+        try:
+            meta = rgen.__next__()
+            stdout, rstats = rgen.__next__()
+            w, h = meta["size"]
+            framesize = w * h * bits_per_pixel // 8
+
+            writer.setdefault("size", meta["size"])
+            writer.setdefault("pix_fmt_in", pix_fmt)
+            writer.setdefault("fps", meta["fps"] or None)
+            wgen = _write_frames(dst, raw=True, slot=wslot, **writer)
+            try:
+                stdin, wstats = wgen.send(None)
+                nbytes = 0
+                nframes = 0
+                for n in _pump(stdout, stdin):
+                    nbytes += n
+                    rstats.bytes_piped = wstats.bytes_piped = nbytes
+                    if nbytes // framesize > nframes:
+                        nframes = nbytes // framesize
+                        rstats.nframes = wstats.nframes = nframes
+                        if progress is not None:
+                            progress(nframes)
+            finally:
+                wgen.close()
+        finally:
+            rgen.close()
     finally:
-        # Stop the LogCatcher thread, which reads from stderr.
-        log_catcher.stop_me()
+        # In case a generator did not get to start its process
+        rslot.release()
+        wslot.release()
 
-        # Make sure that ffmpeg is terminated.
-        if process.poll() is None:
-            # Ask ffmpeg to quit
-            try:
-                # I read somewhere that modern ffmpeg on Linux prefers a
-                # "ctrl-c", but tests so far suggests sending q is more robust.
-                # > p.send_signal(signal.SIGINT)
-                # Sending q via communicate works, but can hang (see #17)
-                # > p.communicate(b"q")
-                # So let's do similar to what communicate does, but without
-                # reading stdout (which may block). It looks like only closing
-                # stdout is enough (tried Windows+Linux), but let's play safe.
-                # Found that writing to stdin can cause "Invalid argument" on
-                # Windows # and "Broken Pipe" on Unix.
-                # p.stdin.write(b"q")  # commented out in v0.4.1
-                process.stdout.close()
+    if nbytes % framesize:
+        raise RuntimeError("End of file reached before full frame could be read.")
+    meta["nframes"] = nframes
+    return meta
+
+
+def _pump(src, dst, chunk_size=2**20):
+    """Move data from one file (a pipe) to another, until the end of the
+    stream. Yields the number of bytes moved each time.
+    """
+    if hasattr(os, "splice"):
+        try:
+            while True:
+                n = os.splice(src.fileno(), dst.fileno(), chunk_size)
+                if n == 0:
+                    return
+                yield n
+        except OSError as err:
+            if err.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+            # Not supported here, e.g. on old kernels; do it ourselves
+    buffer = memoryview(bytearray(chunk_size))
+    while True:
+        n = src.readinto(buffer)
+        if not n:
+            return
+        dst.write(buffer[:n])
+        yield n
+
+
+def _stop_reader(process, stats, stop_policy, feeder=None):
+    """Make sure that an ffmpeg process that we read from is terminated."""
+    if stats.poll() is None:
+        stats.set_stop_policy(stop_policy)
+        # Ask ffmpeg to quit
+        try:
+            # I read somewhere that modern ffmpeg on Linux prefers a
+            # "ctrl-c", but tests so far suggests sending q is more robust.
+            # > p.send_signal(signal.SIGINT)
+            # Sending q via communicate works, but can hang (see #17)
+            # > p.communicate(b"q")
+            # So let's do similar to what communicate does, but without
+            # reading stdout (which may block). It looks like only closing
+            # stdout is enough (tried Windows+Linux), but let's play safe.
+            # Found that writing to stdin can cause "Invalid argument" on
+            # Windows # and "Broken Pipe" on Unix.
+            # p.stdin.write(b"q")  # commented out in v0.4.1
+            process.stdout.close()
+            if feeder is None:
                 process.stdin.close()
-                # p.stderr.close() -> not here, the log_catcher closes it
-            except Exception as err:  # pragma: no cover
-                logger.warning("Error while attempting stop ffmpeg (r): " + str(err))
+            else:
+                feeder.stop_me()  # the feeder closes stdin
+            # p.stderr.close() -> not here, the log_catcher closes it
+        except Exception as err:  # pragma: no cover
+            logger.warning("Error while attempting stop ffmpeg (r): " + str(err))
+
+        if stop_policy == "timeout":
+            # Wait until timeout, produce a warning and kill if it still exists
+            try:
+                etime = time.time() + 1.5
+                while time.time() < etime and stats.poll() is None:
+                    time.sleep(0.01)
+            finally:
+                if stats.poll() is None:  # pragma: no cover
+                    logger.warning("We had to kill ffmpeg to stop it.")
+                    stats.set_stop_policy("kill")
+                    process.kill()
+
+        else:  # stop_policy == "kill"
+            # Just kill it
+            process.kill()
+
+
+def _check_scales(scales):
+    """Check the scales given to read_frames()."""
+    if ISWIN:
+        raise NotImplementedError(
+            "Reading multiple scales is not supported on Windows."
+        )
+    result = []
+    for scale in scales:
+        if isinstance(scale, (int, float)):
+            assert scale > 0, "scale factors must be positive"
+            result.append(float(scale))
+        else:
+            assert len(scale) == 2, "scales must be numbers or (w, h) tuples"
+            result.append((int(scale[0]), int(scale[1])))
+    assert result, "scales must not be empty"
+    return result
+
+
+def _get_scales_graph(scales):
+    """Get the filtergraph to split and scale the video for read_frames()."""
+    graph = "[0:v:0]split={}".format(len(scales))
+    graph += "".join("[s{}]".format(i) for i in range(len(scales)))
+    for i, scale in enumerate(scales):
+        if scale == 1:
+            graph += ";[s{}]null[v{}]".format(i, i)
+        elif isinstance(scale, tuple):
+            graph += ";[s{}]scale={}:{}[v{}]".format(i, *scale, i)
+        else:
+            size = "trunc(iw*{0}):trunc(ih*{0})".format(scale)
+            graph += ";[s{}]scale={}[v{}]".format(i, size, i)
+    return graph
+
+
+# pix_fmt -> (depth, maxval, tupltype) of the PAM image format
+_pam_formats = {
+    "gray": (1, 255, "GRAYSCALE"),
+    "gray8a": (2, 255, "GRAYSCALE_ALPHA"),
+    "ya8": (2, 255, "GRAYSCALE_ALPHA"),
+    "rgb24": (3, 255, "RGB"),
+    "rgba": (4, 255, "RGB_ALPHA"),
+    "gray16be": (1, 65535, "GRAYSCALE"),
+    "rgb48be": (3, 65535, "RGB"),
+    "rgba64be": (4, 65535, "RGB_ALPHA"),
+}
+
+
+def _get_pam_header(size, pix_fmt):
+    """Get the header to send a raw frame as a PAM image."""
+    if pix_fmt not in _pam_formats:
+        raise ValueError(
+            "When writing audio samples, pix_fmt_in must be one of {}.".format(
+                ", ".join(_pam_formats)
+            )
+        )
+    depth, maxval, tupltype = _pam_formats[pix_fmt]
+    header = "P7\nWIDTH {}\nHEIGHT {}\nDEPTH {}\nMAXVAL {}\nTUPLTYPE {}\nENDHDR\n"
+    return header.format(size[0], size[1], depth, maxval, tupltype).encode()
 
-            if stop_policy == "timeout":
-                # Wait until timeout, produce a warning and kill if it still exists
-                try:
-                    etime = time.time() + 1.5
-                    while time.time() < etime and process.poll() is None:
-                        time.sleep(0.01)
-                finally:
-                    if process.poll() is None:  # pragma: no cover
-                        logger.warning("We had to kill ffmpeg to stop it.")
-                        process.kill()
 
-            else:  # stop_policy == "kill"
-                # Just kill it
-                process.kill()
+def _get_codec_params(path, codec, pix_fmt_out, quality, bitrate):
+    """Get the ffmpeg output args to select the codec and compression."""
+    if not codec:
+        if path.lower().endswith(".wmv"):
+            # This is a safer default codec on windows to get videos that
+            # will play in powerpoint and other apps. H264 is not always
+            # available on windows.
+            codec = "msmpeg4"
+        else:
+            codec = get_first_available_h264_encoder()
+
+    params = ["-vcodec", codec, "-pix_fmt", pix_fmt_out]
+
+    # Add fixed bitrate or variable bitrate compression flags
+    if bitrate is not None:
+        params += ["-b:v", str(bitrate)]
+    elif quality is not None:  # If None, then we don't add anything
+        quality = 1 - quality / 10.0
+        if codec == "libx264":
+            # crf ranges 0 to 51, 51 being worst.
+            quality = int(quality * 51)
+            params += ["-crf", str(quality)]  # for h264
+        else:  # Many codecs accept q:v
+            # q:v range can vary, 1-31, 31 being worst
+            # But q:v does not always have the same range.
+            # May need a way to find range for any codec.
+            quality = int(quality * 30) + 1
+            params += ["-qscale:v", str(quality)]  # for others
+    return params
+
+
+def _get_aligned_size(size, macro_block_size):
+    """Get the output size, aligned to the macro_block_size."""
+    # Note, for most codecs, the image dimensions must be divisible by
+    # 16 the default for the macro_block_size is 16. Check if image is
+    # divisible, if not have ffmpeg upsize to nearest size and warn
+    # user they should correct input image if this is not desired.
+    out_w, out_h = size
+    if macro_block_size > 1:
+        if size[0] % macro_block_size > 0 or size[1] % macro_block_size > 0:
+            if size[0] % macro_block_size > 0:
+                out_w += macro_block_size - (size[0] % macro_block_size)
+            if size[1] % macro_block_size > 0:
+                out_h += macro_block_size - (size[1] % macro_block_size)
+            logger.warning(
+                "IMAGEIO FFMPEG_WRITER WARNING: input image is not"
+                " divisible by macro_block_size={}, resizing from {} "
+                "to {} to ensure video compatibility with most codecs "
+                "and players. To prevent resizing, make your input "
+                "image divisible by the macro_block_size or set the "
+                "macro_block_size to 1 (risking incompatibility).".format(
+                    macro_block_size, size[:2], (out_w, out_h)
+                )
+            )
+    return out_w, out_h
+
+
+def _check_renditions(renditions):
+    """Check the list of output specs given to write_frames()."""
+    keys = {"path", "size", "codec", "pix_fmt_out", "quality", "bitrate"}
+    keys.add("output_params")
+    result = []
+    for spec in renditions:
+        assert isinstance(spec, dict), "Each rendition must be a dict"
+        spec = spec.copy()
+        invalid = set(spec).difference(keys)
+        assert not invalid, "Invalid rendition keys: {}".format(invalid)
+        if isinstance(spec.get("path"), pathlib.PurePath):
+            spec["path"] = str(spec["path"])
+        if not isinstance(spec.get("path"), str):
+            raise TypeError("Rendition path must be a string or pathlib.Path.")
+        if spec.get("size") is not None:
+            assert len(spec["size"]) == 2, "Rendition size must be a 2-tuple"
+            spec["size"] = int(spec["size"][0]), int(spec["size"][1])
+        if spec.get("output_params") is not None:
+            assert isinstance(
+                spec["output_params"], list
+            ), "output_params must be a list"
+        result.append(spec)
+    assert result, "At least one rendition must be given"
+    return result
 
 
 def write_frames(
@@ -403,6 +1765,11 @@ def write_frames(
     output_params=None,
     audio_path=None,
     audio_codec=None,
+    audio_sample_rate=None,
+    audio_channels=1,
+    audio_sample_fmt="s16",
+    timestamps=False,
+    skip_duplicates=False,
 ):
     """
     Create a generator to write frames (bytes objects) into a video file.
@@ -419,8 +1786,49 @@ def write_frames(
             gen.send(frame)
         gen.close()  # don't forget this
 
+    Instead of a filename, the path can also be a file object (anything with a
+    write method) or a callable. The encoded data is then read from ffmpeg's
+    stdout by a background thread and passed to the sink while frames are
+    being sent, e.g. to upload the result while encoding. Because the
+    output cannot be seeked, a streamable format must be used. By default
+    this is fragmented mp4, but another format can be selected by passing
+    e.g. ["-f", "mpegts"] or ["-f", "webm"] in output_params. Errors raised
+    by the sink are re-raised (as IOError) when the generator is closed.
+
+    To encode multiple renditions (e.g. for adaptive streaming) in one go,
+    path can be a list of dicts, each specifying an output with the keys
+    "path" (required), "size", "codec", "pix_fmt_out", "quality", "bitrate"
+    and "output_params". Missing keys default to the arguments given to this
+    function. A single ffmpeg process splits and scales the incoming frames
+    for each output, so each frame is sent over the pipe only once:
+
+        gen = write_frames([
+            {"path": "1080p.mp4"},
+            {"path": "720p.mp4", "size": (1280, 720), "bitrate": "3M"},
+            {"path": "480p.mp4", "size": (848, 480), "bitrate": "1M"},
+        ], (1920, 1080))
+
+    To add audio that is generated in memory, specify audio_sample_rate,
+    and send (frame, samples) tuples, where samples is raw PCM data (bytes
+    or a numpy array with the interleaved channels). The samples are sent
+    to ffmpeg over an extra pipe by a background thread, so audio and video
+    are muxed in one pass. Send the samples along with the frames that they
+    belong to, so that ffmpeg receives both streams at a similar pace. The
+    frame can be None to send only samples. Not supported on Windows.
+
+    To write a variable frame rate video, set timestamps to True, and send
+    (frame, pts) tuples, with pts the presentation time in seconds. The fps
+    is then only used as a hint for the encoder. With skip_duplicates, frames
+    that are identical to the previous frame are not sent to ffmpeg at all;
+    the previous frame simply lasts longer. This makes e.g. encoding mostly
+    static screen content much cheaper. For both options, the frames are
+    sent in a minimal Matroska stream (with millisecond precision), which
+    supports pix_fmt_in "gray", "gray16le", "rgb24", "bgr24", "rgba", "bgra"
+    and "yuv420p".
+
     Parameters:
-        path (str): the filename to write to.
+        path (str): the filename to write to. Can also be a file object
+            or a callable that accepts bytes, or a list of output specs.
         size (tuple): the width and height of the frames.
         pix_fmt_in (str): the pixel format of incoming frames.
             E.g. "gray", "gray8a", "rgb24", or "rgba". Default "rgb24".
@@ -445,14 +1853,85 @@ def write_frames(
         audio_codec (str): The audio codec to use if audio_path is provided.
             "copy" will try to use audio_path's audio codec without re-encoding.
             Default None, but some formats must have certain codecs specified.
+        audio_sample_rate (int): The sample rate of the audio samples that are
+            sent along with the frames. Default None, no audio samples.
+        audio_channels (int): The number of channels of the audio samples.
+            Default 1.
+        audio_sample_fmt (str): The format of the audio samples: "u8",
+            "s16" (default), "s32", "f32" or "f64", little-endian.
+        timestamps (bool): Whether (frame, pts) tuples are sent. Default False.
+        skip_duplicates (bool): Whether to skip frames that are identical to
+            the previous frame. Default False.
+    """
+    return _write_frames(
+        path,
+        size,
+        pix_fmt_in=pix_fmt_in,
+        pix_fmt_out=pix_fmt_out,
+        fps=fps,
+        quality=quality,
+        bitrate=bitrate,
+        codec=codec,
+        macro_block_size=macro_block_size,
+        ffmpeg_log_level=ffmpeg_log_level,
+        ffmpeg_timeout=ffmpeg_timeout,
+        input_params=input_params,
+        output_params=output_params,
+        audio_path=audio_path,
+        audio_codec=audio_codec,
+        audio_sample_rate=audio_sample_rate,
+        audio_channels=audio_channels,
+        audio_sample_fmt=audio_sample_fmt,
+        timestamps=timestamps,
+        skip_duplicates=skip_duplicates,
+    )
+
+
+def _write_frames(
+    path,
+    size,
+    pix_fmt_in="rgb24",
+    pix_fmt_out="yuv420p",
+    fps=16,
+    quality=5,
+    bitrate=None,
+    codec=None,
+    macro_block_size=16,
+    ffmpeg_log_level="warning",
+    ffmpeg_timeout=None,
+    input_params=None,
+    output_params=None,
+    audio_path=None,
+    audio_codec=None,
+    audio_sample_rate=None,
+    audio_channels=1,
+    audio_sample_fmt="s16",
+    timestamps=False,
+    skip_duplicates=False,
+    raw=False,
+    slot=None,
+):
+    """Generator for write_frames(). If raw is True, the generator yields
+    the stdin of ffmpeg and the ProcessStats object when it is seeded, so
+    that the caller can write raw frames to it directly (see copy_frames()).
+    A process slot that was already obtained can be given, which is then
+    released by the generator.
     """
 
     # ----- Input args
 
-    if isinstance(path, pathlib.PurePath):
+    sink = renditions = None
+    if isinstance(path, (list, tuple)):
+        renditions = _check_renditions(path)
+        path = renditions[0]["path"]
+    elif callable(path) or hasattr(path, "write"):
+        sink, path = path, "pipe:1"
+    elif isinstance(path, pathlib.PurePath):
         path = str(path)
     if not isinstance(path, str):
-        raise TypeError("Video path must be a string or pathlib.Path.")
+        raise TypeError(
+            "Video path must be a string, pathlib.Path, file object, or callable."
+        )
 
     # The pix_fmt_out yuv420p is the best for the outpur to work in
     # QuickTime and most other players. These players only support
@@ -494,87 +1973,129 @@ def write_frames(
     assert isinstance(ffmpeg_timeout, floatish), "ffmpeg_timeout must be float"
     assert isinstance(input_params, list), "input_params must be a list"
     assert isinstance(output_params, list), "output_params must be a list"
+    pam_header = None
+    if audio_sample_rate is not None:
+        assert audio_path is None, "cannot use both audio_path and audio_sample_rate"
+        assert isinstance(audio_sample_rate, int), "audio_sample_rate must be int"
+        assert isinstance(audio_channels, int), "audio_channels must be int"
+        assert audio_sample_fmt in _sample_formats, "invalid audio_sample_fmt"
+        if ISWIN:
+            raise NotImplementedError(
+                "Writing audio samples is not supported on Windows."
+            )
+        # With multiple piped inputs, ffmpeg can read partial frames from a
+        # rawvideo pipe. So frames are sent as PAM images, which are parsed.
+        pam_header = _get_pam_header(size, pix_fmt_in)
+    mkv_header = None
+    if timestamps or skip_duplicates:
+        assert (
+            audio_sample_rate is None
+        ), "cannot use timestamps or skip_duplicates with audio_sample_rate"
+        mkv_header = get_mkv_header(size, pix_fmt_in, fps)
+        if not any(arg in output_params for arg in ("-r", "-vsync", "-fps_mode")):
+            # Keep the timestamps (also in the encoder, which would otherwise
+            # round them to the frame rate that it guessed from the input)
+            output_params = ["-fps_mode", "vfr", "-enc_time_base", "demux"] + (
+                output_params
+            )
 
     # ----- Prepare
 
-    # Get parameters
-    if not codec:
-        if path.lower().endswith(".wmv"):
-            # This is a safer default codec on windows to get videos that
-            # will play in powerpoint and other apps. H264 is not always
-            # available on windows.
-            codec = "msmpeg4"
-        else:
-            codec = get_first_available_h264_encoder()
+    # Get parameters for each output. Usually there is one output, but
+    # multiple renditions can be encoded from the same stream of frames.
+    outputs = []
+    for spec in renditions or [{"path": path}]:
+        out_path = spec["path"]
+        out_size = _get_aligned_size(spec.get("size") or size, macro_block_size)
+        codec_params = _get_codec_params(
+            out_path,
+            spec.get("codec", codec),
+            spec.get("pix_fmt_out", pix_fmt_out),
+            spec.get("quality", quality),
+            spec.get("bitrate", bitrate),
+        )
+        outputs.append((out_path, out_size, codec_params, spec.get("output_params")))
+
+    # Wait until we're allowed to start a process (see set_process_limit)
+    slot = slot or acquire_process_slot()
+    audio_file = audio_fd = None
 
     audio_params = ["-an"]
+    audio_map_params = []
     if audio_path is not None and not path.lower().endswith(".gif"):
         audio_params = ["-i", audio_path]
+    elif audio_sample_rate is not None:
+        # Raw samples are sent over an extra pipe
+        audio_file, audio_fd = create_input_pipe()
+        audio_params = ["-f", _sample_formats[audio_sample_fmt][0]]
+        audio_params += ["-ar", str(audio_sample_rate), "-ac", str(audio_channels)]
+        audio_params += ["-i", "pipe:{}".format(audio_fd)]
+    if audio_params != ["-an"]:
         if audio_codec is not None:
-            output_params += ["-acodec", audio_codec]
-        output_params += ["-map", "0:v:0", "-map", "1:a:0"]
+            audio_map_params += ["-acodec", audio_codec]
+        audio_map_params += ["-map", "0:v:0", "-map", "1:a:0"]
 
     # Get command
-    cmd = [
-        get_ffmpeg_exe(),
-        "-y",
-        "-f",
-        "rawvideo",
-        "-vcodec",
-        "rawvideo",
-        "-s",
-        sizestr,
-    ]
-    cmd += ["-pix_fmt", pix_fmt_in, "-r", "{:.02f}".format(fps)] + input_params
+    if mkv_header is not None:
+        cmd = [get_ffmpeg_exe(), "-y", "-f", "matroska"] + input_params
+    elif pam_header is None:
+        cmd = [
+            get_ffmpeg_exe(),
+            "-y",
+            "-f",
+            "rawvideo",
+            "-vcodec",
+            "rawvideo",
+            "-s",
+            sizestr,
+        ]
+        cmd += ["-pix_fmt", pix_fmt_in, "-r", "{:.02f}".format(fps)] + input_params
+    else:
+        cmd = [get_ffmpeg_exe(), "-y", "-f", "image2pipe", "-vcodec", "pam"]
+        cmd += ["-framerate", "{:.02f}".format(fps)] + input_params
     cmd += ["-i", "-"] + audio_params
-    cmd += ["-vcodec", codec, "-pix_fmt", pix_fmt_out]
-
-    # Add fixed bitrate or variable bitrate compression flags
-    if bitrate is not None:
-        cmd += ["-b:v", str(bitrate)]
-    elif quality is not None:  # If None, then we don't add anything
-        quality = 1 - quality / 10.0
-        if codec == "libx264":
-            # crf ranges 0 to 51, 51 being worst.
-            quality = int(quality * 51)
-            cmd += ["-crf", str(quality)]  # for h264
-        else:  # Many codecs accept q:v
-            # q:v range can vary, 1-31, 31 being worst
-            # But q:v does not always have the same range.
-            # May need a way to find range for any codec.
-            quality = int(quality * 30) + 1
-            cmd += ["-qscale:v", str(quality)]  # for others
 
-    # Note, for most codecs, the image dimensions must be divisible by
-    # 16 the default for the macro_block_size is 16. Check if image is
-    # divisible, if not have ffmpeg upsize to nearest size and warn
-    # user they should correct input image if this is not desired.
-    if macro_block_size > 1:
-        if size[0] % macro_block_size > 0 or size[1] % macro_block_size > 0:
-            out_w = size[0]
-            out_h = size[1]
-            if size[0] % macro_block_size > 0:
-                out_w += macro_block_size - (size[0] % macro_block_size)
-            if size[1] % macro_block_size > 0:
-                out_h += macro_block_size - (size[1] % macro_block_size)
-            cmd += ["-vf", "scale={}:{}".format(out_w, out_h)]
-            logger.warning(
-                "IMAGEIO FFMPEG_WRITER WARNING: input image is not"
-                " divisible by macro_block_size={}, resizing from {} "
-                "to {} to ensure video compatibility with most codecs "
-                "and players. To prevent resizing, make your input "
-                "image divisible by the macro_block_size or set the "
-                "macro_block_size to 1 (risking incompatibility).".format(
-                    macro_block_size, size[:2], (out_w, out_h)
-                )
-            )
+    if renditions is None:
+        out_path, out_size, codec_params, _ = outputs[0]
+        cmd += codec_params
+        cmd += slot.thread_params(output_params)
+        if out_size != tuple(size):
+            cmd += ["-vf", "scale={}:{}".format(*out_size)]
+        # Rather than redirect stderr to a pipe, just set minimal
+        # output from ffmpeg by default. That way if there are warnings
+        # the user will see them.
+        cmd += ["-v", ffmpeg_log_level]
+        if sink is not None and "-f" not in output_params:
+            # Fragmented mp4 can be written without seeking
+            cmd += [
+                "-f",
+                "mp4",
+                "-movflags",
+                "frag_keyframe+empty_moov+default_base_moof",
+            ]
+        cmd += output_params + audio_map_params
+        cmd.append(path)
+    else:
+        # Split the input and scale it for each output, in a single filtergraph
+        cmd += ["-v", ffmpeg_log_level]
+        graph = "[0:v]split={}".format(len(outputs))
+        graph += "".join("[s{}]".format(i) for i in range(len(outputs)))
+        for i, (out_path, out_size, _, _) in enumerate(outputs):
+            if out_size == tuple(size):
+                graph += ";[s{}]null[v{}]".format(i, i)
+            else:
+                graph += ";[s{}]scale={}:{}[v{}]".format(i, *out_size, i)
+        cmd += ["-filter_complex", graph]
+        for i, (out_path, out_size, codec_params, out_params) in enumerate(outputs):
+            out_params = (out_params or []) + output_params
+            cmd += ["-map", "[v{}]".format(i)]
+            if audio_map_params and not out_path.lower().endswith(".gif"):
+                if audio_codec is not None:
+                    cmd += ["-acodec", audio_codec]
+                cmd += ["-map", "1:a:0"]
+            cmd += codec_params + slot.thread_params(out_params) + out_params
+            cmd.append(out_path)
 
-    # Rather than redirect stderr to a pipe, just set minimal
-    # output from ffmpeg by default. That way if there are warnings
-    # the user will see them.
-    cmd += ["-v", ffmpeg_log_level]
-    cmd += output_params
-    cmd.append(path)
     cmd_str = " ".join(cmd)
     if any(
         [level in ffmpeg_log_level for level in ("info", "verbose", "debug", "trace")]
@@ -582,13 +2103,48 @@ def write_frames(
         logger.info("RUNNING FFMPEG COMMAND: " + cmd_str)
 
     # Launch process
-    p = subprocess.Popen(
-        cmd,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=None,
-        **_popen_kwargs(prevent_sigint=True)
-    )
+    try:
+        p = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,
+            pass_fds=[] if audio_fd is None else [audio_fd],
+            **_popen_kwargs(prevent_sigint=True)
+        )
+    except BaseException:
+        if audio_file is not None:
+            audio_file.close()
+            os.close(audio_fd)
+        slot.release()
+        raise
+    if audio_fd is not None:
+        os.close(audio_fd)  # the read end is now owned by ffmpeg
+    slot.apply_affinity(p.pid)
+    stats = ProcessStats("write", cmd, p)
+    emit("spawn", stats)
+    drain = None if sink is None else StdoutDrain(p.stdout, sink)
+    audio_feeder = None if audio_file is None else QueueFeeder(audio_file)
+    frame_hooks = get_hooks("frame")
+
+    def write_frame(bb, header):
+        t0 = time.perf_counter() if frame_hooks else None
+        try:
+            if header is not None:
+                p.stdin.write(header)
+            p.stdin.write(bb)
+        except Exception as err:
+            # Show the command and stderr from pipe
+            msg = "{0:}\n\nFFMPEG COMMAND:\n{1:}\n\nFFMPEG STDERR OUTPUT:\n".format(
+                err, cmd_str
+            )
+            raise IOError(msg)
+
+        nbytes = memoryview(bb).nbytes
+        stats.nframes += 1
+        stats.bytes_piped += nbytes
+        if t0 is not None:
+            emit("frame", stats, nbytes, time.perf_counter() - t0)
 
     # Note that directing stderr to a pipe on windows will cause ffmpeg
     # to hang if the buffer is not periodically cleared using
@@ -611,10 +2167,21 @@ def write_frames(
     try:
         # Just keep going until the generator.close() is called (raises GeneratorExit).
         # This could also happen when the generator is deleted somehow.
-        nframes = 0
+        nframes = nsent = 0
+        header = pam_header
+        last_frame = skipped_pts = None  # for skip_duplicates
+        if raw:
+            yield p.stdin, stats
         while True:
             # Get frame
             bb = yield
+            if audio_feeder is not None and isinstance(bb, tuple):
+                bb, samples = bb
+                if samples is not None:
+                    # Copy, because the caller may reuse the buffer
+                    audio_feeder.put(memoryview(samples).tobytes())
+                if bb is None:
+                    continue
 
             # framesize = size[0] * size[1] * depth * bpp
             # assert isinstance(bb, bytes), "Frame must be send as bytes"
@@ -622,27 +2189,42 @@ def write_frames(
             # Actually, we accept anything that can be written to file.
             # This e.g. allows writing numpy arrays without having to make a copy ...
 
-            # Write
-            try:
-                p.stdin.write(bb)
-            except Exception as err:
-                # Show the command and stderr from pipe
-                msg = (
-                    "{0:}\n\nFFMPEG COMMAND:\n{1:}\n\nFFMPEG STDERR "
-                    "OUTPUT:\n".format(err, cmd_str)
-                )
-                raise IOError(msg)
+            if mkv_header is not None:
+                if timestamps:
+                    bb, pts = bb
+                    if pts < 0:
+                        raise ValueError("Frame timestamps must not be negative.")
+                else:
+                    pts = nsent / fps
+                nsent += 1
+                if skip_duplicates:
+                    # Comparing a copy is a fast memcmp, and the copy is kept
+                    # (and written) for comparison with the next frame.
+                    data = memoryview(bb).tobytes()
+                    if data == last_frame:
+                        skipped_pts = pts
+                        continue
+                    bb, last_frame, skipped_pts = data, data, None
+                header = get_mkv_frame_header(memoryview(bb).nbytes, pts)
+                if nframes == 0:
+                    header = mkv_header + header
 
+            # Write
+            write_frame(bb, header)
             nframes += 1
 
     except GeneratorExit:
         # Note that GeneratorExit does not inherit from Exception but BaseException
         # Detect premature closing
-        if nframes == 0:
+        if stats.nframes == 0:
             logger.warning("No frames have been written; the written video is invalid.")
+        elif skipped_pts is not None:
+            # Repeat the last frame, so that the skipped frames keep their time
+            write_frame(last_frame, get_mkv_frame_header(len(last_frame), skipped_pts))
 
-    except Exception:
+    except Exception as err:
         # Normal exceptions fall through
+        emit("error", stats, err)
         raise
 
     except BaseException:
@@ -651,43 +2233,68 @@ def write_frames(
         raise
 
     finally:
-        # Make sure that ffmpeg is terminated.
-        if p.poll() is None:
-            # Tell ffmpeg that we're done
-            try:
-                p.stdin.close()
-            except Exception as err:  # pragma: no cover
-                logger.warning("Error while attempting stop ffmpeg (w): " + str(err))
-
-            if stop_policy == "timeout":
-                # Wait until timeout, produce a warning and kill if it still exists
+        try:
+            # Make sure that ffmpeg is terminated.
+            if stats.poll() is None:
+                stats.set_stop_policy(stop_policy)
+                # Tell ffmpeg that we're done
                 try:
-                    etime = time.time() + ffmpeg_timeout
-                    while (time.time() < etime) and p.poll() is None:
-                        time.sleep(0.01)
-                finally:
-                    if p.poll() is None:  # pragma: no cover
-                        logger.warning(
-                            "We had to kill ffmpeg to stop it. "
-                            + "Consider increasing ffmpeg_timeout, "
-                            + "or setting it to zero (no timeout)."
-                        )
-                        p.kill()
-
-            elif stop_policy == "wait":
-                # Wait forever, kill if it if we're interrupted
+                    p.stdin.close()
+                    if audio_feeder is not None:
+                        audio_feeder.close()
+                except Exception as err:  # pragma: no cover
+                    logger.warning(
+                        "Error while attempting stop ffmpeg (w): " + str(err)
+                    )
+
+                if stop_policy == "timeout":
+                    # Wait until timeout, produce a warning and kill if it still exists
+                    try:
+                        etime = time.time() + ffmpeg_timeout
+                        while (time.time() < etime) and stats.poll() is None:
+                            time.sleep(0.01)
+                    finally:
+                        if stats.poll() is None:  # pragma: no cover
+                            logger.warning(
+                                "We had to kill ffmpeg to stop it. "
+                                + "Consider increasing ffmpeg_timeout, "
+                                + "or setting it to zero (no timeout)."
+                            )
+                            stats.set_stop_policy("kill")
+                            p.kill()
+
+                elif stop_policy == "wait":
+                    # Wait forever, kill if it if we're interrupted
+                    try:
+                        while stats.poll() is None:
+                            time.sleep(0.01)
+                    finally:  # the above can raise e.g. by ctrl-c or systemexit
+                        if stats.poll() is None:  # pragma: no cover
+                            stats.set_stop_policy("kill")
+                            p.kill()
+
+                else:  #  stop_policy == "kill":
+                    # Just kill it
+                    p.kill()
+            if drain is not None:
+                # Wait for the remaining data to be passed to the sink
+                drain.join()
+            else:
+                # Just to be safe, wrap in try/except
                 try:
-                    while p.poll() is None:
-                        time.sleep(0.01)
-                finally:  # the above can raise e.g. by ctrl-c or systemexit
-                    if p.poll() is None:  # pragma: no cover
-                        p.kill()
-
-            else:  #  stop_policy == "kill":
-                # Just kill it
-                p.kill()
-        # Just to be safe, wrap in try/except
-        try:
-            p.stdout.close()
-        except Exception:
-            pass
+                    p.stdout.close()
+                except Exception:
+                    pass
+        finally:
+            # Collect resource usage, and allow the next process to start
+            try:
+                stats.finish()
+                if audio_feeder is not None:
+                    audio_feeder.close()  # in case ffmpeg had already quit
+                    audio_feeder.join(1.0)
+            finally:
+                slot.release()
+
+        if drain is not None and drain.error is not None and stop_policy != "kill":
+            err = drain.error
+            raise IOError("Could not write to the output sink: {}".format(err)) from err
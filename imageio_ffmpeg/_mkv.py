@@ -0,0 +1,72 @@
+# Minimal Matroska muxer for raw video, so that frames can be sent to ffmpeg
+# with a timestamp each (raw video, y4m and image pipes have a fixed rate).
+# Each frame is written as a cluster with a single block, so that the frame
+# data itself can be written directly, without copying it.
+
+# Raw pixel formats that ffmpeg's matroska demuxer recognizes by fourcc
+MKV_PIX_FMTS = {
+    "gray": b"Y800",
+    "gray16le": b"Y1\x00\x10",
+    "rgb24": b"RGB\x18",
+    "bgr24": b"BGR\x18",
+    "rgba": b"RGBA",
+    "bgra": b"BGRA",
+    "yuv420p": b"I420",
+}
+
+# Timestamps are in milliseconds, the default for Matroska
+TIMESTAMP_SCALE = 1000000  # ns
+
+
+def _element(id, data):
+    # Sizes are always written in 8 bytes, which keeps things simple
+    return id + b"\x01" + len(data).to_bytes(7, "big") + data
+
+
+def _uint(id, value):
+    return _element(id, value.to_bytes(8, "big"))
+
+
+def get_mkv_header(size, pix_fmt, fps):
+    """Get the header of a Matroska stream with a single raw video track.
+    The fps is used as the default frame duration.
+    """
+    if pix_fmt not in MKV_PIX_FMTS:
+        raise ValueError(
+            "When writing timestamps, pix_fmt_in must be one of {}.".format(
+                ", ".join(MKV_PIX_FMTS)
+            )
+        )
+    ebml = _element(b"\x42\x82", b"matroska")  # DocType
+    ebml += _uint(b"\x42\x87", 2) + _uint(b"\x42\x85", 2)  # DocType(Read)Version
+    info = _uint(b"\x2a\xd7\xb1", TIMESTAMP_SCALE)
+    video = _uint(b"\xb0", size[0]) + _uint(b"\xba", size[1])  # PixelWidth/Height
+    video += _element(b"\x2e\xb5\x24", MKV_PIX_FMTS[pix_fmt])  # ColourSpace
+    track = _uint(b"\xd7", 1) + _uint(b"\x73\xc5", 1)  # TrackNumber, TrackUID
+    track += _uint(b"\x83", 1)  # TrackType: video
+    track += _uint(b"\x23\xe3\x83", round(1e9 / fps))  # DefaultDuration in ns
+    track += _element(b"\x86", b"V_UNCOMPRESSED") + _element(b"\xe0", video)
+    return (
+        _element(b"\x1a\x45\xdf\xa3", ebml)
+        + b"\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff"  # Segment, live
+        + _element(b"\x15\x49\xa9\x66", info)  # Info
+        + _element(b"\x16\x54\xae\x6b", _element(b"\xae", track))  # Tracks
+    )
+
+
+def get_mkv_frame_header(nbytes, pts):
+    """Get the bytes to write before a frame of nbytes, with the given
+    timestamp in seconds.
+    """
+    # Cluster with a Timestamp, and a SimpleBlock on track 1, marked keyframe
+    timestamp = _uint(b"\xe7", round(pts * 1e9 / TIMESTAMP_SCALE))
+    block_size = 4 + nbytes
+    cluster_size = len(timestamp) + 9 + block_size
+    return (
+        b"\x1f\x43\xb6\x75\x01"
+        + cluster_size.to_bytes(7, "big")
+        + timestamp
+        + b"\xa3\x01"
+        + block_size.to_bytes(7, "big")
+        + b"\x81\x00\x00\x80"
+    )
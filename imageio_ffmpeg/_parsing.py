@@ -2,8 +2,6 @@ import re
 import threading
 import time
 
-from ._utils import logger
-
 
 class LogCatcher(threading.Thread):
     """Thread to keep reading from stderr so that the buffer does not
@@ -12,8 +10,9 @@ class LogCatcher(threading.Thread):
     last ones.
     """
 
-    def __init__(self, file):
+    def __init__(self, file, n_outputs=1):
         self._file = file
+        self._n_outputs = n_outputs
         self._header = ""
         self._lines = []
         self._remainder = b""
@@ -69,7 +68,7 @@ class LogCatcher(threading.Thread):
             # Process each line
             self._lines.extend(lines)
             if not self._header:
-                if get_output_video_line(self._lines):
+                if len(get_output_stream_lines(self._lines)) >= self._n_outputs:
                     header = b"\n".join(self._lines)
                     self._header += header.decode("utf-8", "ignore")
             elif self._lines:
@@ -87,6 +86,16 @@ def get_output_video_line(lines):
     """Get the line that defines the video stream that ffmpeg outputs,
     and which we read.
     """
+    video_lines = get_output_video_lines(lines)
+    return video_lines[0] if video_lines else None
+
+
+def get_output_video_lines(lines):
+    """Get the lines that define the video stream of each output (the
+    first video stream of each output), for outputs for which that line
+    is available.
+    """
+    video_lines = []
     in_output = False
     for line in lines:
         sline = line.lstrip()
@@ -94,7 +103,28 @@ def get_output_video_line(lines):
             in_output = True
         elif in_output:
             if sline.startswith(b"Stream ") and b" Video:" in sline:
-                return line
+                video_lines.append(line)
+                in_output = False
+    return video_lines
+
+
+def get_output_stream_lines(lines):
+    """Get the lines that define the (first) video or audio stream of
+    each output, for outputs for which that line is available.
+    """
+    stream_lines = []
+    in_output = False
+    for line in lines:
+        sline = line.lstrip()
+        if sline.startswith(b"Output "):
+            in_output = True
+        elif in_output:
+            if sline.startswith(b"Stream ") and (
+                b" Video:" in sline or b" Audio:" in sline
+            ):
+                stream_lines.append(line)
+                in_output = False
+    return stream_lines
 
 
 def limit_lines(lines, N=32):
@@ -123,8 +153,7 @@ def parse_ffmpeg_header(text):
     # meta["header"] = text  # Can enable this for debugging
 
     # Get version
-    ver = lines[0].split("version", 1)[-1].split("Copyright")[0]
-    meta["ffmpeg_version"] = ver.strip() + " " + lines[1].strip()
+    meta["ffmpeg_version"] = parse_version(lines)
 
     # get the output line that speaks about video
     videolines = [
@@ -132,18 +161,9 @@ def parse_ffmpeg_header(text):
     ]
 
     # Codec and pix_fmt hint
-    line = videolines[0]
-    meta["codec"] = line.split("Video: ", 1)[-1].lstrip().split(" ", 1)[0].strip()
-    meta["pix_fmt"] = re.split(
-        # use a negative lookahead regexp to ignore commas that are contained
-        # within a parenthesis
-        # this helps consider a pix_fmt of the kind
-        #     yuv420p(tv, progressive)
-        # as what it is, instead of erroneously reporting as
-        #     yuv420p(tv
-        r",\s*(?![^()]*\))",
-        line.split("Video: ", 1)[-1],
-    )[1].strip()
+    stream = parse_video_stream(videolines[0])
+    meta["codec"] = stream["codec"]
+    meta["pix_fmt"] = stream["pix_fmt"]
 
     # get the output line that speaks about audio
     audiolines = [
@@ -156,22 +176,9 @@ def parse_ffmpeg_header(text):
             audio_line.split("Audio: ", 1)[-1].lstrip().split(" ", 1)[0].strip()
         )
 
-    # get the frame rate.
-    # matches can be empty, see #171, assume nframes = inf
-    # the regexp omits values of "1k tbr" which seems a specific edge-case #262
-    # it seems that tbr is generally to be preferred #262
-    fps = 0
-    for line in [videolines[0]]:
-        matches = re.findall(r" ([0-9]+\.?[0-9]*) (fps)", line)
-        if matches:
-            fps = float(matches[0][0].strip())
-    meta["fps"] = fps
-
-    # get the size of the original stream, of the form 460x320 (w x h)
-    line = videolines[0]
-    match = re.search(" [0-9]*x[0-9]*(,| )", line)
-    parts = line[match.start() : match.end() - 1].split("x")
-    meta["source_size"] = tuple(map(int, parts))
+    # get the frame rate and size of the original stream
+    meta["fps"] = stream["fps"]
+    meta["source_size"] = stream["size"]
 
     # get the size of what we receive, of the form 460x320 (w x h)
     line = videolines[-1]  # Pipe output
@@ -179,14 +186,15 @@ def parse_ffmpeg_header(text):
     parts = line[match.start() : match.end() - 1].split("x")
     meta["size"] = tuple(map(int, parts))
 
-    # Check the two sizes
-    if meta["source_size"] != meta["size"]:
-        logger.warning(
-            "The frame size for reading {} is "
-            "different from the source frame size {}.".format(
-                meta["size"], meta["source_size"]
-            )
-        )
+    # with multiple outputs (read_frames() with scales), get the size of each
+    output_lines = get_output_video_lines([l.encode() for l in lines])
+    if len(output_lines) > 1:
+        meta["sizes"] = []
+        for line in output_lines:
+            match = re.search(b" [0-9]*x[0-9]*(,| )", line)
+            parts = line[match.start() : match.end() - 1].split(b"x")
+            meta["sizes"].append(tuple(map(int, parts)))
+        meta["size"] = meta["sizes"][0]
 
     # get the rotate metadata
     reo_rotate = re.compile(r"rotate\s+:\s([0-9]+)")
@@ -197,12 +205,149 @@ def parse_ffmpeg_header(text):
     meta["rotate"] = int(rotate)
 
     # get duration (in seconds)
+    meta["duration"] = parse_duration(lines)
+
+    return meta
+
+
+def parse_video_stream(line):
+    """Parse the line that describes a video stream, to get the codec,
+    pix_fmt, fps and size.
+    """
+    meta = {}
+
+    # Codec and pix_fmt hint
+    meta["codec"] = line.split("Video: ", 1)[-1].lstrip().split(" ", 1)[0].strip()
+    meta["pix_fmt"] = re.split(
+        # use a negative lookahead regexp to ignore commas that are contained
+        # within a parenthesis
+        # this helps consider a pix_fmt of the kind
+        #     yuv420p(tv, progressive)
+        # as what it is, instead of erroneously reporting as
+        #     yuv420p(tv
+        r",\s*(?![^()]*\))",
+        line.split("Video: ", 1)[-1],
+    )[1].strip()
+
+    # get the frame rate.
+    # matches can be empty, see #171, assume nframes = inf
+    # the regexp omits values of "1k tbr" which seems a specific edge-case #262
+    # it seems that tbr is generally to be preferred #262
+    fps = 0
+    matches = re.findall(r" ([0-9]+\.?[0-9]*) (fps)", line)
+    if matches:
+        fps = float(matches[0][0].strip())
+    meta["fps"] = fps
+
+    # get the size, of the form 460x320 (w x h)
+    match = re.search(" [0-9]*x[0-9]*(,| )", line)
+    parts = line[match.start() : match.end() - 1].split("x")
+    meta["size"] = tuple(map(int, parts))
+
+    return meta
+
+
+def parse_ffmpeg_inputs(text):
+    """Parse the description of each input that ffmpeg prints (e.g. when
+    it is given multiple inputs and no output). Returns a list with an item
+    for each input that could be opened: a dict with the codec, pix_fmt, fps,
+    size and duration of its first video stream, or None if it has no video.
+    """
+    sections = []
+    for line in text.splitlines():
+        if line.startswith("Input #"):
+            sections.append([])
+        elif sections:
+            sections[-1].append(line)
+
+    result = []
+    for lines in sections:
+        videolines = [
+            l for l in lines if l.lstrip().startswith("Stream ") and " Video: " in l
+        ]
+        meta = None
+        if videolines:
+            meta = parse_video_stream(videolines[0])
+            meta["duration"] = parse_duration(lines)
+        result.append(meta)
+    return result
+
+
+def parse_output_fps(text):
+    """Get the frame rate of the (first) video output, or 0 if unknown."""
+    lines = get_output_video_lines(text.encode().splitlines())
+    if lines:
+        matches = re.findall(r" ([0-9]+\.?[0-9]*) (fps)", lines[0].decode())
+        if matches:
+            return float(matches[0][0])
+    return 0
+
+
+def parse_version(lines):
+    ver = lines[0].split("version", 1)[-1].split("Copyright")[0]
+    return ver.strip() + " " + lines[1].strip()
+
+
+def parse_duration(lines):
     line = [l for l in lines if "Duration: " in l][0]
     match = re.search(" [0-9][0-9]:[0-9][0-9]:[0-9][0-9].[0-9][0-9]", line)
     duration = 0
     if match is not None:
         hms = line[match.start() + 1 : match.end()].split(":")
         duration = cvsecs(*hms)
-    meta["duration"] = duration
+    return duration
+
+
+def parse_channels(layout):
+    """Get the number of channels from a channel layout as reported by
+    ffmpeg, e.g. "mono", "stereo", "5.1(side)" or "3 channels".
+    """
+    layout = layout.split("(")[0].strip()
+    match = re.match(r"^([0-9]+) channels$", layout)
+    if match:
+        return int(match.group(1))
+    elif layout in ("mono",):
+        return 1
+    elif layout in ("stereo", "downmix"):
+        return 2
+    elif layout == "quad":
+        return 4
+    match = re.match(r"^([0-9]+)\.([0-9]+)$", layout)
+    if match:
+        return int(match.group(1)) + int(match.group(2))
+    return None
+
+
+def parse_ffmpeg_audio_header(text):
+    """Parse the header of an ffmpeg process that outputs raw audio
+    (see read_audio()).
+    """
+    lines = text.splitlines()
+    meta = {}
+
+    meta["ffmpeg_version"] = parse_version(lines)
+
+    audiolines = [
+        l for l in lines if l.lstrip().startswith("Stream ") and " Audio: " in l
+    ]
+
+    # Codec hint from the input stream
+    line = audiolines[0].split("Audio: ", 1)[-1]
+    meta["codec"] = line.lstrip().split(" ", 1)[0].strip().rstrip(",")
+
+    # Sample rate and channels of what we receive, e.g.
+    # "pcm_s16le, 44100 Hz, stereo, s16, 1411 kb/s"
+    line = audiolines[-1].split("Audio: ", 1)[-1]
+    parts = re.split(r",\s*(?![^()]*\))", line)
+    meta["sample_rate"] = 0
+    meta["channels"] = None
+    for i, part in enumerate(parts):
+        if part.strip().endswith(" Hz"):
+            meta["sample_rate"] = int(part.strip().split(" ")[0])
+            if i + 1 < len(parts):
+                meta["channels"] = parse_channels(parts[i + 1])
+            break
+
+    meta["duration"] = parse_duration(lines)
 
     return meta
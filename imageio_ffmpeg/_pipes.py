@@ -0,0 +1,327 @@
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+
+from ._utils import logger
+
+CHUNK_SIZE = 2**20
+
+# Top-level box types of ISO base media files (mp4, mov, m4v, 3gp, ...)
+_ISOBMFF_BOXES = {
+    b"ftyp",
+    b"styp",
+    b"moov",
+    b"mdat",
+    b"moof",
+    b"mfra",
+    b"sidx",
+    b"free",
+    b"skip",
+    b"wide",
+    b"pdin",
+    b"uuid",
+    b"meta",
+    b"pnot",
+}
+
+
+def is_source_data(obj):
+    """Get whether the given object is video data (bytes-like or a readable
+    file object), rather than a filename.
+    """
+    return isinstance(obj, (bytes, bytearray, memoryview)) or (
+        hasattr(obj, "read") and callable(obj.read)
+    )
+
+
+def _read_at_factory(source):
+    """Get a function read_at(pos, n) for the given source, or None if
+    the source is a stream that cannot be peeked into.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source).cast("B")
+        return lambda pos, n: bytes(data[pos : pos + n])
+    try:
+        seekable = source.seekable()
+    except Exception:
+        seekable = False
+    if not seekable:
+        return None
+
+    start = source.tell()
+
+    def read_at(pos, n):
+        source.seek(start + pos)
+        return source.read(n)
+
+    return read_at
+
+
+def requires_seeking(source):
+    """Get whether the given video data needs to be seeked in by ffmpeg.
+    This is the case for mp4/mov files that have their moov atom (the
+    index) after the media data. Returns None if this cannot be
+    determined without consuming the stream.
+    """
+    read_at = _read_at_factory(source)
+    if read_at is None:
+        return None
+    start = (
+        None if isinstance(source, (bytes, bytearray, memoryview)) else source.tell()
+    )
+    try:
+        pos = 0
+        while True:
+            header = read_at(pos, 16)
+            if len(header) < 8:
+                return False
+            size, kind = struct.unpack(">I4s", header[:8])
+            if kind not in _ISOBMFF_BOXES:
+                return False  # not an ISO base media file
+            elif kind == b"moov":
+                return False
+            elif kind == b"mdat":
+                return True
+            if size == 1 and len(header) == 16:
+                size = struct.unpack(">Q", header[8:16])[0]
+            if size < 8:
+                return False  # box extends to the end of the file, or invalid
+            pos += size
+    finally:
+        if start is not None:
+            source.seek(start)
+
+
+def spool_to_tempfile(source):
+    """Write the given video data to a temporary file, and return the
+    filename. The caller is responsible for removing the file.
+    """
+    fd, filename = tempfile.mkstemp(prefix="imageio_ffmpeg_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                f.write(source)
+            else:
+                shutil.copyfileobj(source, f, CHUNK_SIZE)
+    except BaseException:
+        os.remove(filename)
+        raise
+    return filename
+
+
+def _iter_chunks(source, chunk_size):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = memoryview(source).cast("B")
+        for i in range(0, len(data), chunk_size):
+            yield data[i : i + chunk_size]
+    else:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+class StdinFeeder(threading.Thread):
+    """Thread to write video data (bytes-like or a readable file object)
+    to the stdin of ffmpeg. The data is written in chunks, so that large
+    blobs don't need to be copied, and so that the thread can be stopped.
+    The file is closed when all data is written, so ffmpeg sees the EOF.
+    """
+
+    def __init__(self, file, source, chunk_size=CHUNK_SIZE):
+        self._file = file
+        self._source = source
+        self._chunk_size = chunk_size
+        self._should_stop = False
+        self.nbytes = 0
+        self.error = None
+        threading.Thread.__init__(self)
+        self.daemon = True  # do not let this thread hold up Python shutdown
+        self.start()
+
+    def stop_me(self):
+        self._should_stop = True
+
+    def run(self):
+        try:
+            for chunk in _iter_chunks(self._source, self._chunk_size):
+                if self._should_stop:
+                    break
+                self._file.write(chunk)
+                self.nbytes += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg has stopped reading, e.g. the reader was closed
+        except ValueError:  # pragma: no cover
+            pass  # the file was closed
+        except Exception as err:
+            # Most likely an error reading from the source object
+            self.error = err
+            logger.warning("Error while feeding data to ffmpeg: " + str(err))
+        finally:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+
+
+class StdoutDrain(threading.Thread):
+    """Thread to read the encoded data that ffmpeg writes to stdout, and
+    forward it to a sink (a callable, or an object with a write method).
+    If the sink raises an error, the pipe is closed, so that ffmpeg stops
+    instead of blocking on a full pipe.
+    """
+
+    def __init__(self, file, sink, chunk_size=65536):
+        self._file = file
+        self._write = sink if callable(sink) else sink.write
+        self._chunk_size = chunk_size
+        self.nbytes = 0
+        self.error = None
+        threading.Thread.__init__(self)
+        self.daemon = True  # do not let this thread hold up Python shutdown
+        self.start()
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    chunk = self._file.read1(self._chunk_size)
+                except ValueError:  # pragma: no cover
+                    break  # the file was closed
+                if not chunk:
+                    break
+                self._write(chunk)
+                self.nbytes += len(chunk)
+        except Exception as err:
+            self.error = err
+        finally:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+
+
+def create_output_pipe():
+    """Create a pipe via which ffmpeg can write an extra output (besides
+    stdout). Returns (file, fd): the file object to read from, and the fd
+    to pass to ffmpeg (via pass_fds and "pipe:fd"). The caller must close
+    the fd once the process is started. Not supported on Windows.
+    """
+    fd_read, fd_write = os.pipe()
+    return os.fdopen(fd_read, "rb"), fd_write
+
+
+def create_input_pipe():
+    """Create a pipe via which we can send an extra input to ffmpeg (besides
+    stdin). Returns (file, fd): the file object to write to, and the fd to
+    pass to ffmpeg (via pass_fds and "pipe:fd"). The caller must close the
+    fd once the process is started. Not supported on Windows.
+    """
+    fd_read, fd_write = os.pipe()
+    return os.fdopen(fd_write, "wb"), fd_read
+
+
+class QueueFeeder(threading.Thread):
+    """Thread to write data to an extra input pipe of ffmpeg. Data is put
+    in an (unbounded) queue, so that the producer never blocks on this pipe,
+    e.g. while ffmpeg is waiting for data on another pipe. The file is closed
+    after close() is called and the queued data is written.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._queue = queue.Queue()
+        self.nbytes = 0
+        self.error = None
+        threading.Thread.__init__(self)
+        self.daemon = True  # do not let this thread hold up Python shutdown
+        self.start()
+
+    def put(self, data):
+        self._queue.put(data)
+
+    def close(self):
+        self._queue.put(None)
+
+    def run(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    break
+                self._file.write(data)
+                self.nbytes += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg has stopped reading
+        except Exception as err:
+            self.error = err
+            logger.warning("Error while feeding data to ffmpeg: " + str(err))
+        finally:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+
+
+class ChunkReader(threading.Thread):
+    """Thread to read fixed-size chunks (e.g. frames) from an extra output
+    pipe of ffmpeg into a small queue. Reading in a thread prevents ffmpeg
+    from blocking on one pipe while we wait for data on another. When
+    stopped, the thread keeps reading (and discarding) data until EOF, so
+    that ffmpeg does not block on a full pipe while it is being stopped.
+    """
+
+    def __init__(self, file, chunk_size, max_chunks=8):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(max_chunks)
+        self._should_stop = False
+        self.error = None
+        threading.Thread.__init__(self)
+        self.daemon = True  # do not let this thread hold up Python shutdown
+        self.start()
+
+    def stop_me(self):
+        self._should_stop = True
+
+    def get_chunk(self):
+        """Get the next chunk, or None if the end of the stream is reached."""
+        while True:
+            try:
+                return self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self.is_alive() and self._queue.empty():
+                    if self.error is not None:
+                        raise self.error
+                    return None
+
+    def run(self):
+        try:
+            while True:
+                chunk = self._file.read(self._chunk_size)
+                if not chunk:
+                    break
+                while len(chunk) < self._chunk_size:
+                    extra_bytes = self._file.read(self._chunk_size - len(chunk))
+                    if not extra_bytes:
+                        raise RuntimeError(
+                            "End of file reached before full chunk could be read."
+                        )
+                    chunk += extra_bytes
+                while not self._should_stop:
+                    try:
+                        self._queue.put(chunk, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as err:
+            self.error = err
+        finally:
+            try:
+                self._file.close()
+            except Exception:
+                pass
@@ -0,0 +1,297 @@
+import mmap
+import os
+import pathlib
+from fractions import Fraction
+
+from ._utils import logger
+
+_Y4M_MAGIC = b"YUV4MPEG2 "
+
+# Planar pixel formats -> (bytes per sample, log2 of the chroma subsampling
+# in x and y, or None if there's no chroma, whether there's an alpha plane)
+_PLANAR_FORMATS = {
+    "gray": (1, None, None, False),
+    "gray16le": (2, None, None, False),
+    "yuv420p": (1, 1, 1, False),
+    "yuv422p": (1, 1, 0, False),
+    "yuv444p": (1, 0, 0, False),
+    "yuv411p": (1, 2, 0, False),
+    "yuva444p": (1, 0, 0, True),
+    "yuv420p10le": (2, 1, 1, False),
+    "yuv422p10le": (2, 1, 0, False),
+    "yuv444p10le": (2, 0, 0, False),
+    "yuv420p12le": (2, 1, 1, False),
+    "yuv422p12le": (2, 1, 0, False),
+    "yuv444p12le": (2, 0, 0, False),
+    "yuv420p16le": (2, 1, 1, False),
+    "yuv422p16le": (2, 1, 0, False),
+    "yuv444p16le": (2, 0, 0, False),
+}
+
+# Packed pixel formats -> bytes per pixel
+_PACKED_FORMATS = {"rgb24": 3, "bgr24": 3, "rgba": 4, "bgra": 4, "rgb48le": 6}
+
+# Y4M colour space tags -> pix_fmt. The first tag for a pix_fmt is used to write.
+_Y4M_TAGS = {
+    "420jpeg": "yuv420p",
+    "420mpeg2": "yuv420p",
+    "420paldv": "yuv420p",
+    "420": "yuv420p",
+    "422": "yuv422p",
+    "444": "yuv444p",
+    "411": "yuv411p",
+    "444alpha": "yuva444p",
+    "mono": "gray",
+    "mono16": "gray16le",
+    "420p10": "yuv420p10le",
+    "422p10": "yuv422p10le",
+    "444p10": "yuv444p10le",
+    "420p12": "yuv420p12le",
+    "422p12": "yuv422p12le",
+    "444p12": "yuv444p12le",
+    "420p16": "yuv420p16le",
+    "422p16": "yuv422p16le",
+    "444p16": "yuv444p16le",
+}
+
+
+def get_framesize(size, pix_fmt, bits_per_pixel=None):
+    """Get the number of bytes of a raw frame of the given size and pix_fmt.
+    For pixel formats that are not known, bits_per_pixel must be given.
+    """
+    w, h = size
+    if pix_fmt in _PLANAR_FORMATS:
+        nbytes, sx, sy, alpha = _PLANAR_FORMATS[pix_fmt]
+        n = w * h * (2 if alpha else 1)
+        if sx is not None:
+            # Chroma planes are rounded up for odd sizes
+            n += 2 * (-(-w >> sx)) * (-(-h >> sy))
+        return n * nbytes
+    elif pix_fmt in _PACKED_FORMATS:
+        return w * h * _PACKED_FORMATS[pix_fmt]
+    elif bits_per_pixel:
+        return w * h * bits_per_pixel // 8
+    else:
+        raise ValueError("Unknown pix_fmt {}, need bits_per_pixel.".format(pix_fmt))
+
+
+def _parse_y4m_header(line):
+    """Parse the header line of a Y4M file into (size, fps, pix_fmt)."""
+    w = h = None
+    fps = 0
+    pix_fmt = "yuv420p"
+    for token in line.decode("ascii", "replace").split()[1:]:
+        tag, value = token[0], token[1:]
+        if tag == "W":
+            w = int(value)
+        elif tag == "H":
+            h = int(value)
+        elif tag == "F":
+            num, den = value.split(":")
+            fps = int(num) / int(den) if int(den) else 0
+        elif tag == "C":
+            if value not in _Y4M_TAGS:
+                raise ValueError("Unsupported Y4M colour space: " + value)
+            pix_fmt = _Y4M_TAGS[value]
+    if not w or not h:
+        raise ValueError("Invalid Y4M header: no frame size.")
+    return (w, h), fps, pix_fmt
+
+
+class RawVideo:
+    """
+    A Y4M or headerless raw video file, read directly, without ffmpeg. The
+    file is memory-mapped, and frames are accessed randomly, with video[i]
+    giving a memoryview of frame i (negative indices are supported). This
+    is as fast as the disk (or page cache), and involves no copying.
+
+    The frames are in the pixel format of the file; no conversion is done.
+    For Y4M files the size, frame rate and pixel format are read from the
+    header. For other files, they must be given.
+
+    Attributes:
+        filename (str): the filename of the file.
+        meta (dict): the meta data, with the same fields as for read_frames()
+            (except ffmpeg_version), and the pix_fmt and nframes.
+
+    Parameters:
+        path (str): the filename of the file to read from.
+        size (tuple): the width and height of the frames (not for Y4M).
+        pix_fmt (str): the pixel format of the frames (not for Y4M).
+        fps (float): the frame rate (not for Y4M). Default 0 (unknown).
+        bits_per_pixel (int): the number of bits per pixel, only needed
+            for pixel formats that are not known.
+    """
+
+    def __init__(self, path, size=None, pix_fmt=None, fps=None, bits_per_pixel=None):
+        if isinstance(path, pathlib.PurePath):
+            path = str(path)
+        assert isinstance(path, str), "path must be a filename"
+        self.filename = path
+
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._mmap = None
+        data = self._view = memoryview(self._mmap if self._mmap else b"")
+
+        self._offsets = None
+        if data[: len(_Y4M_MAGIC)] == _Y4M_MAGIC:
+            end = self._mmap.find(b"\n", 0, 4096)
+            if end < 0:
+                raise ValueError("Invalid Y4M header in {}.".format(path))
+            size, fps, pix_fmt = _parse_y4m_header(bytes(data[:end]))
+            self._framesize = get_framesize(size, pix_fmt)
+            # Frame headers can contain parameters, so find each of them
+            self._offsets = []
+            pos = end + 1
+            while pos < len(data):
+                if data[pos : pos + 5] != b"FRAME":
+                    raise ValueError("Invalid Y4M frame header in {}.".format(path))
+                end = self._mmap.find(b"\n", pos, pos + 4096)
+                if end < 0 or end + 1 + self._framesize > len(data):
+                    logger.warning("Y4M file {} is truncated.".format(path))
+                    break
+                self._offsets.append(end + 1)
+                pos = end + 1 + self._framesize
+            nframes = len(self._offsets)
+        else:
+            assert size is not None, "size must be given for raw video"
+            assert pix_fmt is not None, "pix_fmt must be given for raw video"
+            size = int(size[0]), int(size[1])
+            fps = fps or 0
+            self._framesize = get_framesize(size, pix_fmt, bits_per_pixel)
+            nframes = len(data) // self._framesize
+            if len(data) % self._framesize:
+                logger.warning("Raw video file {} is truncated.".format(path))
+
+        self.meta = {
+            "codec": "rawvideo",
+            "pix_fmt": pix_fmt,
+            "fps": fps,
+            "source_size": size,
+            "size": size,
+            "duration": nframes / fps if fps else 0,
+            "nframes": nframes,
+        }
+
+    def __repr__(self):
+        return "<RawVideo {} frames in {}>".format(len(self), self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.meta["nframes"]
+
+    def __getitem__(self, index):
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Frame index out of range.")
+        if self._offsets is None:
+            start = index * self._framesize
+        else:
+            start = self._offsets[index]
+        return self._view[start : start + self._framesize]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        """Unmap the file."""
+        if self._mmap is not None:
+            self._view.release()
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # frames are still in use, unmapped when they're released
+            self._mmap = None
+
+
+def read_rawvideo(path, size=None, pix_fmt=None, fps=None, bits_per_pixel=None):
+    """
+    Create a generator to iterate over the frames in a Y4M or headerless
+    raw video file, without using ffmpeg. See RawVideo for the parameters.
+
+    Like read_frames(), it first yields the meta data dict, and then the
+    frames. The frames are memoryviews into the memory-mapped file, in the
+    pixel format of the file (no conversion is done).
+
+    Example:
+
+        gen = read_rawvideo("intermediate.y4m")
+        meta = gen.__next__()  # meta["pix_fmt"] -> e.g. "yuv420p"
+        for frame in gen:
+            ...
+    """
+    video = RawVideo(path, size, pix_fmt, fps, bits_per_pixel)
+    try:
+        yield video.meta
+        yield from video
+    finally:
+        video.close()
+
+
+def write_rawvideo(path, size, pix_fmt="yuv420p", fps=16, y4m=None):
+    """
+    Create a generator to write frames to a Y4M or headerless raw video
+    file, without using ffmpeg. The frames are written as they are, so
+    they must be in the given pix_fmt. Like write_frames(), the generator
+    must be seeded with None, and closed when done:
+
+        gen = write_rawvideo("intermediate.y4m", (640, 480))
+        gen.send(None)  # seed the generator
+        for frame in frames:
+            gen.send(frame)
+        gen.close()
+
+    Parameters:
+        path (str): the filename to write to.
+        size (tuple): the width and height of the frames.
+        pix_fmt (str): the pixel format of the frames. Default "yuv420p".
+            Y4M supports gray and planar yuv formats.
+        fps (float): the frame rate, only stored in Y4M files. Default 16.
+        y4m (bool): whether to write a Y4M file. Default True if the path
+            ends with ".y4m".
+    """
+    if isinstance(path, pathlib.PurePath):
+        path = str(path)
+    assert isinstance(path, str), "path must be a filename"
+    assert len(size) == 2, "size must be a 2-tuple"
+    size = int(size[0]), int(size[1])
+    if y4m is None:
+        y4m = path.lower().endswith(".y4m")
+
+    framesize = get_framesize(size, pix_fmt)
+    frame_header = b""
+    header = b""
+    if y4m:
+        tags = [tag for tag, value in _Y4M_TAGS.items() if value == pix_fmt]
+        if not tags:
+            raise ValueError("Y4M does not support pix_fmt {}.".format(pix_fmt))
+        rate = Fraction(fps).limit_denominator(100000)
+        header = "YUV4MPEG2 W{} H{} F{}:{} Ip A1:1 C{}\n".format(
+            size[0], size[1], rate.numerator, rate.denominator, tags[0]
+        ).encode()
+        frame_header = b"FRAME\n"
+
+    with open(path, "wb") as f:
+        f.write(header)
+        while True:
+            bb = yield
+            if memoryview(bb).nbytes != framesize:
+                raise ValueError(
+                    "Frame must have {} bytes for {} {}x{}.".format(
+                        framesize, pix_fmt, *size
+                    )
+                )
+            # Large writes bypass the buffer of the file
+            f.write(frame_header)
+            f.write(bb)
@@ -0,0 +1,168 @@
+import collections
+import os
+import pathlib
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from ._io import _probe_files, read_frames
+
+# pix_fmt -> number of channels, for the (packed 8 bit) formats we support
+_CHANNELS = {"gray": 1, "rgb24": 3, "bgr24": 3, "rgba": 4, "bgra": 4}
+
+
+class ClipSampler:
+    """
+    Object to sample fixed-length clips from random positions in a set of
+    videos, e.g. to train machine learning models.
+
+    Each clip consists of num_frames frames, taken every stride frames,
+    resized to the given size (by ffmpeg). A pool of worker threads reads
+    clips ahead of time, each with its own ffmpeg process, which seeks to
+    the start of the clip, and only sends the needed frames. Since the
+    decoding happens in the ffmpeg processes, the throughput scales with
+    the number of workers up to the number of CPU's.
+
+    Iterating over the sampler yields (index, start, clip) tuples endlessly,
+    where index is the index of the file, start the start time of the clip
+    in seconds, and clip a bytes object with the frames, of shape
+    sampler.shape, i.e. (num_frames, height, width, channels). E.g.:
+
+        with ClipSampler(filenames, 16, (112, 112), seed=0) as sampler:
+            for index, start, clip in itertools.islice(sampler, 1000):
+                clip = np.frombuffer(clip, np.uint8).reshape(sampler.shape)
+
+    The positions are drawn from a random generator that can be seeded,
+    and clips are yielded in the order in which they are drawn, so the
+    result is reproducible. Files that are shorter than a clip are read
+    from the start, and padded by repeating the last frame.
+
+    Parameters:
+        paths (list): the filenames of the videos.
+        num_frames (int): the number of frames per clip.
+        size (tuple): the width and height of the frames of a clip.
+        stride (int): the step between the frames in a clip. Default 1.
+        pix_fmt (str): the pixel format: "gray", "rgb24" (default), "bgr24",
+            "rgba" or "bgra".
+        workers (int): the number of clips to read concurrently. Default the
+            number of CPU's.
+        prefetch (int): the number of clips to read ahead. Default twice
+            the number of workers.
+        seed (int): the seed for the random positions. Default None.
+        input_params (list): Additional ffmpeg input command line parameters.
+    """
+
+    def __init__(
+        self,
+        paths,
+        num_frames,
+        size,
+        stride=1,
+        pix_fmt="rgb24",
+        workers=None,
+        prefetch=None,
+        seed=None,
+        input_params=None,
+    ):
+        self._paths = [str(p) if isinstance(p, pathlib.PurePath) else p for p in paths]
+        self._num_frames = int(num_frames)
+        self._size = int(size[0]), int(size[1])
+        self._stride = int(stride)
+        self._pix_fmt = pix_fmt
+        workers = workers or os.cpu_count() or 1
+        self._prefetch = prefetch or 2 * workers
+        input_params = input_params or []
+
+        assert all(isinstance(p, str) for p in self._paths), "paths must be strings"
+        assert self._num_frames > 0, "num_frames must be positive"
+        assert self._stride > 0, "stride must be positive"
+        assert pix_fmt in _CHANNELS, "pix_fmt must be one of " + ", ".join(_CHANNELS)
+        assert isinstance(input_params, list), "input_params must be a list"
+
+        # Divide the CPU's over the ffmpeg processes
+        if "-threads" not in input_params:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            input_params = ["-threads", str(threads)] + input_params
+        self._input_params = input_params
+
+        # Get the duration and frame rate of all files at once
+        self.metas = _probe_files(self._paths)
+        self._indices = [i for i, meta in enumerate(self.metas) if meta is not None]
+        if not self._indices:
+            raise IOError("None of the given files could be read.")
+
+        self._random = random.Random(seed)
+        self._pending = collections.deque()
+        self._pool = ThreadPoolExecutor(workers, "imageio_ffmpeg_sampler")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            yield self.next_clip()
+
+    @property
+    def shape(self):
+        """The shape of a clip: (num_frames, height, width, channels)."""
+        w, h = self._size
+        return self._num_frames, h, w, _CHANNELS[self._pix_fmt]
+
+    def close(self):
+        """Stop the workers. Clips that are being read are finished first."""
+        self._pending.clear()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def draw(self):
+        """Draw a random (index, start) position of a clip."""
+        index = self._random.choice(self._indices)
+        meta = self.metas[index]
+        span = 0
+        if meta["fps"]:
+            span = ((self._num_frames - 1) * self._stride + 1) / meta["fps"]
+        start = self._random.uniform(0, max(0, meta["duration"] - span))
+        return index, round(start, 3)
+
+    def next_clip(self):
+        """Get the next (index, start, clip) tuple."""
+        while len(self._pending) < self._prefetch:
+            index, start = self.draw()
+            future = self._pool.submit(self.read_clip, index, start)
+            self._pending.append((index, start, future))
+        index, start, future = self._pending.popleft()
+        return index, start, future.result()
+
+    def read_clip(self, index, start=0):
+        """Read the clip at the given position (the file index and the start
+        time in seconds) in the calling thread. Returns a bytes object.
+        """
+        w, h = self._size
+        graph = "scale={}:{}".format(w, h)
+        if self._stride > 1:
+            graph = "select='not(mod(n\\,{}))',".format(self._stride) + graph
+        output_params = ["-vf", graph, "-frames:v", str(self._num_frames)]
+        output_params += ["-fps_mode", "passthrough"]
+
+        gen = read_frames(
+            self._paths[index],
+            pix_fmt=self._pix_fmt,
+            input_params=self._input_params + ["-ss", str(start)],
+            output_params=output_params,
+            bits_per_pixel=8 * _CHANNELS[self._pix_fmt],
+        )
+        try:
+            gen.__next__()  # == meta
+            frames = list(gen)
+        finally:
+            gen.close()
+
+        if not frames:
+            raise RuntimeError(
+                "Could not read a clip from {} at {} s.".format(
+                    self._paths[index], start
+                )
+            )
+        frames += frames[-1:] * (self._num_frames - len(frames))
+        return b"".join(frames)
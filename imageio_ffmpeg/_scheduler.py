@@ -0,0 +1,188 @@
+import os
+import sys
+import threading
+
+from ._utils import logger
+
+
+def _get_cpus():
+    """Get a sorted list of the CPU's that this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not available on Windows / MacOS
+        return list(range(os.cpu_count() or 1))
+
+
+class ProcessSlot:
+    """A ticket to run one ffmpeg process. Obtained via acquire_process_slot(),
+    and must be released when the process has terminated.
+    """
+
+    def __init__(self, limiter, index, threads, cpus):
+        self._limiter = limiter
+        self.index = index
+        self.threads = threads
+        self.cpus = cpus
+
+    def thread_params(self, params):
+        """Get the ffmpeg args to limit the number of threads, or an
+        empty list if there is no limit or the user already specified one.
+        """
+        if not self.threads or "-threads" in params:
+            return []
+        return ["-threads", str(self.threads)]
+
+    def apply_affinity(self, pid):
+        """Pin the process with the given pid (and its threads) to the
+        CPU's assigned to this slot. Only supported on Linux.
+        """
+        if not self.cpus:
+            return
+        try:
+            tids = [int(tid) for tid in os.listdir("/proc/{}/task".format(pid))]
+        except OSError:  # pragma: no cover
+            tids = [pid]
+        for tid in tids:
+            try:
+                os.sched_setaffinity(tid, self.cpus)
+            except OSError:  # pragma: no cover - thread/process has exited
+                pass
+
+    def release(self):
+        """Release this slot, so that another process can be started."""
+        limiter, self._limiter = self._limiter, None
+        if limiter is not None:
+            limiter._release(self.index)
+
+
+class ProcessLimiter:
+    """Object to keep track of the number of running ffmpeg processes. When
+    a limit is set, processes are admitted in the order in which they ask
+    for a slot.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._max_processes = None
+        self._threads = None
+        self._cpu_affinity = False
+        self._busy = set()
+        self._free = []
+        self._queue = []
+
+    def configure(self, max_processes=None, threads=None, cpu_affinity=False):
+        with self._condition:
+            self._max_processes = max_processes
+            self._threads = threads
+            self._cpu_affinity = cpu_affinity
+            if max_processes is None:
+                self._free = []
+            else:
+                self._free = [i for i in range(max_processes) if i not in self._busy]
+            self._condition.notify_all()
+
+    def acquire(self, n=1):
+        """Get a list of n slots, which are obtained all at once."""
+        with self._condition:
+            if self._max_processes is None:
+                return [ProcessSlot(None, None, self._threads, None)] * n
+            self._check_count(n)
+            # Queue up, to admit processes in a first-come first-served manner
+            ticket = object()
+            self._queue.append(ticket)
+            try:
+                while not (len(self._free) >= n and self._queue[0] is ticket):
+                    if self._max_processes is None:
+                        return [ProcessSlot(None, None, self._threads, None)] * n
+                    self._check_count(n)  # the limit may have been lowered
+                    self._condition.wait()
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+            slots = []
+            for _ in range(n):
+                index = self._free.pop(0)
+                self._busy.add(index)
+                slots.append(
+                    ProcessSlot(self, index, self._get_threads(), self._get_cpus(index))
+                )
+            return slots
+
+    def _check_count(self, n):
+        if n > self._max_processes:
+            raise ValueError(
+                "Need {} ffmpeg processes at the same time, but the process "
+                "limit is {} (see set_process_limit()).".format(n, self._max_processes)
+            )
+
+    def _release(self, index):
+        with self._condition:
+            self._busy.discard(index)
+            if self._max_processes is not None and index < self._max_processes:
+                self._free.append(index)
+                self._free.sort()
+            self._condition.notify_all()
+
+    def _get_threads(self):
+        if self._threads:
+            return self._threads
+        return max(1, len(_get_cpus()) // self._max_processes)
+
+    def _get_cpus(self, index):
+        if not (self._cpu_affinity and sys.platform.startswith("linux")):
+            return None
+        cpus = _get_cpus()
+        n = self._max_processes
+        if n >= len(cpus):
+            return [cpus[index % len(cpus)]]
+        # Divide the CPU's in n contiguous groups
+        i1 = index * len(cpus) // n
+        i2 = (index + 1) * len(cpus) // n
+        return cpus[i1:i2]
+
+
+_limiter = ProcessLimiter()
+
+
+def set_process_limit(max_processes=None, threads=None, cpu_affinity=False):
+    """
+    Limit the number of ffmpeg processes that imageio-ffmpeg runs at the
+    same time (across all threads). When the limit is reached, functions
+    like read_frames() and write_frames() wait until another process is
+    done. Waiting processes are admitted in the order in which they arrived.
+
+    When a limit is set, each ffmpeg process is also given a number of
+    threads, so that the processes together don't oversubscribe the CPU.
+    This is not done if the user passes "-threads" via the input_params
+    or output_params.
+
+    Parameters:
+        max_processes (int): The maximum number of concurrent ffmpeg processes.
+            Default None, meaning no limit.
+        threads (int): The number of threads for each ffmpeg process. By default
+            this is the number of available CPU's divided by max_processes.
+        cpu_affinity (bool): If True, pin each ffmpeg process to its own
+            subset of the available CPU's. Only supported on Linux. Default False.
+    """
+    if max_processes is not None:
+        assert isinstance(max_processes, int), "max_processes must be an int"
+        assert max_processes >= 1, "max_processes must be at least 1"
+    if threads is not None:
+        assert isinstance(threads, int), "threads must be an int"
+        assert threads >= 1, "threads must be at least 1"
+    if cpu_affinity and not sys.platform.startswith("linux"):
+        logger.warning("CPU affinity for ffmpeg processes is only supported on Linux.")
+    _limiter.configure(max_processes, threads, bool(cpu_affinity))
+
+
+def acquire_process_slot():
+    """Get a slot to run an ffmpeg process. Blocks if the limit is reached."""
+    return _limiter.acquire()[0]
+
+
+def acquire_process_slots(n):
+    """Get n slots at once, to run ffmpeg processes that depend on each
+    other. Blocks until n slots are free, and raises a ValueError if the
+    limit is lower than n (so that this would block forever).
+    """
+    return _limiter.acquire(n)
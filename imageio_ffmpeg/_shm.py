@@ -0,0 +1,337 @@
+import os
+import queue
+import struct
+import threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+from ._io import _read_frames
+
+# The first byte of the shared memory is set when the reader is closed, so
+# that consumers know that they can drop their mapping of it
+_OPEN = 0
+_CLOSED = 1
+
+# The frames start at this offset, so that they are nicely aligned
+_ALIGN = 64
+
+# Shared memory blocks that were attached in this process, by name, as
+# [SharedMemory, connection to the reader or None]
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+def _attach(name):
+    with _attached_lock:
+        # Drop the blocks of readers that have been closed
+        for key in list(_attached):
+            if key != name and _attached[key][0].buf[0] == _CLOSED:
+                _detach(key)
+        entry = _attached.get(name)
+        if entry is None:
+            try:
+                # Python 3.13+: don't let this process unlink the memory on exit
+                shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:  # pragma: no cover
+                shm = shared_memory.SharedMemory(name=name)
+            entry = _attached[name] = [shm, None]
+        return entry
+
+
+def _detach(name):
+    shm, connection = _attached[name]
+    try:
+        shm.close()
+    except BufferError:
+        return  # a frame is still in use, try again later
+    if connection is not None:
+        connection.close()
+    del _attached[name]
+
+
+class SharedFrame:
+    """
+    A small (picklable) handle to a frame in the shared memory of a
+    SharedFrameReader. Send it to another process, and use it there as
+    a context manager to get the frame as a memoryview, without copying:
+
+        with handle as frame:
+            frame = np.asarray(frame)  # shape (height, width, channels)
+            ...
+
+    The slot is given back to the reader when the context exits (or when
+    release() is called). The memoryview must not be used after that.
+
+    Each process keeps the shared memory of a reader mapped, so that
+    the next frames can be accessed cheaply. The mapping is dropped when
+    a frame of another reader is accessed after the reader has been
+    closed, or by calling close().
+
+    Attributes:
+        name (str): the name of the shared memory block.
+        index (int): the index of the frame in the video.
+        slot (int): the index of the slot that holds the frame.
+        offset (int): the offset of the frame in the shared memory.
+        nbytes (int): the size of the frame in bytes.
+        shape (tuple): the shape of the frame.
+    """
+
+    __slots__ = ["name", "index", "slot", "offset", "nbytes", "shape"]
+    __slots__ += ["_address", "_authkey", "_released"]
+
+    def __init__(self, name, index, slot, offset, nbytes, shape, address, authkey):
+        self.name = name
+        self.index = index
+        self.slot = slot
+        self.offset = offset
+        self.nbytes = nbytes
+        self.shape = shape
+        self._address = address
+        self._authkey = authkey
+        self._released = False
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots__, state):
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return "<SharedFrame {} in slot {} of {}>".format(
+            self.index, self.slot, self.name
+        )
+
+    def __enter__(self):
+        return self.view()
+
+    def __exit__(self, *args):
+        self.release()
+
+    def view(self):
+        """Get the frame as a memoryview of the shared memory."""
+        buf = _attach(self.name)[0].buf
+        view = buf[self.offset : self.offset + self.nbytes]
+        return view.cast("B", self.shape) if len(self.shape) > 1 else view
+
+    def release(self):
+        """Give the slot back to the reader, so it can be reused. Releasing
+        the same handle more than once has no effect.
+        """
+        if self._released:
+            return
+        self._released = True
+        message = struct.pack("<I", self.slot)
+        with _attached_lock:
+            entry = _attached.get(self.name)
+            try:
+                if entry is None:
+                    # Not mapped in this process, so no need to keep a connection
+                    with Client(self._address, authkey=self._authkey) as connection:
+                        connection.send_bytes(message)
+                    return
+                if entry[1] is None:
+                    entry[1] = Client(self._address, authkey=self._authkey)
+                entry[1].send_bytes(message)
+            except (OSError, EOFError):
+                pass  # the reader has been closed
+
+    def close(self):
+        """Drop the mapping of the shared memory (and the connection to the
+        reader) in this process. E.g. call this in a long-lived worker
+        process when it's done with the frames of a reader. Accessing a
+        frame of the reader later maps the memory again.
+        """
+        with _attached_lock:
+            if self.name in _attached:
+                _detach(self.name)
+
+
+class SharedFrameReader:
+    """
+    Object to decode a video in one process, and hand the frames to other
+    processes (e.g. a pool of inference workers) without copying them.
+
+    The frames are read from ffmpeg's pipe directly into a ring of slots in
+    a block of shared memory. Iterating over the reader yields a SharedFrame
+    handle per frame, which is small and cheap to send to another process
+    (e.g. via a multiprocessing queue or pool). The consumer uses the handle
+    to get the frame from the shared memory, and then releases it, which
+    notifies the reader via a multiprocessing connection. A slot is only
+    reused once the frame in it has been released; the next frame is read
+    into any free slot, and if all slots are in use, the reader waits.
+
+    Example:
+
+        def work(handle):
+            with handle as frame:
+                return np.asarray(frame).mean()
+
+        with SharedFrameReader(path) as reader:
+            with multiprocessing.Pool(4) as pool:
+                for result in pool.imap(work, reader):
+                    ...
+
+    The shared memory is removed when the reader is closed. Consumer
+    processes must be done with it by then.
+
+    Parameters:
+        path (str): the filename of the file to read from. Can also be
+            bytes, memoryview, or a readable file object.
+        num_slots (int): the number of frames that can be in use at the
+            same time. Default 16.
+        pix_fmt (str): the pixel format of the frames to be read.
+            The default is "rgb24" (frames are uint8 RGB images).
+        bits_per_pixel (int): The number of bits per pixel in the output frames.
+            This depends on the given pix_fmt. Default is 24 (RGB)
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters.
+    """
+
+    def __init__(
+        self,
+        path,
+        num_slots=16,
+        pix_fmt="rgb24",
+        bits_per_pixel=None,
+        input_params=None,
+        output_params=None,
+    ):
+        self._num_slots = int(num_slots)
+        bits_per_pixel = bits_per_pixel or 24
+
+        assert self._num_slots > 0, "num_slots must be positive"
+
+        self._index = 0
+        self._slot = None  # the slot that the next frame is read into
+        self._free = queue.Queue()
+        for slot in range(self._num_slots):
+            self._free.put(slot)
+        self._shm = self._listener = None
+        self._gen = _read_frames(
+            path,
+            pix_fmt=pix_fmt,
+            input_params=input_params,
+            output_params=output_params,
+            bits_per_pixel=bits_per_pixel,
+            get_buffer=self._get_buffer,
+        )
+        try:
+            self.meta = self._gen.__next__()
+            w, h = self.meta["size"]
+            self._nbytes = w * h * bits_per_pixel // 8
+            if bits_per_pixel % 8 == 0:
+                self._shape = (h, w, bits_per_pixel // 8)
+            else:
+                self._shape = (self._nbytes,)
+            size = _ALIGN + self._num_slots * self._nbytes
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[0] = _OPEN
+            # Consumers connect to this to release slots
+            self._authkey = os.urandom(16)
+            self._listener = Listener(authkey=self._authkey)
+        except BaseException:
+            self.close()
+            raise
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            handle = self.next_frame()
+            if handle is None:
+                break
+            yield handle
+
+    @property
+    def name(self):
+        """The name of the shared memory block."""
+        return self._shm.name
+
+    @property
+    def shape(self):
+        """The shape of a frame: (height, width, channels)."""
+        return self._shape
+
+    def close(self):
+        """Stop ffmpeg and remove the shared memory."""
+        self._gen.close()
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            # Wake up the thread that accepts connections, so that it stops
+            try:
+                Client(listener.address, authkey=self._authkey).close()
+            except (OSError, EOFError):  # pragma: no cover
+                pass
+            listener.close()
+        shm, self._shm = self._shm, None
+        if shm is not None:
+            shm.buf[0] = _CLOSED
+            with _attached_lock:
+                if shm.name in _attached:
+                    _detach(shm.name)  # frames were released in this process
+            shm.close()
+            shm.unlink()
+
+    def next_frame(self):
+        """Read the next frame, and get its SharedFrame handle, or None at
+        the end of the video. Waits until a slot is free.
+        """
+        try:
+            self._gen.__next__()
+        except StopIteration:
+            if self._slot is not None:
+                self._free.put(self._slot)
+                self._slot = None
+            return None
+        slot, self._slot = self._slot, None
+        handle = SharedFrame(
+            self._shm.name,
+            self._index,
+            slot,
+            _ALIGN + slot * self._nbytes,
+            self._nbytes,
+            self._shape,
+            self._listener.address,
+            self._authkey,
+        )
+        self._index += 1
+        return handle
+
+    def _get_buffer(self):
+        # Wait until the consumer of a frame is done with it
+        self._slot = slot = self._free.get()
+        offset = _ALIGN + slot * self._nbytes
+        return self._shm.buf[offset : offset + self._nbytes]
+
+    def _accept(self):
+        # Accept connections from consumers, until the reader is closed
+        listener = self._listener
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception:
+                break  # closed (or a failed handshake after closing)
+            if self._listener is None:
+                connection.close()
+                break
+            thread = threading.Thread(
+                target=self._receive, args=(connection,), daemon=True
+            )
+            thread.start()
+
+    def _receive(self, connection):
+        # Receive the slots that a consumer releases
+        with connection:
+            while True:
+                try:
+                    data = connection.recv_bytes()
+                except (OSError, EOFError):
+                    break
+                self._free.put(struct.unpack("<I", data)[0])
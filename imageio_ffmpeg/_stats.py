@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+
+from ._hooks import emit
+from ._utils import logger
+
+_callbacks = []
+
+
+def add_stats_callback(callback):
+    """
+    Register a function that is called each time an ffmpeg process that
+    was started by imageio-ffmpeg has terminated. The function is called
+    with a ProcessStats object, which has the following attributes:
+
+    * kind: "read", "audio", "write", "count", "probe", "edit", "transcode"
+      or "autotune", depending on the function used (read_frames(),
+      read_audio(), write_frames(), count_frames_and_secs(), read_clips() to
+      get the meta data of files, trim(), concat() and remux(), transcode(),
+      or autotune_encoder()).
+    * cmd: the ffmpeg command (a list of str).
+    * pid: the process id.
+    * returncode: the exit code of ffmpeg (negative if killed by a signal).
+    * wall_time: seconds between starting and reaping the process.
+    * user_time: CPU seconds spent in user mode (None if unknown).
+    * system_time: CPU seconds spent in kernel mode (None if unknown).
+    * max_rss: peak resident memory in bytes (None if unknown).
+    * bytes_piped: the number of frame bytes passed over the pipe.
+    * nframes: the number of frames that were read or written.
+    * stop_policy: how ffmpeg was stopped: "timeout" or "wait" (asked to quit),
+      "kill", or None if it quit by itself.
+    * start_time, stop_time, kill_time: the time.perf_counter() values at which
+      the process was started, asked to stop and killed (None if not applicable).
+
+    CPU time and memory usage are available on Unix only.
+    """
+    if not callable(callback):
+        raise TypeError("The stats callback must be callable.")
+    if callback not in _callbacks:
+        _callbacks.append(callback)
+
+
+def remove_stats_callback(callback):
+    """
+    Unregister a function that was registered with add_stats_callback().
+    """
+    try:
+        _callbacks.remove(callback)
+    except ValueError:
+        pass
+
+
+class ProcessStats:
+    """Object to collect the resource usage of a single ffmpeg process.
+    It also takes care of reaping the process, because on Unix the CPU
+    time and memory usage can only be obtained at that moment.
+    """
+
+    def __init__(self, kind, cmd, process):
+        self.kind = kind
+        self.cmd = cmd
+        self.pid = process.pid
+        self.returncode = None
+        self.wall_time = None
+        self.user_time = None
+        self.system_time = None
+        self.max_rss = None
+        self.bytes_piped = 0
+        self.nframes = 0
+        self.stop_policy = None
+        self.start_time = time.perf_counter()
+        self.stop_time = None
+        self.kill_time = None
+        self._process = process
+
+    def __repr__(self):
+        return "<ProcessStats {} pid={} returncode={} wall_time={}>".format(
+            self.kind, self.pid, self.returncode, self.wall_time
+        )
+
+    def poll(self):
+        """Check if the process has terminated. Use instead of Popen.poll()."""
+        return self._reap(block=False)
+
+    def wait(self):
+        """Wait for the process to terminate. Use instead of Popen.wait()."""
+        return self._reap(block=True)
+
+    def _reap(self, block):
+        process = self._process
+        if process.returncode is not None:
+            return process.returncode
+        try:
+            if not _has_wait4:  # pragma: no cover
+                raise NotImplementedError()
+            options = 0 if block else os.WNOHANG
+            pid, status, rusage = os.wait4(process.pid, options)
+        except (NotImplementedError, ImportError):
+            # No wait4 on Windows. And during Python shutdown, wait4 fails
+            # because it imports the resource module to create its result.
+            return process.wait() if block else process.poll()
+        except ChildProcessError:  # pragma: no cover - reaped elsewhere
+            return process.poll()
+        if pid == 0:
+            return None
+        # Let the Popen object know, so it won't try to reap the process itself
+        process.returncode = os.waitstatus_to_exitcode(status)
+        self._set_time()
+        self.user_time = rusage.ru_utime
+        self.system_time = rusage.ru_stime
+        self.max_rss = rusage.ru_maxrss * _maxrss_unit
+        return process.returncode
+
+    def _set_time(self):
+        if self.wall_time is None:
+            self.wall_time = time.perf_counter() - self.start_time
+
+    def set_stop_policy(self, stop_policy):
+        """Record that the process is being stopped with the given policy."""
+        now = time.perf_counter()
+        if self.stop_time is None:
+            self.stop_time = now
+        if stop_policy == "kill":
+            self.kill_time = now
+        self.stop_policy = stop_policy
+
+    def finish(self):
+        """Reap the process (if needed) and notify the registered callbacks
+        and hooks. Must only be called after the process has been asked to stop.
+        """
+        self.returncode = self.wait()
+        self._set_time()
+        emit("terminate", self)
+        for callback in list(_callbacks):
+            try:
+                callback(self)
+            except Exception as err:
+                logger.warning("Error in stats callback: " + str(err))
+
+
+_has_wait4 = hasattr(os, "wait4")
+
+# ru_maxrss is in kilobytes on Linux, but in bytes on MacOS
+_maxrss_unit = 1 if sys.platform.startswith("darwin") else 1024
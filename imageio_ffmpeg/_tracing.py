@@ -0,0 +1,155 @@
+import collections
+import json
+import os
+import threading
+import time
+
+from ._hooks import add_hook, remove_hook
+
+
+class Tracer:
+    """Records the events of the ffmpeg processes (using the hooks) in a
+    ring buffer. Events are stored as tuples, and only converted to the
+    Chrome Trace Event format when requested.
+    """
+
+    def __init__(self, max_events):
+        self._events = collections.deque(maxlen=max_events)
+        self._names = {}  # ffmpeg pid -> thread name
+        self._hooks = {
+            "spawn": self._on_spawn,
+            "header": self._on_header,
+            "frame": self._on_frame,
+            "error": self._on_error,
+            "terminate": self._on_terminate,
+        }
+
+    def start(self):
+        for event, callback in self._hooks.items():
+            add_hook(event, callback)
+
+    def stop(self):
+        for event, callback in self._hooks.items():
+            remove_hook(event, callback)
+
+    # The hooks. Note that deque.append() is thread-safe.
+
+    def _on_spawn(self, stats):
+        if len(self._names) >= self._events.maxlen:
+            self._names.pop(next(iter(self._names)), None)
+        thread = threading.current_thread().name
+        self._names[stats.pid] = "ffmpeg {} {} ({})".format(
+            stats.kind, stats.pid, thread
+        )
+        args = {"cmd": " ".join(stats.cmd)}
+        self._events.append(("i", "spawn", stats.pid, stats.start_time, 0, args))
+
+    def _on_header(self, stats, meta):
+        t0 = stats.start_time
+        dur = time.perf_counter() - t0
+        self._events.append(("X", "header", stats.pid, t0, dur, None))
+
+    def _on_frame(self, stats, nbytes, blocked):
+        t1 = time.perf_counter()
+        name = stats.kind + " frame"
+        args = {"nbytes": nbytes, "frame": stats.nframes - 1}
+        self._events.append(("X", name, stats.pid, t1 - blocked, blocked, args))
+
+    def _on_error(self, stats, error):
+        args = {"error": str(error)}
+        self._events.append(("i", "error", stats.pid, time.perf_counter(), 0, args))
+
+    def _on_terminate(self, stats):
+        t0, t1 = stats.start_time, stats.start_time + stats.wall_time
+        args = {
+            "returncode": stats.returncode,
+            "stop_policy": stats.stop_policy,
+            "nframes": stats.nframes,
+            "bytes_piped": stats.bytes_piped,
+            "user_time": stats.user_time,
+            "system_time": stats.system_time,
+            "max_rss": stats.max_rss,
+        }
+        self._events.append(("X", "ffmpeg " + stats.kind, stats.pid, t0, t1 - t0, args))
+        if stats.stop_time is not None:
+            t = stats.stop_time
+            args = {"stop_policy": stats.stop_policy}
+            self._events.append(("X", "stop", stats.pid, t, max(0, t1 - t), args))
+        if stats.kill_time is not None:
+            self._events.append(("i", "kill", stats.pid, stats.kill_time, 0, None))
+
+    def get_events(self):
+        pid = os.getpid()
+        events = []
+        for tid, name in list(self._names.items()):
+            events.append(
+                {
+                    "ph": "M",
+                    "name": "thread_name",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+            )
+        for ph, name, tid, t, dur, args in list(self._events):
+            event = {"ph": ph, "name": name, "pid": pid, "tid": tid, "ts": t * 1e6}
+            if ph == "X":
+                event["dur"] = dur * 1e6
+            elif ph == "i":
+                event["s"] = "t"
+            if args:
+                event["args"] = args
+            events.append(event)
+        return events
+
+
+_tracer = None
+
+
+def start_tracing(max_events=100000):
+    """
+    Start recording a timeline of the ffmpeg processes that are started by
+    imageio-ffmpeg (in all threads): when each process is spawned, how long
+    it took for the header to arrive, how long each frame read or write was
+    blocked on the pipe, when ffmpeg was asked to stop or killed, and
+    when it terminated.
+
+    The events are kept in memory in a ring buffer that holds at most
+    max_events events, so that tracing can be left on in long running
+    programs. Calling this function again clears the buffer. Use
+    save_trace() to write the events to a file.
+    """
+    global _tracer
+    stop_tracing()
+    _tracer = Tracer(int(max_events))
+    _tracer.start()
+
+
+def stop_tracing():
+    """
+    Stop recording events. The events recorded so far are kept, so they
+    can still be obtained with get_trace_events() or save_trace().
+    """
+    if _tracer is not None:
+        _tracer.stop()
+
+
+def get_trace_events():
+    """
+    Get the recorded events as a list of dicts in the Chrome Trace Event
+    format. Timestamps are in microseconds (based on time.perf_counter()).
+    Each ffmpeg process is shown as a separate thread.
+    """
+    if _tracer is None:
+        return []
+    return _tracer.get_events()
+
+
+def save_trace(filename):
+    """
+    Save the recorded events to a JSON file, which can be loaded in
+    Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+    """
+    data = {"traceEvents": get_trace_events(), "displayTimeUnit": "ms"}
+    with open(filename, "w") as f:
+        json.dump(data, f)
@@ -0,0 +1,381 @@
+import functools
+import os
+import pathlib
+import re
+import secrets
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ._hooks import emit
+from ._io import _get_aligned_size, _get_codec_params, _probe_files
+from ._scheduler import _get_cpus, acquire_process_slot
+from ._stats import ProcessStats
+from ._utils import _popen_kwargs, get_ffmpeg_exe, logger
+
+# The keys that a job given to transcode_batch() can have
+_JOB_KEYS = {
+    "path",
+    "out",
+    "size",
+    "pix_fmt_out",
+    "fps",
+    "quality",
+    "bitrate",
+    "codec",
+    "macro_block_size",
+    "audio_codec",
+    "ffmpeg_log_level",
+    "ffmpeg_timeout",
+    "input_params",
+    "output_params",
+}
+
+# The lines that ffmpeg writes with -progress are key=value pairs
+_PROGRESS_LINE = re.compile(rb"^(\w+)=(\S*)$")
+
+
+def _check_job(job):
+    """Check a job given to transcode_batch(), and turn it into a dict."""
+    if isinstance(job, (tuple, list)):
+        assert len(job) == 2, "A job must be a (path, out) tuple or a dict"
+        job = {"path": job[0], "out": job[1]}
+    assert isinstance(job, dict), "A job must be a (path, out) tuple or a dict"
+    job = job.copy()
+    invalid = set(job).difference(_JOB_KEYS)
+    assert not invalid, "Invalid job keys: {}".format(invalid)
+    for key in ("path", "out"):
+        if isinstance(job.get(key), pathlib.PurePath):
+            job[key] = str(job[key])
+        if not isinstance(job.get(key), str):
+            raise TypeError("Job {} must be a string or pathlib.Path.".format(key))
+    if job.get("quality") is not None:
+        quality = job["quality"]
+        assert 1 <= quality <= 10, "quality must be between 1 and 10 inclusive"
+    for key in ("input_params", "output_params"):
+        if job.get(key) is not None:
+            assert isinstance(job[key], list), "{} must be a list".format(key)
+    return job
+
+
+def _get_transcode_cmd(job, meta, thread_params, out):
+    """Get the ffmpeg command for a job, writing to the given filename."""
+    input_params = job.get("input_params") or []
+    output_params = job.get("output_params") or []
+
+    cmd = [get_ffmpeg_exe(), "-y", "-hide_banner"]
+    if "-threads" not in input_params:
+        cmd += thread_params  # for the decoder
+    cmd += input_params + ["-i", job["path"]]
+    cmd += _get_codec_params(
+        job["out"],
+        job.get("codec"),
+        job.get("pix_fmt_out") or "yuv420p",
+        job.get("quality", 5),
+        job.get("bitrate"),
+    )
+
+    # Scale to the given size, aligned to the macro_block_size like write_frames()
+    size = job.get("size")
+    if size is None and meta is not None:
+        size = meta["size"]
+    if size is not None:
+        out_size = _get_aligned_size(size, job.get("macro_block_size") or 16)
+        if meta is None or tuple(out_size) != tuple(meta["size"]):
+            cmd += ["-vf", "scale={}:{}".format(*out_size)]
+    if job.get("fps"):
+        cmd += ["-r", "{:.02f}".format(job["fps"])]
+    if job.get("audio_codec") is not None:
+        cmd += ["-acodec", job["audio_codec"]]
+    if "-threads" not in output_params:
+        cmd += thread_params  # for the encoder
+    cmd += ["-v", job.get("ffmpeg_log_level") or "warning"]
+    cmd += ["-nostats", "-progress", "pipe:1"]
+    cmd += output_params + [out]
+    return cmd
+
+
+def _run_job(job, meta, threads, progress=None):
+    """Run a single transcode job (one attempt). Returns (ok, info), with
+    info a dict with the returncode, wall_time, nframes and error.
+    """
+    # Write to a temporary file next to the output, so that an output file
+    # is either complete or absent. The file is created by ffmpeg, so that
+    # it gets the same permissions as when ffmpeg writes the output itself.
+    head, tail = os.path.split(os.path.abspath(job["out"]))
+    root, ext = os.path.splitext(tail)
+    tmp = os.path.join(head, ".{}.{}{}".format(root, secrets.token_hex(6), ext))
+
+    info = {"returncode": None, "wall_time": None, "nframes": 0, "error": None}
+    try:
+        slot = acquire_process_slot()
+        try:
+            if threads:
+                thread_params = ["-threads", str(threads)]
+            else:
+                thread_params = slot.thread_params([])
+            cmd = _get_transcode_cmd(job, meta, thread_params, tmp)
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                **_popen_kwargs()
+            )
+            slot.apply_affinity(process.pid)
+            stats = ProcessStats("transcode", cmd, process)
+            emit("spawn", stats)
+
+            timer = None
+            if job.get("ffmpeg_timeout"):
+
+                def kill():
+                    stats.set_stop_policy("kill")
+                    process.kill()
+
+                timer = threading.Timer(job["ffmpeg_timeout"], kill)
+                timer.daemon = True
+                timer.start()
+
+            # The progress and log messages arrive on the same pipe
+            log = deque(maxlen=32)
+            seconds = 0
+            try:
+                for line in process.stdout:
+                    line = line.rstrip(b"\r\n")
+                    m = _PROGRESS_LINE.match(line)
+                    if m is None:
+                        log.append(line.decode(errors="ignore"))
+                        continue
+                    key, value = m.group(1), m.group(2)
+                    if key == b"frame":
+                        stats.nframes = info["nframes"] = int(value)
+                    elif key == b"out_time_us" and value.isdigit():
+                        seconds = int(value) / 1e6
+                    elif key == b"progress" and progress is not None:
+                        progress(stats.nframes, seconds)
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                process.stdout.close()
+                if timer is not None:
+                    timer.cancel()
+                stats.finish()
+        finally:
+            slot.release()
+
+        info["returncode"] = stats.returncode
+        info["wall_time"] = stats.wall_time
+        if stats.returncode:
+            if stats.stop_policy == "kill":
+                log.append("Killed after {} s.".format(job["ffmpeg_timeout"]))
+            info["error"] = "FFMPEG call failed with {}:\n{}".format(
+                stats.returncode, "\n".join(log)
+            )
+            emit("error", stats, RuntimeError(info["error"]))
+        else:
+            os.replace(tmp, job["out"])
+    except Exception as err:
+        info["error"] = str(err)
+    finally:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+    return info["error"] is None, info
+
+
+def transcode(
+    path,
+    out,
+    size=None,
+    pix_fmt_out="yuv420p",
+    fps=None,
+    quality=5,
+    bitrate=None,
+    codec=None,
+    macro_block_size=16,
+    audio_codec=None,
+    ffmpeg_log_level="warning",
+    ffmpeg_timeout=None,
+    input_params=None,
+    output_params=None,
+    progress=None,
+):
+    """
+    Transcode a video file into another video file, in a single ffmpeg
+    process, without passing the frames through Python. The codec and
+    compression are selected like in write_frames(), and the output is
+    scaled to the given size (by default the size of the input), aligned
+    to the macro_block_size. The audio is re-encoded for the output
+    format, unless audio_codec is given (e.g. "copy").
+
+    The output is written to a temporary file next to it, which is renamed
+    when ffmpeg is done. So if transcoding fails, there is no partial output.
+
+    Returns a dict with the returncode, wall_time and nframes of the
+    ffmpeg process. Raises a RuntimeError if transcoding fails.
+
+    Parameters:
+        path (str): the filename of the file to read from.
+        out (str): the filename to write to.
+        size (tuple): the width and height of the output. Default None
+            (the size of the input).
+        pix_fmt_out (str): the pixel format to store frames. Default yuv420p".
+        fps (float): The frames per second. Default None (same as the input).
+        quality (float): A measure for quality between 0 and 10. Default 5.
+            Ignored if bitrate is given.
+        bitrate (str): The bitrate, e.g. "192k".
+        codec (str): The codec. Default "libx264" for .mp4 (if available from
+            the ffmpeg executable) or "msmpeg4" for .wmv.
+        macro_block_size (int): the alignment of the output size. Default 16.
+        audio_codec (str): The audio codec, e.g. "copy". Default None.
+        ffmpeg_log_level (str): The ffmpeg logging level. Default "warning".
+        ffmpeg_timeout (float): Timeout in seconds after which ffmpeg is
+            killed. Default None (wait forever).
+        input_params (list): Additional ffmpeg input command line parameters.
+        output_params (list): Additional ffmpeg output command line parameters.
+        progress (callable): Function that is called with the number of
+            frames and seconds that have been written, about twice a second.
+    """
+    job = _check_job(
+        {
+            "path": path,
+            "out": out,
+            "size": size,
+            "pix_fmt_out": pix_fmt_out,
+            "fps": fps,
+            "quality": quality,
+            "bitrate": bitrate,
+            "codec": codec,
+            "macro_block_size": macro_block_size,
+            "audio_codec": audio_codec,
+            "ffmpeg_log_level": ffmpeg_log_level,
+            "ffmpeg_timeout": ffmpeg_timeout,
+            "input_params": input_params,
+            "output_params": output_params,
+        }
+    )
+    meta = _probe_files([job["path"]])[0]
+    ok, info = _run_job(job, meta, None, progress)
+    if not ok:
+        raise RuntimeError(info["error"])
+    return info
+
+
+def transcode_batch(jobs, workers=None, retries=1, progress=None, **kwargs):
+    """
+    Transcode many video files, running multiple ffmpeg processes at the
+    same time, so that the available CPU's are used well.
+
+    Each job is a (path, out) tuple, or a dict with the keys "path" and
+    "out", and optionally any of the other arguments of transcode(). The
+    given kwargs are the defaults for all jobs:
+
+        results = transcode_batch(
+            [(f, f[:-4] + "_small.mp4") for f in filenames],
+            size=(640, 360),
+            quality=6,
+        )
+        failed = [r for r in results if not r["ok"]]
+
+    Running multiple files in parallel scales much better than giving a
+    single ffmpeg more threads. So by default as many processes as there
+    are CPU's are run, with one thread each. When fewer jobs than workers
+    are left (at the end of the batch), each new process gets a fair
+    share of the idle CPU's. The jobs are started longest first (as far
+    as the duration and frame size of the inputs are known), so that
+    the batch does not end with a single long job.
+
+    A failed job is retried the given number of times. Errors do not stop
+    the batch; the result of each job is returned instead. This is a list
+    of dicts (in the order of the jobs), with the keys:
+
+    * path, out: the input and output filename.
+    * ok: whether the job succeeded.
+    * attempts: the number of times ffmpeg was run.
+    * threads: the number of threads ffmpeg used (in the last attempt).
+    * returncode, wall_time, nframes: of the last ffmpeg process.
+    * duration: the duration of the input (0 if not known).
+    * error: the error message, or None.
+
+    Parameters:
+        jobs (list): the jobs, (path, out) tuples or dicts.
+        workers (int): the number of files to transcode at the same time.
+            Default the number of CPU's.
+        retries (int): the number of times to retry a failed job. Default 1.
+        progress (callable): Function that is called with the index of
+            a job, the number of frames and the number of seconds that have
+            been written, about twice a second per running job.
+        kwargs: default arguments for each job (see transcode()).
+    """
+    invalid = set(kwargs).difference(_JOB_KEYS)
+    assert not invalid, "Invalid arguments: {}".format(invalid)
+    jobs = [_check_job(dict(kwargs, **_check_job(job))) for job in jobs]
+    ncpus = len(_get_cpus())
+    workers = min(int(workers or ncpus), len(jobs))
+    retries = int(retries)
+    assert retries >= 0, "retries must not be negative"
+    if not jobs:
+        return []
+
+    metas = _probe_files([job["path"] for job in jobs])
+    results = []
+    for job, meta in zip(jobs, metas):
+        result = {"path": job["path"], "out": job["out"], "ok": False}
+        result.update(attempts=0, threads=None, returncode=None, wall_time=None)
+        result.update(nframes=0, duration=meta["duration"] if meta else 0)
+        result["error"] = None
+        results.append(result)
+
+    # Longest job first: the amount of work is about the number of pixels
+    def cost(i):
+        meta = metas[i]
+        if meta is None:
+            return 0
+        return meta["duration"] * meta["size"][0] * meta["size"][1]
+
+    queue = deque(sorted(range(len(jobs)), key=cost, reverse=True))
+    lock = threading.Lock()
+    state = {"remaining": len(jobs)}  # jobs that are queued or running
+
+    def work():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                i = queue.popleft()
+                threads = max(1, ncpus // min(workers, state["remaining"]))
+            job_progress = None
+            if progress is not None:
+                job_progress = functools.partial(progress, i)
+            result = results[i]
+            result["threads"] = threads
+            while result["attempts"] <= retries:
+                result["attempts"] += 1
+                ok, info = _run_job(jobs[i], metas[i], threads, job_progress)
+                result.update(info, ok=ok)
+                if ok:
+                    break
+                logger.warning(
+                    "Transcoding {} failed (attempt {}): {}".format(
+                        result["path"], result["attempts"], info["error"]
+                    )
+                )
+            with lock:
+                state["remaining"] -= 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(workers, "imageio_ffmpeg_transcode") as pool:
+        futures = [pool.submit(work) for _ in range(workers)]
+        for future in futures:
+            future.result()
+
+    nfailed = sum(not result["ok"] for result in results)
+    logger.info(
+        "Transcoded {} of {} files in {:.1f} s ({} failed).".format(
+            len(results) - nfailed, len(results), time.perf_counter() - t0, nfailed
+        )
+    )
+    return results
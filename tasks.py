@@ -14,7 +14,13 @@ from invoke import task
 
 NAME = "imageio-ffmpeg"
 LIBNAME = NAME.replace("-", "_")
-PY_PATHS = [LIBNAME, "tests", "tasks.py", "setup.py"]  # for linting/formatting
+PY_PATHS = [
+    LIBNAME,
+    "tests",
+    "benchmarks",
+    "tasks.py",
+    "setup.py",
+]  # for linting/formatting
 
 # ----------------------------------------
 
@@ -37,6 +43,17 @@ def test(ctx, cover=False):
         webbrowser.open(os.path.join(ROOT_DIR, "htmlcov", "index.html"))
 
 
+@task
+def benchmark(ctx, quick=False, output="benchmark_results.json"):
+    """Run the benchmarks. Use --quick for a small corpus."""
+    cmd = [sys.executable, os.path.join("benchmarks", "bench.py"), "--output", output]
+    if quick:
+        cmd.append("--quick")
+    ret_code = subprocess.call(cmd, cwd=ROOT_DIR)
+    if ret_code:
+        sys.exit(ret_code)
+
+
 @task
 def lint(ctx):
     """Validate the code style (e.g. undefined names)"""
@@ -241,8 +258,37 @@ def update_readme(ctx):
 
     for func in (
         imageio_ffmpeg.read_frames,
+        imageio_ffmpeg.read_audio,
+        imageio_ffmpeg.read_frames_with_audio,
+        imageio_ffmpeg.read_clips,
+        imageio_ffmpeg.ClipSampler,
+        imageio_ffmpeg.read_windows,
+        imageio_ffmpeg.SharedFrameReader,
+        imageio_ffmpeg.SharedFrame,
+        imageio_ffmpeg.cache_frames,
+        imageio_ffmpeg.FrameCache,
+        imageio_ffmpeg.LRUFrameCache,
+        imageio_ffmpeg.read_rawvideo,
+        imageio_ffmpeg.write_rawvideo,
+        imageio_ffmpeg.RawVideo,
         imageio_ffmpeg.write_frames,
+        imageio_ffmpeg.copy_frames,
+        imageio_ffmpeg.trim,
+        imageio_ffmpeg.concat,
+        imageio_ffmpeg.remux,
+        imageio_ffmpeg.transcode,
+        imageio_ffmpeg.transcode_batch,
+        imageio_ffmpeg.autotune_encoder,
         imageio_ffmpeg.count_frames_and_secs,
+        imageio_ffmpeg.set_process_limit,
+        imageio_ffmpeg.add_stats_callback,
+        imageio_ffmpeg.remove_stats_callback,
+        imageio_ffmpeg.add_hook,
+        imageio_ffmpeg.remove_hook,
+        imageio_ffmpeg.start_tracing,
+        imageio_ffmpeg.stop_tracing,
+        imageio_ffmpeg.get_trace_events,
+        imageio_ffmpeg.save_trace,
         imageio_ffmpeg.get_ffmpeg_exe,
         imageio_ffmpeg.get_ffmpeg_version,
     ):
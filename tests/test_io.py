@@ -2,6 +2,15 @@
 The main tests for the public API.
 """
 
+import array
+import io
+import json
+import math
+import os
+import shutil
+import stat
+import subprocess
+import sys
 import tempfile
 import time
 import types
@@ -23,6 +32,7 @@ from imageio_ffmpeg._io import (
     get_compiled_h264_encoders,
     get_first_available_h264_encoder,
 )
+from imageio_ffmpeg._pipes import requires_seeking
 
 
 def setup_module():
@@ -176,6 +186,655 @@ def test_reading_invalid_video():
     assert end - start < 1, "Metadata extraction hangs"
 
 
+@no_warnings_allowed
+def test_reading_from_data():
+    # Write a video with the moov atom at the start, so it can be streamed
+    gen = imageio_ffmpeg.write_frames(
+        test_file2, (64, 64), output_params=["-movflags", "+faststart"]
+    )
+    gen.send(None)  # seed
+    for i in range(9):
+        gen.send(bytes([min(255, 100 + i * 10)] * 64 * 64 * 3))
+    gen.close()
+    with open(test_file2, "rb") as f:
+        data = f.read()
+    assert not requires_seeking(data)
+
+    class NonSeekable(io.RawIOBase):
+        def __init__(self, data):
+            self._f = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, b):
+            return self._f.readinto(b)
+
+    for source in [
+        data,
+        memoryview(data),
+        io.BytesIO(data),
+        NonSeekable(data),
+        open(test_file2, "rb"),
+    ]:
+        gen = imageio_ffmpeg.read_frames(source)
+        meta = gen.__next__()
+        assert meta["size"] == (64, 64)
+        count = 0
+        for frame in gen:
+            assert len(frame) == 64 * 64 * 3
+            count += 1
+        assert count == 9
+
+    nframes, nsecs = imageio_ffmpeg.count_frames_and_secs(data)
+    assert nframes == 9
+
+    # Closing early stops the feeder too
+    gen = imageio_ffmpeg.read_frames(data)
+    gen.__next__()  # == meta
+    gen.__next__()
+    gen.close()
+
+    with raises(TypeError):
+        imageio_ffmpeg.read_frames(42).__next__()
+
+
+@no_warnings_allowed
+def test_reading_from_data_requiring_seeking():
+    # By default, ffmpeg writes the moov atom at the end: use a temp file instead
+    gen = imageio_ffmpeg.write_frames(test_file2, (64, 64))
+    gen.send(None)  # seed
+    for i in range(9):
+        gen.send(bytes([min(255, 100 + i * 10)] * 64 * 64 * 3))
+    gen.close()
+    with open(test_file2, "rb") as f:
+        data = f.read()
+    assert requires_seeking(data)
+    assert requires_seeking(io.BytesIO(data))
+
+    gen = imageio_ffmpeg.read_frames(data)
+    meta = gen.__next__()
+    assert meta["size"] == (64, 64)
+    assert len(list(gen)) == 9
+    nframes, nsecs = imageio_ffmpeg.count_frames_and_secs(io.BytesIO(data))
+    assert nframes == 9
+
+
+@no_warnings_allowed
+def test_reading_scales():
+    if sys.platform.startswith("win"):
+        skip("Reading multiple scales is not supported on Windows")
+
+    gen = imageio_ffmpeg.read_frames(test_file3, scales=[1, 0.5, (100, 50)])
+    meta = gen.__next__()
+    sizes = [(320, 240), (160, 120), (100, 50)]
+    assert meta["size"] == sizes[0]
+    assert meta["sizes"] == sizes
+    count = 0
+    for levels in gen:
+        assert isinstance(levels, tuple)
+        assert [len(level) for level in levels] == [w * h * 3 for w, h in sizes]
+        count += 1
+    assert count == 36
+
+    # Closing early
+    gen = imageio_ffmpeg.read_frames(test_file1, scales=[1, 0.25])
+    gen.__next__()  # == meta
+    gen.__next__()
+    t0 = time.perf_counter()
+    gen.close()
+    assert time.perf_counter() - t0 < 1
+
+
+@no_warnings_allowed
+def test_read_audio():
+    gen = imageio_ffmpeg.read_audio(test_file3, chunk_size=1000)
+    assert isinstance(gen, types.GeneratorType)
+    meta = gen.__next__()
+    assert meta["codec"] == "aac"
+    assert meta["sample_rate"] == 44100
+    assert meta["channels"] == 1
+    assert meta["sample_fmt"] == "s16" and meta["dtype"] == "<i2"
+    chunks = list(gen)
+    assert all(len(chunk) == 2000 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 2000
+    nsamples = sum(len(chunk) for chunk in chunks) // 2
+    assert 1.4 < nsamples / 44100 < 1.6
+
+    # Resample, mix, convert, and read a part
+    gen = imageio_ffmpeg.read_audio(
+        test_file3, sample_rate=8000, channels=2, sample_fmt="f32", start=0.5, end=1
+    )
+    meta = gen.__next__()
+    assert meta["sample_rate"] == 8000 and meta["channels"] == 2
+    assert meta["dtype"] == "<f4"
+    nsamples = sum(len(chunk) for chunk in gen) // (4 * 2)
+    assert 3900 < nsamples <= 4000
+
+    # Closing early
+    gen = imageio_ffmpeg.read_audio(test_file3, chunk_size=100)
+    gen.__next__()  # == meta
+    gen.__next__()
+    gen.close()
+
+    # No audio stream
+    with raises(IOError):
+        imageio_ffmpeg.read_audio(test_file1).__next__()
+
+
+@no_warnings_allowed
+def test_read_frames_with_audio():
+    if sys.platform.startswith("win"):
+        skip("Reading audio with video is not supported on Windows")
+
+    gen = imageio_ffmpeg.read_frames_with_audio(test_file3)
+    meta = gen.__next__()
+    assert meta["size"] == (320, 240) and meta["fps"] == 24
+    assert meta["sample_rate"] == 44100 and meta["channels"] == 1
+    assert meta["audio_codec"] == "aac"
+    items = list(gen)
+    assert len(items) == 36
+    for frame, samples in items:
+        assert len(frame) == 320 * 240 * 3
+        assert abs(len(samples) - 2 * 44100 / 24) <= 2
+    assert sum(len(samples) for _, samples in items) == 2 * 44100 * 3 // 2
+
+    # Much more audio than video data per frame, which must not deadlock
+    gen = imageio_ffmpeg.read_frames_with_audio(
+        test_file3,
+        sample_rate=192000,
+        channels=8,
+        sample_fmt="f64",
+        output_params=["-r", "2"],
+    )
+    gen.__next__()  # == meta
+    sizes = [len(samples) for _, samples in gen]
+    assert sizes[:3] == [192000 // 2 * 8 * 8] * 3
+
+    # Closing early
+    gen = imageio_ffmpeg.read_frames_with_audio(test_file3)
+    gen.__next__()  # == meta
+    gen.__next__()
+    gen.close()
+
+    # No audio stream
+    with raises(IOError):
+        imageio_ffmpeg.read_frames_with_audio(test_file1).__next__()
+
+
+def test_read_timestamps():
+    if sys.platform.startswith("win"):
+        skip("Reading timestamps is not supported on Windows")
+
+    # Create a video with 5 frames at 10 fps, followed by 5 frames at 2 fps
+    filename = os.path.join(test_dir, "vfr.mkv")
+    cmd = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-v", "error"]
+    cmd += ["-f", "lavfi", "-i", "testsrc2=size=64x48:rate=10", "-frames:v", "10"]
+    cmd += ["-vf", "setpts=if(lt(N\\,5)\\,N\\,5*N-20)", "-fps_mode", "passthrough"]
+    subprocess.run(cmd + [filename], check=True)
+
+    gen = imageio_ffmpeg.read_frames(filename, timestamps=True)
+    gen.__next__()  # == meta
+    items = list(gen)
+    assert len(items) == 10
+    assert all(len(frame) == 64 * 48 * 3 for frame, _, _ in items)
+    pts = [round(pts, 3) for _, pts, _ in items]
+    assert pts == [0, 0.1, 0.2, 0.3, 0.4, 0.5, 1.0, 1.5, 2.0, 2.5]
+    durations = [round(duration, 3) for _, _, duration in items]
+    assert durations == [0.1] * 5 + [0.5] * 5
+
+    # Constant frame rate, combined with scales
+    gen = imageio_ffmpeg.read_frames(test_file3, timestamps=True, scales=[1, 0.5])
+    gen.__next__()  # == meta
+    items = list(gen)
+    assert len(items) == 36
+    for i, (levels, pts, duration) in enumerate(items):
+        assert len(levels) == 2
+        assert abs(pts - i / 24) < 1e-6 and abs(duration - 1 / 24) < 1e-6
+
+    # Closing early
+    gen = imageio_ffmpeg.read_frames(test_file1, timestamps=True)
+    gen.__next__()  # == meta
+    gen.__next__()
+    gen.close()
+
+
+def test_read_clips():
+    # Clips of different lengths, and a clip with a different size
+    filenames = []
+    for i, (nframes, size) in enumerate([(3, 64), (4, 64), (5, 64), (4, 80)]):
+        filenames.append(os.path.join(test_dir, "clip{}.mp4".format(i)))
+        gen = imageio_ffmpeg.write_frames(filenames[-1], (size, 64), fps=10)
+        gen.send(None)  # seed
+        for j in range(nframes):
+            gen.send(bytes([i * 50 + j * 10] * size * 64 * 3))
+        gen.close()
+
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        gen = imageio_ffmpeg.read_clips(filenames + filenames[:1])
+        metas = gen.__next__()
+        items = list(gen)
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+
+    assert [meta["size"] for meta in metas] == [(64, 64)] * 3 + [(80, 64), (64, 64)]
+    assert [(i, j) for i, j, _ in items] == (
+        [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2), (1, 3)]
+        + [(2, j) for j in range(5)]
+        + [(3, j) for j in range(4)]
+        + [(4, 0), (4, 1), (4, 2)]
+    )
+    for i, j, frame in items:
+        w = metas[i]["size"][0]
+        assert len(frame) == w * 64 * 3
+        assert abs(frame[0] - (i % 4) * 50 - j * 10) < 5
+
+    # One process to probe the files
+    kinds = [stats.kind for stats in collected]
+    assert kinds[0] == "probe" and "probe" not in kinds[1:]
+    if not sys.platform.startswith("win"):
+        # The first three files are read with one process
+        assert kinds[1:] == ["read"] * 3
+        assert collected[1].nframes == 12
+
+    # Files that cannot be read
+    gen = imageio_ffmpeg.read_clips([filenames[0], test_file1 + ".nope"])
+    assert gen.__next__()[1] is None
+    with raises(IOError):
+        list(gen)
+
+
+def test_read_windows():
+    # A gray ramp, so that each frame can be identified by its value
+    filename = os.path.join(test_dir, "ramp.avi")
+    gen = imageio_ffmpeg.write_frames(
+        filename, (16, 16), pix_fmt_in="gray", pix_fmt_out="gray", codec="rawvideo"
+    )
+    gen.send(None)  # seed
+    for i in range(10):
+        gen.send(bytes([i * 10] * 16 * 16))
+    gen.close()
+
+    for window_size, step in [(1, 1), (3, 1), (4, 3), (10, 1), (11, 1)]:
+        gen = imageio_ffmpeg.read_windows(
+            filename, window_size, step, pix_fmt="gray", bits_per_pixel=8
+        )
+        assert gen.__next__()["size"] == (16, 16)
+        starts = []
+        for window in gen:
+            assert window.shape == (window_size, 16, 16, 1)
+            values = [window[t, 0, 0, 0] // 10 for t in range(window_size)]
+            assert values == list(range(values[0], values[0] + window_size))
+            assert bytes(window)[-256:] == bytes([values[-1] * 10] * 256)
+            starts.append(values[0])
+        assert starts == list(range(0, 10 - window_size + 1, step))
+
+    # Other bit depths give a flat view
+    gen = imageio_ffmpeg.read_windows(filename, 2, pix_fmt="yuv420p", bits_per_pixel=12)
+    gen.__next__()
+    window = gen.__next__()
+    assert window.shape == (2 * 16 * 16 * 3 // 2,)
+    gen.close()
+
+
+def test_cache_frames():
+    filename = os.path.join(test_dir, "ramp.avi")
+    gen = imageio_ffmpeg.write_frames(
+        filename, (16, 16), pix_fmt_in="gray", pix_fmt_out="gray", codec="rawvideo"
+    )
+    gen.send(None)  # seed
+    for i in range(10):
+        gen.send(bytes([i * 10] * 16 * 16))
+    gen.close()
+    cache_dir = os.path.join(test_dir, "cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        kwargs = dict(pix_fmt="gray", bits_per_pixel=8, cache_dir=cache_dir)
+        for _ in range(2):
+            with imageio_ffmpeg.cache_frames(filename, **kwargs) as cache:
+                assert len(cache) == cache.meta["nframes"] == 10
+                assert cache.meta["size"] == (16, 16)
+                assert cache.shape == (10, 16, 16, 1)
+                assert bytes(cache[3]) == bytes([30] * 256)
+                assert bytes(cache[-1]) == bytes([90] * 256)
+                with raises(IndexError):
+                    cache[10]
+                with open(cache.filename, "rb") as f:
+                    f.seek(cache.offset + 256 * 5)
+                    assert f.read(256) == bytes([50] * 256)
+        # Decoded only once
+        assert len(collected) == 1
+
+        # Other args give another cache file, the oldest one is evicted
+        with imageio_ffmpeg.cache_frames(filename, **kwargs) as cache:
+            first = cache.filename
+        with imageio_ffmpeg.cache_frames(
+            filename, "rgb24", max_bytes=16 * 16 * 50, cache_dir=cache_dir
+        ) as cache:
+            assert bytes(cache[2])[:3] == bytes([20, 20, 20])
+        assert len(collected) == 2
+        assert not os.path.isfile(first)
+        assert os.listdir(cache_dir) == [os.path.basename(cache.filename)]
+
+        # A modified file is decoded again
+        os.utime(filename, ns=(0, 0))
+        imageio_ffmpeg.cache_frames(filename, **kwargs).close()
+        assert len(collected) == 3
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+
+
+def test_lru_frame_cache():
+    filename = os.path.join(test_dir, "ramp40.mp4")
+    gen = imageio_ffmpeg.write_frames(filename, (16, 16), fps=10, quality=10)
+    gen.send(None)  # seed
+    for i in range(40):
+        gen.send(bytes([i * 5] * 16 * 16 * 3))
+    gen.close()
+
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        cache = imageio_ffmpeg.LRUFrameCache(prefetch=8)
+        # A miss decodes the frame and its neighbours
+        assert abs(cache.get_frame(filename, 20)[0] - 100) < 3
+        assert len(cache) == 9 and cache.nbytes == 9 * 16 * 16 * 3
+        for i in range(18, 27):
+            assert abs(cache.get_frame(filename, i)[0] - i * 5) < 3
+        assert cache.hits == 9 and cache.misses == 1
+        assert [s.kind for s in collected] == ["probe", "read"]
+        assert abs(cache.get_frame(filename, 0)[0]) < 3
+        assert len(cache) == 18 and cache.misses == 2
+
+        # Frames of another size are cached separately
+        frame = cache.get_frame(filename, 20, "gray", 8, size=(8, 8))
+        assert len(frame) == 64 and abs(frame[0] - 100) < 5
+        assert cache.misses == 3
+
+        with raises(IndexError):
+            cache.get_frame(filename, 45)
+
+        # The least recently used frames are evicted
+        cache = imageio_ffmpeg.LRUFrameCache(16 * 16 * 3 * 4, prefetch=8)
+        assert abs(cache.get_frame(filename, 30)[0] - 150) < 3
+        assert len(cache) == 4 and cache.evictions == 5
+        assert abs(cache.get_frame(filename, 30)[0] - 150) < 3
+        assert cache.hits == 1
+        cache.clear()
+        assert len(cache) == cache.nbytes == cache.hits == 0
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+
+
+def test_rawvideo():
+    # A Y4M file written by ffmpeg
+    filename = os.path.join(test_dir, "ramp.y4m")
+    gen = imageio_ffmpeg.write_frames(
+        filename,
+        (18, 10),
+        codec="wrapped_avframe",
+        pix_fmt_out="yuv420p",
+        fps=25,
+        macro_block_size=1,
+    )
+    gen.send(None)  # seed
+    for i in range(5):
+        gen.send(bytes([i * 40] * 18 * 10 * 3))
+    gen.close()
+    gen = imageio_ffmpeg.read_frames(filename, pix_fmt="yuv420p", bits_per_pixel=12)
+    gen.__next__()
+    expected = list(gen)
+    assert len(expected[0]) == 18 * 10 * 3 // 2
+
+    gen = imageio_ffmpeg.read_rawvideo(filename)
+    meta = gen.__next__()
+    assert meta["size"] == (18, 10) and meta["fps"] == 25
+    assert meta["pix_fmt"] == "yuv420p" and meta["nframes"] == 5
+    assert [bytes(frame) for frame in gen] == expected
+
+    with imageio_ffmpeg.RawVideo(filename) as video:
+        assert len(video) == 5
+        assert bytes(video[-2]) == expected[3]
+        with raises(IndexError):
+            video[5]
+
+    # Write Y4M and headerless raw video, read it back with ffmpeg and natively
+    for ext in (".y4m", ".yuv"):
+        filename2 = os.path.join(test_dir, "ramp2" + ext)
+        gen = imageio_ffmpeg.write_rawvideo(filename2, (18, 10), fps=30000 / 1001)
+        gen.send(None)  # seed
+        for frame in expected:
+            gen.send(frame)
+        with raises(ValueError):
+            gen.send(b"x")
+        gen.close()
+
+        input_params = []
+        if ext == ".yuv":
+            input_params = ["-f", "rawvideo", "-s", "18x10", "-pix_fmt", "yuv420p"]
+        gen = imageio_ffmpeg.read_frames(
+            filename2, "yuv420p", input_params=input_params, bits_per_pixel=12
+        )
+        meta = gen.__next__()
+        assert list(gen) == expected
+        if ext == ".y4m":
+            assert abs(meta["fps"] - 29.97) < 0.01
+
+        gen = imageio_ffmpeg.read_rawvideo(filename2, (18, 10), "yuv420p")
+        assert gen.__next__()["nframes"] == 5
+        assert [bytes(frame) for frame in gen] == expected
+
+    # Chroma planes are rounded up for odd sizes
+    gen = imageio_ffmpeg.write_rawvideo(filename2, (17, 9), "yuv420p")
+    gen.send(None)  # seed
+    gen.send(bytes(17 * 9 + 2 * 9 * 5))
+    gen.close()
+    assert len(imageio_ffmpeg.RawVideo(filename2, (17, 9), "yuv420p")) == 1
+
+    with raises(ValueError):
+        imageio_ffmpeg.write_rawvideo(filename2, (18, 10), "rgb24", y4m=True).send(None)
+
+
+def test_copy_frames():
+    collected = []
+    progress = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        meta = imageio_ffmpeg.copy_frames(
+            test_file3,
+            test_file2,
+            reader={"pix_fmt": "yuv420p", "bits_per_pixel": 12},
+            writer={"pix_fmt_out": "yuv420p", "macro_block_size": 1},
+            progress=progress.append,
+        )
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+
+    assert meta["nframes"] == 36
+    assert progress == sorted(set(progress)) and progress[-1] == 36
+    assert sorted(stats.kind for stats in collected) == ["read", "write"]
+    for stats in collected:
+        assert stats.nframes == 36
+        assert stats.bytes_piped == 36 * 320 * 240 * 3 // 2
+
+    gen = imageio_ffmpeg.read_frames(test_file2)
+    meta2 = gen.__next__()
+    assert meta2["size"] == meta["size"] and meta2["fps"] == meta["fps"]
+    assert len(list(gen)) == 36
+
+
+def test_trim_concat_remux():
+    # A ramp with a keyframe every 10 frames
+    filename = os.path.join(test_dir, "ramp_g10.mp4")
+    gen = imageio_ffmpeg.write_frames(
+        filename, (32, 32), fps=20, output_params=["-g", "10", "-sc_threshold", "0"]
+    )
+    gen.send(None)  # seed
+    for i in range(60):
+        gen.send(bytes([i * 4] * 32 * 32 * 3))
+    gen.close()
+
+    def get_values(filename):
+        gen = imageio_ffmpeg.read_frames(filename, pix_fmt="gray", bits_per_pixel=8)
+        gen.__next__()
+        return [frame[0] for frame in gen]
+
+    # The start is snapped to a keyframe, the end to a decodable frame
+    out1 = os.path.join(test_dir, "trim1.mp4")
+    start, end = imageio_ffmpeg.trim(filename, 1.32, 2.18, out1)
+    assert start == 1.0 and 2.0 <= end <= 2.2
+    values = get_values(out1)
+    assert len(values) == round((end - start) * 20)
+    assert all(abs(v - (20 + i) * 4) < 3 for i, v in enumerate(values))
+
+    # A smart cut is exact (at the next frame)
+    out2 = os.path.join(test_dir, "trim2.mp4")
+    assert imageio_ffmpeg.trim(filename, 1.32, 2.18, out2, smart=True) == (1.35, 2.2)
+    values = get_values(out2)
+    assert len(values) == 17
+    assert all(abs(v - (27 + i) * 4) < 3 for i, v in enumerate(values))
+
+    with raises(ValueError):
+        imageio_ffmpeg.trim(filename, 2, 1, out2)
+
+    # Joining and remuxing does not change the frames
+    out3 = os.path.join(test_dir, "joined.mp4")
+    imageio_ffmpeg.concat([out1, out2], out3)
+    joined = get_values(out3)
+    assert joined == get_values(out1) + get_values(out2)
+
+    out4 = os.path.join(test_dir, "joined.mkv")
+    imageio_ffmpeg.remux(out3, out4)
+    assert get_values(out4) == joined
+
+    with raises(ValueError):
+        imageio_ffmpeg.concat([out1, test_file1], out3)
+
+
+def test_transcode():
+    # A single file, scaled and aligned to the macro block size
+    out1 = os.path.join(test_dir, "transcoded1.mp4")
+    calls = []
+    info = imageio_ffmpeg.transcode(
+        test_file3, out1, size=(150, 100), progress=lambda *args: calls.append(args)
+    )
+    assert info["returncode"] == 0 and info["nframes"] == 36
+    assert calls and calls[-1][0] == 36 and calls[-1][1] > 1.4
+    gen = imageio_ffmpeg.read_frames(out1)
+    meta = gen.__next__()
+    assert meta["size"] == (160, 112)
+    assert len(list(gen)) == 36
+
+    # The output has the usual permissions, not those of a private temp file
+    if not sys.platform.startswith("win"):
+        umask = os.umask(0)
+        os.umask(umask)
+        os.remove(out1)
+        imageio_ffmpeg.transcode(test_file3, out1)
+        assert stat.S_IMODE(os.stat(out1).st_mode) == 0o666 & ~umask
+
+    # The threads of the process limit are used
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    imageio_ffmpeg.set_process_limit(1, threads=1)
+    try:
+        imageio_ffmpeg.transcode(test_file3, out1)
+    finally:
+        imageio_ffmpeg.set_process_limit(None)
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+    cmd = [stats.cmd for stats in collected if stats.kind == "transcode"][0]
+    assert " ".join(cmd).count("-threads 1 ") == 2
+
+    # A failing job leaves no output
+    out2 = os.path.join(test_dir, "transcoded2.mp4")
+    if os.path.isfile(out2):
+        os.remove(out2)
+    with raises(RuntimeError):
+        imageio_ffmpeg.transcode(test_file3, out2, output_params=["-foo"])
+    assert not os.path.exists(out2)
+    assert [f for f in os.listdir(test_dir) if "transcoded2" in f] == []
+
+    with raises(AssertionError):
+        imageio_ffmpeg.transcode(test_file3, out2, quality=11)
+
+    # A batch, with defaults for all jobs, and a failing job that is retried
+    jobs = [
+        (test_file3, out2),
+        {"path": test_file3, "out": out1, "size": (64, 48), "codec": "mpeg4"},
+        (os.path.join(test_dir, "doesnotexist.mp4"), out2),
+    ]
+    calls = []
+    results = imageio_ffmpeg.transcode_batch(
+        jobs,
+        workers=2,
+        size=(96, 64),
+        progress=lambda *args: calls.append(args),
+    )
+    assert [r["ok"] for r in results] == [True, True, False]
+    assert [r["attempts"] for r in results] == [1, 1, 2]
+    assert results[0]["duration"] > 1.4 and results[2]["duration"] == 0
+    assert results[1]["nframes"] == 36 and results[2]["error"]
+    assert {call[0] for call in calls} == {0, 1}
+    for out, size, codec in [(out2, (96, 64), "h264"), (out1, (64, 48), "mpeg4")]:
+        gen = imageio_ffmpeg.read_frames(out)
+        meta = gen.__next__()
+        gen.close()
+        assert meta["size"] == size and meta["codec"].startswith(codec)
+
+    assert imageio_ffmpeg.transcode_batch([]) == []
+
+
+def test_autotune_encoder():
+    cache_dir = os.path.join(test_dir, "autotune_cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    kwargs = {"families": ["h264"], "cache_dir": cache_dir}
+
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        config = imageio_ffmpeg.autotune_encoder((64, 48), 25, **kwargs)
+        assert config["family"] == "h264" and config["codec"]
+        assert config["bitrate"] == int(0.1 * 64 * 48 * 25)
+        assert config["fps"] >= 25 * 1.25 and config["psnr"] > 10
+        nprocesses = sum(stats.kind == "autotune" for stats in collected)
+        assert nprocesses > 1
+
+        # The result is cached, in memory and on disk
+        assert imageio_ffmpeg.autotune_encoder((64, 48), 25, **kwargs) == config
+        imageio_ffmpeg._autotune._results.clear()
+        assert imageio_ffmpeg.autotune_encoder((64, 48), 25, **kwargs) == config
+        assert os.path.isfile(os.path.join(cache_dir, "autotune.json"))
+        assert sum(stats.kind == "autotune" for stats in collected) == nprocesses
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+
+    # The config can be used to write frames
+    gen = imageio_ffmpeg.write_frames(
+        test_file2,
+        (64, 48),
+        codec=config["codec"],
+        bitrate=config["bitrate"],
+        output_params=config["output_params"],
+    )
+    gen.send(None)  # seed
+    for i in range(10):
+        gen.send(bytes([i * 20] * 64 * 48 * 3))
+    gen.close()
+    assert imageio_ffmpeg.count_frames_and_secs(test_file2)[0] == 10
+
+    # Nothing can keep up with this
+    with raises(RuntimeError):
+        imageio_ffmpeg.autotune_encoder((64, 48), 1e5, duration=0.001, **kwargs)
+
+    with raises(AssertionError):
+        imageio_ffmpeg.autotune_encoder((64, 48), 25, families=["mpeg2"])
+
+
 @no_warnings_allowed
 def test_write1():
     for n in (1, 9, 14, 279, 280, 281):
@@ -203,6 +862,95 @@ def test_write1():
         assert count == n
 
 
+@no_warnings_allowed
+def test_write_to_sink():
+    # Write to a file object, as fragmented mp4 (the default)
+    f = io.BytesIO()
+    gen = imageio_ffmpeg.write_frames(f, (64, 64))
+    gen.send(None)  # seed
+    for i in range(9):
+        gen.send(bytes([min(255, 100 + i * 10)] * 64 * 64 * 3))
+    gen.close()
+    data = f.getvalue()
+    assert data[4:8] == b"ftyp" and b"moof" in data
+    assert imageio_ffmpeg.count_frames_and_secs(data)[0] == 9
+
+    # Write to a callable, in another format
+    chunks = []
+    gen = imageio_ffmpeg.write_frames(
+        chunks.append, (64, 64), codec="mpeg4", output_params=["-f", "matroska"]
+    )
+    gen.send(None)  # seed
+    for i in range(9):
+        gen.send(bytes([min(255, 100 + i * 10)] * 64 * 64 * 3))
+    gen.close()
+    data = b"".join(chunks)
+    meta = imageio_ffmpeg.read_frames(data).__next__()
+    assert meta["codec"] == "mpeg4"
+    assert imageio_ffmpeg.count_frames_and_secs(data)[0] == 9
+
+
+def test_write_to_failing_sink():
+    def sink(chunk):
+        raise ValueError("sink is broken")
+
+    gen = imageio_ffmpeg.write_frames(sink, (64, 64))
+    gen.send(None)  # seed
+    with raises(IOError) as info:
+        for i in range(100):
+            gen.send(bytes([i] * 64 * 64 * 3))
+        gen.close()
+    assert "sink is broken" in str(info.value)
+
+
+def test_write_renditions():
+    filenames = [os.path.join(test_dir, "rendition%i.mp4" % i) for i in range(3)]
+    for fname in filenames:
+        if os.path.isfile(fname):
+            os.remove(fname)
+
+    commands = []
+
+    def on_spawn(stats):
+        commands.append(stats.cmd)
+
+    imageio_ffmpeg.add_hook("spawn", on_spawn)
+    try:
+        gen = imageio_ffmpeg.write_frames(
+            [
+                {"path": filenames[0]},
+                {"path": filenames[1], "size": (64, 48), "bitrate": "200k"},
+                {"path": filenames[2], "size": (30, 20), "codec": "mpeg4"},
+            ],
+            (128, 96),
+        )
+        gen.send(None)  # seed
+        for i in range(9):
+            gen.send(bytes([min(255, 100 + i * 10)] * 128 * 96 * 3))
+        gen.close()
+    finally:
+        imageio_ffmpeg.remove_hook("spawn", on_spawn)
+
+    # One process encoded all renditions
+    assert len(commands) == 1
+    assert "-filter_complex" in commands[0]
+
+    # Sizes are aligned to the macro block size
+    expected = [((128, 96), "h264"), ((64, 48), "h264"), ((32, 32), "mpeg4")]
+    for fname, (size, codec) in zip(filenames, expected):
+        gen = imageio_ffmpeg.read_frames(fname)
+        meta = gen.__next__()
+        gen.close()
+        assert meta["size"] == size
+        assert meta["codec"].startswith(codec)
+        assert imageio_ffmpeg.count_frames_and_secs(fname)[0] == 9
+
+    with raises(TypeError):
+        imageio_ffmpeg.write_frames([{"path": io.BytesIO()}], (64, 64)).send(None)
+    with raises(AssertionError):
+        imageio_ffmpeg.write_frames([{"path": "x.mp4", "foo": 1}], (64, 64)).send(None)
+
+
 @no_warnings_allowed
 def test_write_pix_fmt_in():
     sizes = []
@@ -419,6 +1167,216 @@ def test_write_audio_path():
     assert audio_codec == "aac"
 
 
+@no_warnings_allowed
+def test_write_audio_samples():
+    if sys.platform.startswith("win"):
+        skip("Writing audio samples is not supported on Windows")
+
+    # A 16 fps video with 1000 samples of stereo audio per frame
+    tone = array.array("h", [int(1000 * math.sin(i / 10)) for i in range(1000)])
+    samples = array.array("h", [v for v in tone for _ in range(2)])
+    gen = imageio_ffmpeg.write_frames(
+        test_file2,
+        (64, 64),
+        fps=16,
+        audio_sample_rate=16000,
+        audio_channels=2,
+        audio_codec="aac",
+    )
+    gen.send(None)  # seed
+    for i in range(32):
+        gen.send((bytes([min(255, 100 + i * 5)] * 64 * 64 * 3), samples))
+    gen.send((None, samples))  # only audio
+    gen.close()
+
+    nframes, nsecs = imageio_ffmpeg.count_frames_and_secs(test_file2)
+    assert nframes == 32
+    meta = imageio_ffmpeg.read_frames(test_file2).__next__()
+    assert meta["audio_codec"] == "aac"
+    gen = imageio_ffmpeg.read_audio(test_file2)
+    meta = gen.__next__()
+    assert meta["sample_rate"] == 16000 and meta["channels"] == 2
+    nsamples = sum(len(chunk) for chunk in gen) // 4
+    assert 32000 <= nsamples < 35000
+
+
+@no_warnings_allowed
+def test_write_timestamps():
+    if sys.platform.startswith("win"):
+        skip("Reading timestamps is not supported on Windows")
+
+    def read_timestamps(path):
+        gen = imageio_ffmpeg.read_frames(path, timestamps=True)
+        gen.__next__()  # == meta
+        return [(frame[0], round(pts, 3)) for frame, pts, _ in gen]
+
+    # Variable frame rate
+    gen = imageio_ffmpeg.write_frames(test_file2, (64, 64), timestamps=True)
+    gen.send(None)  # seed
+    for i, pts in enumerate([0, 0.1, 0.2, 1.0, 3.0]):
+        gen.send((bytes([i * 50] * 64 * 64 * 3), pts))
+    gen.close()
+    assert [pts for _, pts in read_timestamps(test_file2)] == [0, 0.1, 0.2, 1, 3]
+
+    with raises(ValueError):
+        gen = imageio_ffmpeg.write_frames(test_file2, (64, 64), timestamps=True)
+        gen.send(None)  # seed
+        gen.send((bytes(64 * 64 * 3), -1))
+
+    # Frames that don't change are not sent
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        gen = imageio_ffmpeg.write_frames(
+            test_file2, (64, 64), fps=10, skip_duplicates=True
+        )
+        gen.send(None)  # seed
+        for i in range(30):
+            gen.send(bytes([min(i, 5) * 40] * 64 * 64 * 3))
+        gen.close()
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+    assert collected[0].nframes == 7  # 6 distinct, plus one to mark the end
+
+    items = read_timestamps(test_file2)
+    assert [pts for _, pts in items] == [0, 0.1, 0.2, 0.3, 0.4, 0.5, 2.9]
+    assert abs(items[-1][0] - 200) < 5
+
+    # Only raw formats that can be put in a Matroska stream
+    with raises(ValueError):
+        gen = imageio_ffmpeg.write_frames(
+            test_file2, (64, 64), pix_fmt_in="ya8", skip_duplicates=True
+        )
+        gen.send(None)  # seed
+
+
+@no_warnings_allowed
+def test_process_stats():
+    collected = []
+    imageio_ffmpeg.add_stats_callback(collected.append)
+    try:
+        gen = imageio_ffmpeg.write_frames(test_file2, (64, 64))
+        gen.send(None)  # seed
+        for i in range(9):
+            gen.send(bytes([min(255, 100 + i * 10)] * 64 * 64 * 3))
+        gen.close()
+
+        gen = imageio_ffmpeg.read_frames(test_file2)
+        gen.__next__()  # == meta
+        for frame in gen:
+            pass
+
+        imageio_ffmpeg.count_frames_and_secs(test_file2)
+    finally:
+        imageio_ffmpeg.remove_stats_callback(collected.append)
+
+    assert [stats.kind for stats in collected] == ["write", "read", "count"]
+    for stats in collected:
+        assert stats.returncode == 0
+        assert stats.nframes == 9
+        assert stats.wall_time > 0
+        assert stats.cmd[0] == imageio_ffmpeg.get_ffmpeg_exe()
+        if hasattr(os, "wait4"):
+            assert stats.user_time + stats.system_time > 0
+            assert stats.max_rss > 2**20
+    assert collected[0].bytes_piped == 9 * 64 * 64 * 3
+    assert collected[1].bytes_piped == 9 * 64 * 64 * 3
+
+    # Removed callbacks are no longer called
+    imageio_ffmpeg.count_frames_and_secs(test_file2)
+    assert len(collected) == 3
+
+
+@no_warnings_allowed
+def test_hooks():
+    events = []
+
+    def make_hook(name):
+        return lambda stats, *args: events.append((name, stats, args))
+
+    hooks = {name: make_hook(name) for name in imageio_ffmpeg._hooks._hooks}
+    for name, hook in hooks.items():
+        imageio_ffmpeg.add_hook(name, hook)
+    try:
+        gen = imageio_ffmpeg.write_frames(test_file2, (64, 64))
+        gen.send(None)  # seed
+        for i in range(3):
+            gen.send(bytes([min(255, 100 + i * 10)] * 64 * 64 * 3))
+        gen.close()
+
+        gen = imageio_ffmpeg.read_frames(test_file1)
+        meta = gen.__next__()
+        gen.__next__()
+        gen.close()
+
+        gen = imageio_ffmpeg.read_frames(test_file2, bpp=13)
+        gen.__next__()  # == meta
+        with raises(RuntimeError):
+            for frame in gen:
+                pass
+    finally:
+        for name, hook in hooks.items():
+            imageio_ffmpeg.remove_hook(name, hook)
+
+    names = [e[0] for e in events]
+    assert names[:5] == ["spawn", "frame", "frame", "frame", "terminate"]
+    assert names[5:9] == ["spawn", "header", "frame", "terminate"]
+    assert events[7][2][0] == 1280 * 720 * 3
+    assert names[9:11] == ["spawn", "header"]
+    assert names[-2:] == ["error", "terminate"]
+
+    write_stats = events[0][1]
+    assert write_stats.kind == "write" and write_stats.cmd[-1] == test_file2
+    assert events[1][2][0] == 64 * 64 * 3 and events[1][2][1] >= 0
+    assert events[4][1] is write_stats and write_stats.stop_policy == "wait"
+    assert events[6][2] == (meta,)
+    assert events[8][1].stop_policy == "timeout"
+    assert isinstance(events[-2][2][0], RuntimeError)
+
+    with raises(ValueError):
+        imageio_ffmpeg.add_hook("not_an_event", print)
+
+
+@no_warnings_allowed
+def test_tracing():
+    imageio_ffmpeg.start_tracing()
+    try:
+        gen = imageio_ffmpeg.read_frames(test_file1)
+        gen.__next__()  # == meta
+        for i in range(3):
+            gen.__next__()
+        gen.close()
+        imageio_ffmpeg.count_frames_and_secs(test_file3)
+    finally:
+        imageio_ffmpeg.stop_tracing()
+
+    # Not recorded anymore
+    imageio_ffmpeg.count_frames_and_secs(test_file3)
+
+    filename = os.path.join(test_dir, "trace.json")
+    imageio_ffmpeg.save_trace(filename)
+    with open(filename, "rb") as f:
+        events = json.load(f)["traceEvents"]
+
+    names = [e["name"] for e in events]
+    assert names.count("thread_name") == 2
+    assert names.count("spawn") == 2
+    assert names.count("header") == 1
+    assert names.count("read frame") == 3
+    assert names.count("ffmpeg read") == 1
+    assert names.count("ffmpeg count") == 1
+    assert names.count("stop") == 1
+    for e in events:
+        assert e["ph"] in "MXi"
+        if e["ph"] == "X":
+            assert e["dur"] >= 0
+
+    # The ring buffer is bounded
+    imageio_ffmpeg.start_tracing(max_events=4)
+    imageio_ffmpeg.stop_tracing()
+    assert imageio_ffmpeg.get_trace_events() == []
+
+
 def test_get_compiled_h264_encoders():
     available_encoders = get_compiled_h264_encoders()
     # Assert it is not a mutable type
@@ -453,7 +1411,25 @@ if __name__ == "__main__":
     test_reading3()
     test_reading4()
     test_reading_invalid_video()
+    test_reading_from_data()
+    test_reading_from_data_requiring_seeking()
+    test_reading_scales()
+    test_read_audio()
+    test_read_frames_with_audio()
+    test_read_timestamps()
+    test_read_clips()
+    test_read_windows()
+    test_cache_frames()
+    test_lru_frame_cache()
+    test_rawvideo()
+    test_copy_frames()
+    test_trim_concat_remux()
+    test_transcode()
+    test_autotune_encoder()
     test_write1()
+    test_write_to_sink()
+    test_write_to_failing_sink()
+    test_write_renditions()
     test_write_pix_fmt_in()
     test_write_pix_fmt_out()
     test_write_wmv()
@@ -462,3 +1438,8 @@ if __name__ == "__main__":
     test_write_macro_block_size()
     test_write_big_frames()
     test_write_audio_path()
+    test_write_audio_samples()
+    test_write_timestamps()
+    test_process_stats()
+    test_hooks()
+    test_tracing()
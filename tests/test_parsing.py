@@ -3,7 +3,14 @@
 Tests specific to parsing ffmpeg header.
 """
 
-from imageio_ffmpeg._parsing import cvsecs, limit_lines, parse_ffmpeg_header
+from imageio_ffmpeg._parsing import (
+    cvsecs,
+    limit_lines,
+    parse_channels,
+    parse_ffmpeg_audio_header,
+    parse_ffmpeg_header,
+    parse_ffmpeg_inputs,
+)
 
 
 def dedent(text, dedent=8):
@@ -204,6 +211,67 @@ def test_comma_in_pixel_format():
     assert info["pix_fmt"] == "yuv420p(tv, progressive)"
 
 
+def test_parse_channels():
+    assert parse_channels("mono") == 1
+    assert parse_channels(" stereo") == 2
+    assert parse_channels("5.1(side)") == 6
+    assert parse_channels("7.1") == 8
+    assert parse_channels("3 channels") == 3
+    assert parse_channels("foo") is None
+
+
+def test_audio_header():
+    sample = dedent(
+        """
+        ffmpeg version 7.0.2-static https://johnvansickle.com/ffmpeg/  Copyright (c) 2000-2024 the FFmpeg developers
+          built with gcc 8 (Debian 8.3.0-6)
+        Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'av.mp4':
+          Duration: 00:00:02.02, start: 0.000000, bitrate: 160 kb/s
+          Stream #0:0[0x1](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, stereo, fltp, 129 kb/s (default)
+        Stream mapping:
+          Stream #0:0 -> #0:0 (aac (native) -> pcm_f32le (native))
+        Output #0, f32le, to 'pipe:':
+          Stream #0:0(und): Audio: pcm_f32le, 16000 Hz, mono, flt, 512 kb/s (default)
+    """
+    )
+    info = parse_ffmpeg_audio_header(sample)
+    assert info["codec"] == "aac"
+    assert info["sample_rate"] == 16000
+    assert info["channels"] == 1
+    assert info["duration"] == 2.02
+
+
+def test_parse_inputs():
+    sample = dedent(
+        """
+        Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'file:c0.mp4':
+          Duration: 00:00:00.30, start: 0.000000, bitrate: 68 kb/s
+          Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(progressive), 64x48 [SAR 1:1 DAR 4:3], 44 kb/s, 10 fps, 10 tbr, 10240 tbn (default)
+        Input #1, wav, from 'file:sound.wav':
+          Duration: 00:00:01.00, bitrate: 705 kb/s
+          Stream #1:0: Audio: pcm_s16le ([1][0][0][0] / 0x0001), 44100 Hz, mono, s16, 705 kb/s
+        Input #2, mov,mp4,m4a,3gp,3g2,mj2, from 'file:c1.mp4':
+          Duration: 00:00:01.50, start: 0.000000, bitrate: 362 kb/s
+          Stream #2:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(tv, progressive), 320x240 [SAR 1:1 DAR 4:3], 277 kb/s, 24 fps, 24 tbr, 12288 tbn (default)
+          Stream #2:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, mono, fltp, 70 kb/s (default)
+        [in#3 @ 0x1d2dd140] Error opening input: Invalid data found when processing input
+        Error opening input file file:bad.mp4.
+    """
+    )
+    infos = parse_ffmpeg_inputs(sample)
+    assert len(infos) == 3
+    assert infos[0] == {
+        "codec": "h264",
+        "pix_fmt": "yuv420p(progressive)",
+        "fps": 10,
+        "size": (64, 48),
+        "duration": 0.3,
+    }
+    assert infos[1] is None
+    assert infos[2]["pix_fmt"] == "yuv420p(tv, progressive)"
+    assert infos[2]["size"] == (320, 240) and infos[2]["duration"] == 1.5
+
+
 if __name__ == "__main__":
     test_cvsecs()
     test_limit_lines()
@@ -211,3 +279,6 @@ if __name__ == "__main__":
     test_get_correct_fps2()
     test_get_correct_rotation()
     test_comma_in_pixel_format()
+    test_parse_channels()
+    test_audio_header()
+    test_parse_inputs()
@@ -2,14 +2,25 @@
 """
 
 import gc
+import itertools
+import multiprocessing
+import os
+import pickle
 import sys
 import queue
 import threading
 
-from testutils import ensure_test_files, test_file1
+from testutils import (
+    ensure_test_files,
+    get_ffmpeg_pids,
+    test_dir,
+    test_file1,
+    test_file3,
+)
 import pytest
 
 import imageio_ffmpeg
+from imageio_ffmpeg._scheduler import acquire_process_slot, acquire_process_slots
 
 
 IS_PYPY = "__pypy__" in sys.builtin_module_names
@@ -49,6 +60,222 @@ def test_threading():
         q.get(timeout=20)
 
 
+def test_process_limit():
+    if IS_PYPY:
+        pytest.xfail("These threads hang on pypy for some reason.")
+
+    num_threads = 6
+    pids0 = get_ffmpeg_pids()
+    max_running = 0
+
+    imageio_ffmpeg.set_process_limit(2)
+    try:
+        q = queue.Queue()
+        threads = []
+        for i in range(num_threads):
+            t = threading.Thread(target=make_iterator, args=(q, 1))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        for i in range(num_threads):
+            max_running = max(max_running, len(get_ffmpeg_pids() - pids0))
+            q.get(timeout=20)
+        for t in threads:
+            t.join(timeout=20)
+    finally:
+        imageio_ffmpeg.set_process_limit(None)
+
+    assert 1 <= max_running <= 2
+
+
+def test_process_slots():
+    imageio_ffmpeg.set_process_limit(2, threads=3, cpu_affinity=True)
+    try:
+        slot1 = acquire_process_slot()
+        slot2 = acquire_process_slot()
+        assert {slot1.index, slot2.index} == {0, 1}
+        assert slot1.thread_params([]) == ["-threads", "3"]
+        assert slot1.thread_params(["-threads", "1"]) == []
+        if sys.platform.startswith("linux"):
+            assert slot1.cpus and slot2.cpus
+
+        # A third slot must wait until one is released
+        result = []
+        t = threading.Thread(target=lambda: result.append(acquire_process_slot()))
+        t.start()
+        t.join(0.2)
+        assert not result
+        slot1.release()
+        slot1.release()  # releasing twice is harmless
+        t.join(5)
+        assert result and result[0].index == 0
+        result[0].release()
+        slot2.release()
+    finally:
+        imageio_ffmpeg.set_process_limit(None)
+
+    # Without a limit, slots are free
+    slot = acquire_process_slot()
+    assert slot.index is None and slot.thread_params([]) == []
+    slot.release()
+
+
+def test_copy_frames_process_limit():
+    filename = os.path.join(test_dir, "copied.mp4")
+    result = []
+
+    def copy():
+        try:
+            result.append(imageio_ffmpeg.copy_frames(test_file3, filename)["nframes"])
+        except Exception as err:
+            result.append(err)
+
+    # With a limit of 1, the two processes can never run, so this must not block
+    imageio_ffmpeg.set_process_limit(1)
+    try:
+        t = threading.Thread(target=copy, daemon=True)
+        t.start()
+        t.join(10)
+        assert result and isinstance(result[0], ValueError)
+        with pytest.raises(ValueError):
+            acquire_process_slots(2)
+    finally:
+        imageio_ffmpeg.set_process_limit(None)
+
+    # With a limit of 2, both slots are obtained at once, and released after
+    imageio_ffmpeg.set_process_limit(2)
+    try:
+        result.clear()
+        t = threading.Thread(target=copy, daemon=True)
+        t.start()
+        t.join(30)
+        assert result == [36]
+        slots = acquire_process_slots(2)
+        assert sorted(slot.index for slot in slots) == [0, 1]
+        for slot in slots:
+            slot.release()
+    finally:
+        imageio_ffmpeg.set_process_limit(None)
+
+
+def test_clip_sampler():
+    # A video in which each frame has the value of its index * 6
+    filename = os.path.join(test_dir, "ramp.mp4")
+    gen = imageio_ffmpeg.write_frames(filename, (64, 64), pix_fmt_in="gray", fps=10)
+    gen.send(None)  # seed
+    for i in range(40):
+        gen.send(bytes([i * 6] * 64 * 64))
+    gen.close()
+
+    def get_values(clip):
+        return [round(clip[i * 32 * 32] / 6) for i in range(4)]
+
+    with imageio_ffmpeg.ClipSampler(
+        [filename, filename + ".nope"], 4, (32, 32), stride=3, pix_fmt="gray"
+    ) as sampler:
+        assert sampler.shape == (4, 32, 32, 1)
+        assert sampler.metas[1] is None
+
+        # Seek, take every 3rd frame, and pad when the file ends
+        assert get_values(sampler.read_clip(0, 1.0)) == [10, 13, 16, 19]
+        assert get_values(sampler.read_clip(0, 3.5)) == [35, 38, 38, 38]
+
+        # Clips are drawn at random, and fit in the video
+        items = list(itertools.islice(sampler, 10))
+        for index, start, clip in items:
+            assert index == 0 and 0 <= start <= 3
+            assert len(clip) == 4 * 32 * 32
+            assert abs(get_values(clip)[0] - start * 10) < 1
+
+    # Seeding makes it reproducible, regardless of the number of workers
+    results = []
+    for workers in (1, 3):
+        with imageio_ffmpeg.ClipSampler(
+            [filename], 4, (32, 32), workers=workers, seed=42
+        ) as sampler:
+            results.append(list(itertools.islice(sampler, 6)))
+    assert results[0] == results[1]
+
+    with pytest.raises(IOError):
+        imageio_ffmpeg.ClipSampler([filename + ".nope"], 4, (32, 32))
+
+
+def get_shared_value(handle):
+    with handle as frame:
+        return handle.index, frame[0, 0, 0]
+
+
+def test_shared_frame_reader():
+    filename = os.path.join(test_dir, "ramp.avi")
+    gen = imageio_ffmpeg.write_frames(
+        filename, (16, 16), pix_fmt_in="gray", pix_fmt_out="gray", codec="rawvideo"
+    )
+    gen.send(None)  # seed
+    for i in range(20):
+        gen.send(bytes([i * 10] * 16 * 16))
+    gen.close()
+
+    # Frames are read into a few slots, and consumed in other processes
+    ctx = multiprocessing.get_context("spawn")
+    with imageio_ffmpeg.SharedFrameReader(
+        filename, 4, pix_fmt="gray", bits_per_pixel=8
+    ) as reader:
+        assert reader.shape == (16, 16, 1)
+        with ctx.Pool(2) as pool:
+            results = list(pool.imap(get_shared_value, reader))
+    assert results == [(i, i * 10) for i in range(20)]
+
+    # Slots are reused once released, in the order in which they're released
+    with imageio_ffmpeg.SharedFrameReader(
+        filename, 2, pix_fmt="gray", bits_per_pixel=8
+    ) as reader:
+        handles = [reader.next_frame(), reader.next_frame()]
+        assert [h.slot for h in handles] == [0, 1]
+        handles[1].release()
+        handles[1].release()  # releasing twice is harmless
+        handle = reader.next_frame()
+        assert (handle.index, handle.slot) == (2, 1)
+        assert get_shared_value(handle) == (2, 20)  # this releases it
+        handle = reader.next_frame()
+        assert (handle.index, handle.slot) == (3, 1)
+
+        # When all slots are in use, the reader waits for a release
+        result = []
+        t = threading.Thread(target=lambda: result.append(reader.next_frame()))
+        t.start()
+        t.join(0.2)
+        assert not result
+        handles[0].release()
+        t.join(5)
+        assert (result[0].index, result[0].slot) == (4, 0)
+        assert get_shared_value(result[0]) == (4, 40)
+
+    # The mapping of a closed reader is dropped, when accessing another one
+    assert handle.name not in imageio_ffmpeg._shm._attached
+    with imageio_ffmpeg.SharedFrameReader(
+        filename, 2, pix_fmt="gray", bits_per_pixel=8
+    ) as reader:
+        handle = reader.next_frame()
+        with handle as frame:
+            assert frame[0, 0, 0] == 0
+            del frame
+        assert handle.name in imageio_ffmpeg._shm._attached
+        handle.close()
+        assert handle.name not in imageio_ffmpeg._shm._attached
+        pickled = pickle.dumps(reader.next_frame())
+
+    # Releasing a frame after the reader is closed has no effect
+    handle = pickle.loads(pickled)
+    handle.release()
+    assert handle.name not in imageio_ffmpeg._shm._attached
+
+
 if __name__ == "__main__":
     setup_module()
     test_threading()
+    test_process_limit()
+    test_process_slots()
+    test_copy_frames_process_limit()
+    test_clip_sampler()
+    test_shared_frame_reader()